@@ -11,7 +11,7 @@ from scatterertoarnold.widgets.scatterers import scattererWidget, scattererItemW
 from scatterertoarnold.widgets.geometry import geometryWidget, geometryItemWidget
 from scatterertoarnold.widgets.arnoldsettings import arnoldSettingsWidget
 from scatterertoarnold.lib import libclarisse
-from scatterertoarnold.core import clarisse_exporter, ass_generator, box_parser
+from scatterertoarnold.core import clarisse_exporter, ass_generator, box_parser, camera_parser, export_journal, export_manifest, export_server, export_shards, groupings, instance_cache, instance_culling, instance_table, mask_parser, scan_cache, selection_expression, spatial_hash
 from scatterertoarnold.configs import config
 from scatterertoarnold.widgets.selection import selectionBoxWidget
 reload(scattererToArnoldWidget)
@@ -32,6 +32,19 @@ reload(exportWindow)
 reload(arnoldSettingsWidget)
 reload(selectionBoxWidget)
 reload(box_parser)
+reload(camera_parser)
+reload(export_journal)
+reload(export_manifest)
+reload(export_server)
+reload(export_shards)
+reload(groupings)
+reload(instance_cache)
+reload(instance_culling)
+reload(instance_table)
+reload(mask_parser)
+reload(scan_cache)
+reload(selection_expression)
+reload(spatial_hash)
 scatterertoarnold.launch()
 
 """
@@ -19,21 +19,125 @@ import logging
 ATTR_ASS_FILE = 'Ass_File_Representation'
 ATTR_ASSET_CODE = 'Asset_Code_Representation'
 
+# Level of details. Each LOD's .ass file is used from its distance to the lod_reference and beyond
+ATTR_ASS_FILE_LOD = 'Ass_File_Representation_LOD{}'
+ATTR_LOD_DISTANCE = 'Ass_File_LOD{}_Distance'
+MAX_LOD_LEVELS = 3
+
+# Labels of the grouping strategies, see core/groupings.py. Registered strategies are added
 GROUPINGS = {
     'all': 'All under one file',
     'scatterer':  'One file per scatterer',
-    'asset': 'One file per asset'
+    'asset': 'One file per asset',
+    'asset_code': 'One file per asset code',
+    'context': 'One file per context'
 }
 
 SELECTION_TYPES = {
     'no_selection': 'No Selection',
     'inclusive': 'Inclusive Selection',
-    'exclusive': 'Exclusive Selection'
+    'exclusive': 'Exclusive Selection',
+    'expression': 'Expression Selection',
+    'frustum': 'Camera Frustum Selection',
+    'image_mask': 'Image Mask Selection',
+    'distance': 'Distance Selection'
+}
+
+CULLING_MODES = {
+    'none': 'No Culling',
+    'duplicates': 'Remove duplicated instances',
+    'overlaps': 'Thin overlapping instances'
+}
+
+THINNING_METHODS = {
+    'hash': 'Keep a fraction of the instances, from their ID',
+    'poisson': 'Keep instances further apart than a radius'
 }
 
 # Default export values
 DEFAULT_GROUPING = 'all'
 DEFAULT_SELECTION_TYPE = 'no_selection'
+DEFAULT_CULLING = 'none'
+DEFAULT_DUPLICATE_TOLERANCE = 0.001 # Distance under which two instances of a geometry are duplicates
+DEFAULT_OVERLAP_TOLERANCE = 0.5 # Factor of the summed bounding radii under which two instances of a geometry overlap
+DEFAULT_MIN_INSTANCE_SIZE = 0.0 # World space bounding radius under which instances are culled. 0 to disable
+DEFAULT_MIN_SCREEN_SIZE = 0.0 # Projected diameter in pixels under which instances are culled. 0 to disable
+DEFAULT_THINNING_METHOD = 'hash'
+DEFAULT_THINNING_FRACTION = 1.0 # Fraction of instances kept by the 'hash' thinning. 1 to disable
+DEFAULT_THINNING_RADIUS = 0.0 # Minimum distance between instances kept by the 'poisson' thinning. 0 to disable
+PREVIEW_FILE_TOKEN = 'preview'
+
+# Motion blur. Instances are sampled between the current frame + motion_start and + motion_end
+DEFAULT_MOTION_SAMPLES = 1 # Matrices written per moving instance. 1 to disable
+DEFAULT_MOTION_START = -0.25
+DEFAULT_MOTION_END = 0.25
+MOTION_STATIC_TOLERANCE = 1e-6 # Largest matrix difference between the samples of a static instance, written with one matrix
+
+# Sequence exports. Static instances are written once to '_static' files, animated ones to '.{frame}' files
+STATIC_FILE_TOKEN = 'static'
+FRAME_PADDING = 4
+
+# Camera frustum selection
+ATTR_CAMERA_FOV = 'field_of_view'
+ATTR_CAMERA_NEAR = 'near_clipping_plane'
+ATTR_CAMERA_FAR = 'far_clipping_plane'
+DEFAULT_CAMERA_FOV = 54.43
+DEFAULT_CAMERA_NEAR = 0.1
+DEFAULT_CAMERA_FAR = 1e7
+DEFAULT_FRUSTUM_PADDING = 0.1
+DEFAULT_FRUSTUM_ASPECT_RATIO = 16 / 9
+
+# Image mask selection
+MASK_MODES = {
+    'threshold': 'Keep points above the threshold',
+    'random': 'Keep points with a probability of the mask value'
+}
+DEFAULT_MASK_MODE = 'threshold'
+DEFAULT_MASK_PLANE = 'xz'
+DEFAULT_MASK_THRESHOLD = 0.5
+DEFAULT_MASK_SEED = 0
+
+# Distance selection
+DISTANCE_MODES = {
+    'far': 'Keep points further than the distance',
+    'near': 'Keep points within the distance'
+}
+DEFAULT_DISTANCE_MODE = 'far'
+DEFAULT_SELECTION_DISTANCE = 10.0
+
+# Scan cache, stored next to the project
+SCAN_CACHE_DIR_NAME = '.scatterertoarnold_cache'
+FINGERPRINT_MATRIX_SAMPLES = 64 # Instance matrices hashed in each scatterer's fingerprint
+
+# Export manifest, stored next to the exported files
+MANIFEST_FILE_SUFFIX = '.manifest.json'
+MANIFEST_VERSION = 1
+TEMP_FILE_SUFFIX = '.tmp' # Added to the exported file paths while they are written
+FINALIZE_WORKERS = 8 # Threads moving the completed files in place
+MAX_OPEN_FILES = 256 # Export files kept open at once, the least recently written one is closed to open another
+DEFAULT_BUFFER_BUDGET = 64 * 1024 * 1024 # Bytes buffered by all the export files before the largest buffers are written
+BUFFER_FLUSH_TARGET = 0.5 # Fraction of the buffer budget left buffered once the largest buffers are written
+
+# Checkpoint journal, stored next to the exported files
+JOURNAL_FILE_SUFFIX = '.journal.json'
+JOURNAL_VERSION = 1
+CHECKPOINT_CHUNK_SIZE = 50000 # Instances written between two checkpoints
+INSTANCE_BATCH_SIZE = 50000 # Instances per batch of ScattererToAss.iter_instance_batches
+
+# Sharded exports, run by batch processes and merged. Commands are formatted with {project}, {script}, {job} and {shard}
+SHARD_DIR_SUFFIX = '.shards'
+SHARD_JOB_VERSION = 2
+DEFAULT_SHARD_SIZE = 250000 # Instances of a scatterer exported by one shard
+LOCAL_SHARD_WORKERS = 4 # Shards run at once by a local sharded export
+SHARD_COMMAND = ['cnode', '{project}', '-script', '{script}', '-args', 'run', '{job}', '{shard}']
+MERGE_COMMAND = ['cnode', '{project}', '-script', '{script}', '-args', 'merge', '{job}']
+
+# Export server, running export jobs for local clients
+SERVER_HOST = '127.0.0.1'
+SERVER_PORT = 8765
+SERVER_MAX_CONCURRENT_JOBS = 1 # Exports run at once. Jobs of one project share the scene and its caches
+SERVER_JOB_RETENTION = 100 # Finished jobs kept, with their events
+DEFAULT_TABLE_CACHE_SIZE = 16 # Extracted scatterer tables kept in memory between jobs
 
 
 # ______________________________________________________________________________________________________________________
@@ -13,9 +13,10 @@
 import os
 import sys
 import logging
+import hashlib
 from datetime import datetime
 from collections import OrderedDict
-import time
+from contextlib import contextmanager
 
 # Third-Party Imports
 import ix
@@ -28,6 +29,7 @@ from scatterertoarnold.configs import config
 # ATTRIBUTES
 
 NODE_BUFFER_MAX_LENGTH = 2500
+COPY_BUFFER_SIZE = 1024 * 1024 # Characters read at once when appending another file
 
 HEADER = OrderedDict({
     'exported': datetime.now().strftime('%a %b %d %H:%M:%S %Y'),
@@ -83,29 +85,137 @@ ASS_NODE_TYPES = OrderedDict({
 # ______________________________________________________________________________________________________________________
 # Generator
 
+class WriterPool():
+    """Pool shared by the AssFileGenerators of an export, bounding their open files and buffered bytes.
+    At most max_handles files are kept open, the least recently written one is closed to open another. 
+    Once the bytes buffered by all the files reach the buffer_budget, the largest buffers are written until
+    BUFFER_FLUSH_TARGET of the budget is left. The buffers are written by the thread adding the nodes, 
+    so the extraction waits for the writes to catch up before adding more nodes"""
+
+    def __init__(self, max_handles=config.MAX_OPEN_FILES, buffer_budget=config.DEFAULT_BUFFER_BUDGET):
+        """Constructor.
+
+        Args:
+            max_handles (int): Maximum number of files kept open
+            buffer_budget (int): Maximum number of bytes buffered by all the files
+
+        """
+        super(WriterPool, self).__init__()
+        self.max_handles = max_handles
+        self.buffer_budget = buffer_budget
+        self.buffered_bytes = 0
+        self.peak_buffered_bytes = 0
+        self._handles = OrderedDict() # key: write path, value: open file, least recently used first
+        self._buffered_files = OrderedDict() # key: AssFileGenerator holding buffered nodes, value: None
+
+    def get_handle(self, path):
+        """Returns the open file of a path, opened to append to it
+
+        Args:
+            path (str): Path of the file
+
+        Returns:
+            file: Open file
+
+        """
+        if path in self._handles:
+            self._handles.move_to_end(path)
+            return self._handles[path]
+
+        while len(self._handles) >= max(self.max_handles, 1):
+            _, handle = self._handles.popitem(last=False)
+            handle.close()
+
+        self._handles[path] = open(path, 'a')
+        return self._handles[path]
+
+    def close(self, path):
+        """Closes the file of a path, if open"""
+        handle = self._handles.pop(path, None)
+        if handle is not None:
+            handle.close()
+
+    def close_all(self):
+        """Closes every open file"""
+        for handle in self._handles.values():
+            handle.close()
+        self._handles = OrderedDict()
+
+    def add_buffered(self, ass_file, size):
+        """Records a node added to a file's buffer, and writes the largest buffers once the budget is reached
+
+        Args:
+            ass_file (AssFileGenerator): File buffering the node
+            size (int): Size of the node, in bytes
+
+        """
+        self.buffered_bytes += size
+        self.peak_buffered_bytes = max(self.peak_buffered_bytes, self.buffered_bytes)
+        self._buffered_files[ass_file] = None
+        if self.buffered_bytes >= self.buffer_budget:
+            self.flush(target=int(self.buffer_budget * config.BUFFER_FLUSH_TARGET))
+
+    def remove_buffered(self, ass_file, size):
+        """Records a file's buffer written to disk
+
+        Args:
+            ass_file (AssFileGenerator): File whose buffer was written
+            size (int): Size of the buffer, in bytes
+
+        """
+        self.buffered_bytes -= size
+        self._buffered_files.pop(ass_file, None)
+
+    def flush(self, target=0):
+        """Writes the largest buffers first, until the bytes left buffered are under the target
+
+        Args:
+            target (int): Bytes left buffered. 0 to write every buffer
+
+        """
+        for ass_file in sorted(self._buffered_files, key=lambda f: f.buffer_size, reverse=True):
+            if self.buffered_bytes <= target:
+                break
+            ass_file.save_buffer_to_file()
+
+
 class AssFileGenerator():
     """Class to generate an .ass file"""
 
-    def __init__(self, file_path, *args, **kwargs):
+    def __init__(self, file_path, temp_path=None, resume_offset=None, fragment=False, pool=None, *args, **kwargs):
         """Constructor.
         One instance of this class will represent one ass file.
         We will store a copy of the ASS_NODE_TYPES in the class, and allow updating it with default values.
         
         Args:
             file_path (str): File path to save
+            temp_path (str): If set, the content is written to this path instead, to be moved to file_path later
+            resume_offset (int): If set, the existing file is kept up to this byte offset and written after, 
+                instead of being started over. See resume_file
+            fragment (bool): If set, the file only holds nodes, without headers nor options, to be appended to another file
+            pool (WriterPool): If set, the file's handle and buffer are managed by the pool, shared with other files
             **kwargs: key: ASS_NODE_TYPES keys, value: new default value
 
         """
         super(AssFileGenerator, self).__init__()
         self.file_path = file_path
+        self.temp_path = temp_path
+        self.pool = pool
+        self._content_hash = hashlib.md5()
         
         self.ASS_NODE_TYPES = ASS_NODE_TYPES.copy()
         self._update_default_node_values(**kwargs)
         
         self._node_buffer = []
-        self.init_file()
-        self.save_headers_to_file()
-        self.save_options_to_file()
+        self.buffer_size = 0 # Bytes in the node_buffer
+        if resume_offset is not None:
+            self.resume_file(resume_offset)
+        elif fragment:
+            self.init_file()
+        else:
+            self.init_file()
+            self.save_headers_to_file()
+            self.save_options_to_file()
 
     def _update_default_node_values(self, **kwargs):
         """
@@ -119,32 +229,85 @@ class AssFileGenerator():
             if key in self.ASS_NODE_TYPES:
                 self.ASS_NODE_TYPES[key].update(kwargs.get(key))
 
+    @property
+    def write_path(self) -> str:
+        """Returns the path the content is written to"""
+        return self.temp_path or self.file_path
+
+    def get_content_hash(self) -> str:
+        """Returns the hash of the content written so far. The export time header is not hashed, so two exports
+        with the same content have the same hash
+        
+        Returns:
+            str: md5 hex digest
+            
+        """
+        return self._content_hash.hexdigest()
+
+    @contextmanager
+    def _open(self):
+        """Opens the file to append to it. With a pool, the file is kept open for the next writes"""
+        if self.pool is None:
+            with open(self.write_path, 'a') as f:
+                yield f
+        else:
+            f = self.pool.get_handle(self.write_path)
+            yield f
+            # The size on disk must match the content written, ie: for checkpoints
+            f.flush()
+
+    def close(self):
+        """Closes the file's handle kept open by the pool"""
+        if self.pool is not None:
+            self.pool.close(self.write_path)
+
+    def _write(self, f, content, hashed=True):
+        """Writes content to the opened file, and adds it to the content hash"""
+        f.write(content)
+        if hashed:
+            self._content_hash.update(content.encode('utf-8'))
+
     def init_file(self):
         """Simply create the file on disk"""
         # Create the directory if needed
-        dir_path = os.path.dirname(self.file_path)
+        dir_path = os.path.dirname(self.write_path)
         if not os.path.exists(dir_path):
             os.makedirs(dir_path, exist_ok=True)
 
         # Create the file
-        open(self.file_path, 'w')
+        open(self.write_path, 'w')
+
+    def resume_file(self, offset):
+        """Resumes an interrupted file: the content written after the offset is removed, 
+        and the content kept is hashed again
+        
+        Args:
+            offset (int): Size of the file to keep, in bytes. Must be the end of a flushed buffer
+            
+        """
+        with open(self.write_path, 'rb+') as f:
+            f.truncate(offset)
+
+        with open(self.write_path, 'r') as f:
+            for line in f:
+                # Same as the original writes, the export time header is not hashed
+                if not line.startswith('### exported: '):
+                    self._content_hash.update(line.encode('utf-8'))
 
     def save_headers_to_file(self):
         """Saves the headers to the file"""
-        with open(self.file_path, 'a') as f:
+        with self._open() as f:
             for key, value in HEADER.items():
-                f.write(f'### {key}: {value}\n')
-
-            f.write('\n\n\n')
+                self._write(f, f'### {key}: {value}\n', hashed=key != 'exported')
 
-        time.sleep(0.1)
+            self._write(f, '\n\n\n')
 
     def save_options_to_file(self):
         """Saves the options to the file"""
-        with open(self.file_path, 'a') as f:
+        with self._open() as f:
             for node in ['options', 'gaussian_filter', 'driver_exr', 'color_manager_syncolor']:
-                f.write(f'{node}\n')
-                f.write('{\n')
+                self._write(f, f'{node}\n')
+                self._write(f, '{\n')
                 for key, value in self.ASS_NODE_TYPES.get(node).items():
                     # Add Quotes to empty values and to any values with spaces
                     if value == '':
@@ -152,10 +315,8 @@ class AssFileGenerator():
                     if ' ' in value:
                         value = f'"{value}"'
 
-                    f.write(f' {key} {value}\n')
-                f.write('}\n\n')
-
-        time.sleep(0.1)
+                    self._write(f, f' {key} {value}\n')
+                self._write(f, '}\n\n')
 
     def add_node(self, node_type, value):
         """Adds a node to the node_buffer to be written to file
@@ -164,6 +325,19 @@ class AssFileGenerator():
             node_type (str): Node type to add (from ASS_NODE_TYPES)
             value (dict): Value to update the defaults with, to be written to file
             
+        """
+        self.add_node_str(self.format_node(node_type=node_type, value=value))
+
+    def format_node(self, node_type, value):
+        """Formats a node to its .ass string
+        
+        Args:
+            node_type (str): Node type to format (from ASS_NODE_TYPES)
+            value (dict): Value to update the defaults with
+            
+        Returns:
+            str: Node string
+            
         """
         node_str = str(node_type) + '\n'
         node_str += '{\n'
@@ -174,7 +348,20 @@ class AssFileGenerator():
             node_str += f' {k} {v}\n'
 
         node_str += '}\n\n'
+        return node_str
+
+    def add_node_str(self, node_str):
+        """Adds an already formatted node to the node_buffer to be written to file. 
+        Lets one node be formatted once and written to multiple files.
+        
+        Args:
+            node_str (str): Node string, from ``format_node``
+            
+        """
         self._node_buffer.append(node_str)
+        self.buffer_size += len(node_str)
+        if self.pool is not None:
+            self.pool.add_buffered(self, len(node_str))
 
         if len(self._node_buffer) >= NODE_BUFFER_MAX_LENGTH:
             self.save_buffer_to_file()
@@ -184,14 +371,45 @@ class AssFileGenerator():
         Saves the buffer to file, and empties it. 
         We need a buffer because some .ass files can be larger than memory
         """
-        with open(self.file_path, 'a') as f:
+        if not self._node_buffer:
+            return
+
+        with self._open() as f:
             for node in self._node_buffer:
-                f.write(node)
+                self._write(f, node)
 
+        if self.pool is not None:
+            self.pool.remove_buffered(self, self.buffer_size)
         self._node_buffer = []
+        self.buffer_size = 0
+
+    def append_file(self, path):
+        """Appends the content of another file, ie: a fragment written by another process
+        
+        Args:
+            path (str): Path of the file to append
+            
+        """
+        self.save_buffer_to_file()
+        with open(path, 'r') as source, self._open() as f:
+            for chunk in iter(lambda: source.read(COPY_BUFFER_SIZE), ''):
+                self._write(f, chunk)
 
     def on_export_complete(self):
         """Called when the export has completed"""
         self.save_buffer_to_file()
+        self.close()
+
+    def finalize(self):
+        """Moves the completed temp file in place, at once. Readers see either the previous file or the new one"""
+        self.close()
+        if self.temp_path is not None and os.path.exists(self.temp_path):
+            os.replace(self.temp_path, self.file_path)
+
+    def discard(self):
+        """Removes the temp file, leaving the previous file untouched"""
+        self.close()
+        if self.temp_path is not None and os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
 
 # ______________________________________________________________________________________________________________________
@@ -26,6 +26,7 @@ def get_default_box_definition() -> dict:
         
     """
     box_definition = {
+        'name': '', # Full name of the box
         'geometry': None, # Geometry object
         'bounding_box': ix.api.GMathBbox3d(), # The bounding box of the cube. Used for preliminary searches
         'vector_origin_point': np.array([]), # (x, y, z) Point
@@ -126,6 +127,7 @@ def get_box_definition(box) -> dict:
     }
 
     # Set everything to the definition
+    box_def['name'] = box.get_full_name()
     box_def['geometry'] = box.get_module()
     box_def['bounding_box'] = bounding_box
     box_def['center_point'] = center
@@ -155,6 +157,53 @@ def is_point_in_any_box(point, boxes) -> bool:
             
     return False
 
+def get_points_in_any_box_mask(points, boxes) -> np.ndarray:
+    """
+    Vectorized version of ``is_point_in_any_box``, testing a batch of points at once
+
+    Args:
+        points (np.ndarray): (N, 3) Points to test
+        boxes (list): List of box_definition dicts
+
+    Returns:
+        np.ndarray: (N,) Boolean mask, True for points in any box
+
+    """
+    mask = np.zeros(len(points), dtype=bool)
+    for box in boxes:
+        mask |= get_points_in_box_mask(points, box)
+
+    return mask
+
+def get_points_in_box_mask(points, box) -> np.ndarray:
+    """
+    Vectorized version of ``_is_point_in_box``, testing a batch of points at once.
+    Points are first tested against the bounding box, only the remaining candidates are tested against the cuboid.
+
+    Args:
+        points (np.ndarray): (N, 3) Points to test
+        box (dict): Box Definition
+
+    Returns:
+        np.ndarray: (N,) Boolean mask, True for points in the box
+
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+    bb = box.get('bounding_box')
+    bb_min = np.array([bb[0][0], bb[0][1], bb[0][2]])
+    bb_max = np.array([bb[1][0], bb[1][1], bb[1][2]])
+    mask = np.all((points > bb_min) & (points < bb_max), axis=1)
+
+    # Offset the candidates to the box's coord system
+    offset_points = points[mask] - box.get('vector_origin_point')
+    in_box = np.ones(len(offset_points), dtype=bool)
+    for vector in box.get('vectors_from_origin').values():
+        dot = offset_points @ vector
+        in_box &= (0 < dot) & (dot < np.dot(vector, vector))
+
+    mask[mask] = in_box
+    return mask
+
 def _is_point_in_bounding_box(point, box) -> bool:
     """
     Checks if the given point is in the given bounding box
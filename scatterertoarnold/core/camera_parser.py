@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+"""
+    Name:           camera_parser.py
+    Description:    Parser functions for camera frustums
+
+"""
+# System Imports
+import os
+import sys
+import logging
+
+# Third-Party Imports
+import numpy as np
+
+# Local Imports
+from scatterertoarnold.lib import libclarisse
+from scatterertoarnold.configs import config
+
+# ______________________________________________________________________________________________________________________
+
+def get_default_camera_definition() -> dict:
+    """Returns the default camera definition dict
+
+    Returns:
+        dict: Default camera definition
+
+    """
+    camera_definition = {
+        'camera': None, # Camera object
+        'frame': None, # Frame at which the camera was evaluated
+        'position': np.array([]), # (x, y, z) Point
+        'tan_half_fov': np.array([]), # (horizontal, vertical) Tangents of the half field of view
+        'planes': np.array([]), # (6, 4) World space frustum planes (a, b, c, d), normals pointing inside
+    }
+    return camera_definition
+
+def get_camera_definitions(camera, frame_range=None, padding=0.0, aspect_ratio=config.DEFAULT_FRUSTUM_ASPECT_RATIO) -> list:
+    """Calculates the camera's frustum definition for each frame of the given range.
+    The scene is set back to its current frame afterwards.
+
+    Args:
+        camera: Camera object
+        frame_range (tuple): (first, last) Frames to evaluate. If not set, only the current frame is evaluated
+        padding (float): Factor by which to widen the field of view. ie: 0.1 adds 10% on each side
+        aspect_ratio (float): Width / Height ratio of the rendered image
+
+    Returns:
+        list: camera definition dicts
+
+    """
+    if not frame_range:
+        return [get_camera_definition(camera, padding=padding, aspect_ratio=aspect_ratio)]
+
+    current_frame = libclarisse.get_current_frame()
+    camera_definitions = []
+    first, last = frame_range
+    try:
+        for frame in range(int(first), int(last) + 1):
+            libclarisse.set_current_frame(frame)
+            camera_definition = get_camera_definition(camera, padding=padding, aspect_ratio=aspect_ratio)
+            camera_definition['frame'] = frame
+            camera_definitions.append(camera_definition)
+    finally:
+        libclarisse.set_current_frame(current_frame)
+
+    return camera_definitions
+
+def get_camera_definition(camera, padding=0.0, aspect_ratio=config.DEFAULT_FRUSTUM_ASPECT_RATIO) -> dict:
+    """Calculates the camera's frustum definition at the current frame.
+
+    The camera looks down its local -Z axis. Its frustum planes are built in camera space, then brought to world space
+    with the inverse transpose of the camera's global matrix.
+
+    Args:
+        camera: Camera object
+        padding (float): Factor by which to widen the field of view. ie: 0.1 adds 10% on each side
+        aspect_ratio (float): Width / Height ratio of the rendered image
+
+    Returns:
+        dict: camera definition with values
+
+    """
+    camera_def = get_default_camera_definition()
+
+    fov = libclarisse.get_double_attribute(camera, config.ATTR_CAMERA_FOV, default=config.DEFAULT_CAMERA_FOV)
+    near = libclarisse.get_double_attribute(camera, config.ATTR_CAMERA_NEAR, default=config.DEFAULT_CAMERA_NEAR)
+    far = libclarisse.get_double_attribute(camera, config.ATTR_CAMERA_FAR, default=config.DEFAULT_CAMERA_FAR)
+
+    # The field of view is horizontal, the vertical one is derived from the image's aspect ratio
+    tan_h = np.tan(np.radians(fov) / 2) * (1 + padding)
+    tan_v = np.tan(np.radians(fov) / 2) / aspect_ratio * (1 + padding)
+
+    # Camera space planes (a, b, c, d), a point is inside if a*x + b*y + c*z + d >= 0
+    planes = np.array([
+        [1, 0, -tan_h, 0], # Left
+        [-1, 0, -tan_h, 0], # Right
+        [0, 1, -tan_v, 0], # Bottom
+        [0, -1, -tan_v, 0], # Top
+        [0, 0, -1, -near], # Near
+        [0, 0, 1, far], # Far
+    ], dtype=np.float64)
+
+    # Bring the planes to world space. The clarisse matrix transforms column vectors
+    matrix = libclarisse.get_matrix_array(camera.get_module().get_global_matrix())
+    planes = planes @ np.linalg.inv(matrix)
+
+    # Normalize the planes so that the plane test returns world space distances
+    planes /= np.linalg.norm(planes[:, :3], axis=1)[:, np.newaxis]
+
+    camera_def['camera'] = camera
+    camera_def['frame'] = libclarisse.get_current_frame()
+    camera_def['position'] = matrix[:3, 3]
+    camera_def['tan_half_fov'] = np.array([tan_h, tan_v])
+    camera_def['planes'] = planes
+    return camera_def
+
+def get_projected_sizes(points, radii, camera, resolution) -> np.ndarray:
+    """
+    Returns the approximate size on screen of spheres seen by the camera, from their distance to the camera
+
+    Args:
+        points (np.ndarray): (N, 3) Centers of the spheres
+        radii (np.ndarray): (N,) Radii of the spheres
+        camera (dict): Camera definition
+        resolution (int): Horizontal resolution of the image
+
+    Returns:
+        np.ndarray: (N,) Diameter of each sphere, in pixels
+
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+    distances = np.maximum(np.linalg.norm(points - camera.get('position'), axis=1), 1e-9)
+    frame_widths = 2 * distances * camera.get('tan_half_fov')[0]
+    return 2 * np.asarray(radii) / frame_widths * resolution
+
+def get_points_in_any_frustum_mask(points, cameras, radii=0.0) -> np.ndarray:
+    """
+    Checks which points are in any of the given frustums
+
+    Args:
+        points (np.ndarray): (N, 3) Points to test
+        cameras (list): List of camera_definition dicts
+        radii (float|np.ndarray): (N,) Radius by which each point is inflated
+
+    Returns:
+        np.ndarray: (N,) Boolean mask, True for points in any frustum
+
+    """
+    mask = np.zeros(len(points), dtype=bool)
+    for camera in cameras:
+        mask |= get_points_in_frustum_mask(points, camera, radii=radii)
+
+    return mask
+
+def get_points_in_frustum_mask(points, camera, radii=0.0) -> np.ndarray:
+    """
+    Checks which points are in the given frustum. A point is inside if its distance to every plane is above -radius
+
+    Args:
+        points (np.ndarray): (N, 3) Points to test
+        camera (dict): Camera definition
+        radii (float|np.ndarray): (N,) Radius by which each point is inflated
+
+    Returns:
+        np.ndarray: (N,) Boolean mask, True for points in the frustum
+
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+    planes = camera.get('planes')
+    distances = points @ planes[:, :3].T + planes[:, 3]
+    return np.all(distances >= -np.reshape(radii, (-1, 1)), axis=1)
+
+# ______________________________________________________________________________________________________________________
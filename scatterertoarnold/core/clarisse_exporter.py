@@ -11,18 +11,25 @@ import logging
 import threading
 import time
 import hashlib
+from concurrent.futures import ThreadPoolExecutor
 
 # Third-Party Imports
 import ix
+import numpy as np
 from PySide2.QtCore import QObject, Signal
 
 # Local Imports
+from scatterertoarnold import pkginfo
 from scatterertoarnold.lib import libclarisse
-from scatterertoarnold.core import ass_generator, box_parser
+from scatterertoarnold.core import ass_generator, box_parser, camera_parser, instance_table, mask_parser, selection_expression
+from scatterertoarnold.core import export_journal, export_manifest, groupings, instance_culling, scan_cache, spatial_hash
 from scatterertoarnold.configs import config
 
 # ______________________________________________________________________________________________________________________
 
+# One line per matrix row, each value normalized
+MATRIX_STR_FORMAT = ('\n ' + '{:f} ' * 4) * 4
+
 class ScattererToAss(QObject):
     """Main class to export scatterers to an Arnold .ass file"""
 
@@ -30,13 +37,36 @@ class ScattererToAss(QObject):
     pre_validation_started = Signal()
     pre_validation_finished = Signal(list, list)
     export_progress = Signal(int, int)
+    export_summary = Signal(list)
     export_finished = Signal(bool)
     def __init__(self, 
                  scatterers: list=[],
                  geometries: list=[],
                  grouping: str=config.DEFAULT_GROUPING,
+                 extra_groupings: dict={},
                  selection_type: str=config.DEFAULT_SELECTION_TYPE,
                  selection_boxes: list=[],
+                 selection_sets: dict={},
+                 selection_expression: str='',
+                 selection_cameras: list=[],
+                 frustum_frame_range: tuple=None,
+                 frustum_padding: float=config.DEFAULT_FRUSTUM_PADDING,
+                 frustum_use_bounding_radius: bool=True,
+                 selection_mask_path: str='',
+                 selection_mask_extent: tuple=None,
+                 selection_reference_objects: list=[],
+                 selection_distance: float=config.DEFAULT_SELECTION_DISTANCE,
+                 lod_reference=None,
+                 culling: str=config.DEFAULT_CULLING,
+                 min_instance_size: float=config.DEFAULT_MIN_INSTANCE_SIZE,
+                 thinning_fraction: float=config.DEFAULT_THINNING_FRACTION,
+                 write_preview: bool=False,
+                 motion_samples: int=config.DEFAULT_MOTION_SAMPLES,
+                 frame_range: tuple=None,
+                 use_scan_cache: bool=False,
+                 incremental: bool=False,
+                 skip_identical: bool=False,
+                 checkpoint: bool=False,
                  export_dir: str='',
                  export_file_name: str='',
                  request_user_input_on_warning: bool=False
@@ -48,8 +78,30 @@ class ScattererToAss(QObject):
             scatterers (list): List of SceneObjectScatterers to export
             geometries (list): List of geometries to export
             grouping (str): Grouping method. See grouping attribute
+            extra_groupings (dict): Additional groupings written in the same pass. See extra_groupings attribute
             selection_type (str): Selection method. See selection_type attribute
             selection_boxes (list): List of objects to represent the selected points
+            selection_sets (dict): Named lists of objects, to be combined by the selection_expression
+            selection_expression (str): Boolean expression of selection sets. See selection_expression attribute
+            selection_cameras (list): List of cameras used by the 'frustum' selection_type
+            frustum_frame_range (tuple): (first, last) Frames at which to evaluate the cameras. Current frame if not set
+            frustum_padding (float): Factor by which to widen the cameras' field of view
+            frustum_use_bounding_radius (bool): If set, instances are inflated by their asset's bounding radius
+            selection_mask_path (str): Grayscale image or .npy file used by the 'image_mask' selection_type
+            selection_mask_extent (tuple): (min_u, min_v, max_u, max_v) World space area covered by the mask
+            selection_reference_objects (list): Geometries or scatterers used by the 'distance' selection_type
+            selection_distance (float): Distance to the reference objects used by the 'distance' selection_type
+            lod_reference: Camera object or (x, y, z) point from which LOD distances are measured. See lod_reference attribute
+            culling (str): Culling method of redundant instances. See culling attribute
+            min_instance_size (float): World space bounding radius under which instances are culled. 0 to disable
+            thinning_fraction (float): Fraction of instances kept by the 'hash' thinning. See thinning_method attribute
+            write_preview (bool): If set, the thinned instances are written to preview files next to the full export
+            motion_samples (int): Matrices written per moving instance, for motion blur. See motion_samples attribute
+            frame_range (tuple): (first, last) If set, the frames are exported as a sequence. See _export_sequence
+            use_scan_cache (bool): If set, instances are read from the project's scan cache when the scene did not change
+            incremental (bool): If set, files whose inputs did not change since the last export are not written again
+            skip_identical (bool): If set, exported files are only replaced if their content changed
+            checkpoint (bool): If set, the progress is journaled, and an interrupted export is resumed by the next one
             export_dir (str): Path to the export directory
             export_file_name (str): Base name for the exports
 
@@ -62,16 +114,70 @@ class ScattererToAss(QObject):
         self.grouping = grouping
         self.selection_type = selection_type
         self.selection_boxes = selection_boxes
+        self.selection_sets = selection_sets
+        self.selection_expression = selection_expression
+        self.selection_cameras = selection_cameras
+        self.frustum_frame_range = frustum_frame_range
+        self.frustum_padding = frustum_padding
+        self.frustum_use_bounding_radius = frustum_use_bounding_radius
+        self.frustum_aspect_ratio = config.DEFAULT_FRUSTUM_ASPECT_RATIO
+        self.selection_mask_path = selection_mask_path
+        self.selection_mask_extent = selection_mask_extent
+        self.selection_mask_plane = config.DEFAULT_MASK_PLANE
+        self.selection_mask_mode = config.DEFAULT_MASK_MODE
+        self.selection_mask_threshold = config.DEFAULT_MASK_THRESHOLD
+        self.selection_mask_seed = config.DEFAULT_MASK_SEED
+        self.selection_mask_invert = False
+        self.selection_reference_objects = selection_reference_objects
+        self.selection_distance = selection_distance
+        self.selection_distance_mode = config.DEFAULT_DISTANCE_MODE
+        self.lod_reference = lod_reference
+        self.culling = culling
+        self.duplicate_tolerance = config.DEFAULT_DUPLICATE_TOLERANCE
+        self.overlap_tolerance = config.DEFAULT_OVERLAP_TOLERANCE
+        self.min_instance_size = min_instance_size
+        self.min_screen_size = config.DEFAULT_MIN_SCREEN_SIZE # Pixels, used with the size_camera
+        self.size_camera = None
+        self.thinning_method = config.DEFAULT_THINNING_METHOD
+        self.thinning_fraction = thinning_fraction
+        self.thinning_radius = config.DEFAULT_THINNING_RADIUS # Used by the 'poisson' thinning_method
+        self.write_preview = write_preview
+        self.motion_samples = motion_samples
+        self.motion_start = config.DEFAULT_MOTION_START # Frames from the current frame, used with motion_samples
+        self.motion_end = config.DEFAULT_MOTION_END
+        self.frame_range = frame_range
+        self.use_scan_cache = use_scan_cache
+        self.incremental = incremental
+        self.skip_identical = skip_identical
+        self.checkpoint = checkpoint
+        self.buffer_budget = config.DEFAULT_BUFFER_BUDGET # Bytes buffered by all the export files
         self.export_dir = export_dir
         self.export_file_name = export_file_name
+        self.extra_groupings = extra_groupings
+        self.table_cache = None # Shared TableCache of the extracted instances, ie: between the jobs of an export server
 
         self.box_definitions = [] # Used by the exporter
+        self.selection_set_definitions = {} # Used by the exporter
+        self.camera_definitions = [] # Used by the exporter
+        self.lod_reference_point = None # Used by the exporter
+        self.mask_definition = None # Used by the exporter
+        self.reference_hash = None # Used by the exporter
+        self.size_camera_definition = None # Used by the exporter
+        self.culled_instances = {} # key: culling reason, value: dict of culled instances count per geometry name
+        self.skipped_files = [] # Files left untouched by an incremental export
+        self.identical_files = [] # Files left untouched, as their new content was identical
+        self.resumed_from = None # (scatterers, instances) already written by the interrupted export resumed
+        self.peak_buffered_bytes = 0 # Most bytes buffered at once by the export files
+        self.sequence_counts = None # (static, animated) instances written by the last sequence export
+        self.grouping_cache = None # Values of the groupings computed once per export, see groupings.py. None outside exports
+        self.fingerprint_cache = None # Full fingerprint of each scatterer per frame, computed once per export. None outside exports
 
         self.ASS_NODE_TYPES = {}
 
         self.request_user_input_on_warning = request_user_input_on_warning
 
         self._export_thread = None
+        self._staged_files = [] # Files written by the running export, moved in place once all are complete
         self._cancel_event = None
         self._warning_event = None
 
@@ -117,17 +223,35 @@ class ScattererToAss(QObject):
     def grouping(self, grouping: str):
         """Set the grouping method. It will group points in different .ass files depending on the method chosen.
 
-        See config.py for values
+        See groupings.py for values, and to register new ones
 
         Args:
             grouping (str): Grouping method
             
         """
-        valid_methods = list(config.GROUPINGS.keys())
-        if not grouping in valid_methods:
-            raise ValueError('Invalid grouping method. Provided: {}. Valid: {}'.format(grouping, str(valid_methods)))
+        groupings.get_grouping(grouping)
         self._grouping = grouping
 
+    @property
+    def extra_groupings(self) -> dict:
+        """Returns the additional groupings, and their export directory"""
+        return self._extra_groupings
+
+    @extra_groupings.setter
+    def extra_groupings(self, extra_groupings: dict):
+        """Set the additional groupings. Each one is written to its own directory, in the same pass as the grouping:
+        the scene is read and each instance is formatted once for all of them.
+
+        See groupings.py for values
+
+        Args:
+            extra_groupings (dict): key: grouping method, value: export directory
+            
+        """
+        for grouping in extra_groupings:
+            groupings.get_grouping(grouping)
+        self._extra_groupings = {grouping: os.path.normpath(export_dir) for grouping, export_dir in extra_groupings.items()}
+
     @property
     def selection_type(self) -> str:
         """Returns the current selection method"""
@@ -164,6 +288,167 @@ class ScattererToAss(QObject):
         """
         self._selection_boxes = selection_boxes
 
+    @property
+    def selection_sets(self) -> dict:
+        """Returns the current selection sets"""
+        return self._selection_sets
+
+    @selection_sets.setter
+    def selection_sets(self, selection_sets: dict):
+        """Set the named selection sets. These will get combined by the ``selection_expression``.
+        Each selection box is also available as a set of its own, using the box's name.
+
+        Args:
+            selection_sets (dict): key: set name, value: list of cube objects (Ideally GeometryPolybox)
+            
+        """
+        self._selection_sets = selection_sets
+
+    @property
+    def selection_expression(self) -> str:
+        """Returns the current selection expression"""
+        return self._selection_expression
+
+    @selection_expression.setter
+    def selection_expression(self, selection_expression: str):
+        """Set the selection expression, used by the 'expression' selection_type.
+        Sets are combined with python's set operators: ``|``, ``&``, ``-``, ``^`` and ``~``.
+        ie: ``(forest_A | forest_B) - road_clearing``
+
+        See selection_expression.py for the syntax
+
+        Args:
+            selection_expression (str): Boolean expression of selection set names
+            
+        """
+        self._selection_expression = selection_expression
+
+    @property
+    def selection_cameras(self) -> list:
+        """Returns the current selection cameras"""
+        return self._selection_cameras
+
+    @selection_cameras.setter
+    def selection_cameras(self, selection_cameras: list):
+        """Set the selection cameras, used by the 'frustum' selection_type.
+        Instances outside of every camera's frustum will be culled.
+
+        Args:
+            selection_cameras (list): List of camera objects (Ideally CameraPerspective)
+            
+        """
+        self._selection_cameras = selection_cameras
+
+    @property
+    def selection_mask_mode(self) -> str:
+        """Returns the current selection mask mode"""
+        return self._selection_mask_mode
+
+    @selection_mask_mode.setter
+    def selection_mask_mode(self, selection_mask_mode: str):
+        """Set how the 'image_mask' selection_type interprets the mask values.
+        With 'threshold', points with a value at or above ``selection_mask_threshold`` are kept.
+        With 'random', points are kept with a probability of their value, using ``selection_mask_seed``.
+        ``selection_mask_invert`` drops these points instead.
+
+        See config.py for values
+
+        Args:
+            selection_mask_mode (str): Mask mode
+            
+        """
+        valid_modes = list(config.MASK_MODES.keys())
+        if not selection_mask_mode in valid_modes:
+            raise ValueError('Invalid selection mask mode. Provided: {}. Valid: {}'.format(selection_mask_mode, str(valid_modes)))
+        self._selection_mask_mode = selection_mask_mode
+
+    @property
+    def selection_distance_mode(self) -> str:
+        """Returns the current selection distance mode"""
+        return self._selection_distance_mode
+
+    @selection_distance_mode.setter
+    def selection_distance_mode(self, selection_distance_mode: str):
+        """Set how the 'distance' selection_type interprets the distance to the ``selection_reference_objects``.
+        With 'far', points within ``selection_distance`` of any reference point are dropped.
+        With 'near', only these points are kept.
+
+        See config.py for values
+
+        Args:
+            selection_distance_mode (str): Distance mode
+            
+        """
+        valid_modes = list(config.DISTANCE_MODES.keys())
+        if not selection_distance_mode in valid_modes:
+            raise ValueError('Invalid selection distance mode. Provided: {}. Valid: {}'.format(selection_distance_mode, str(valid_modes)))
+        self._selection_distance_mode = selection_distance_mode
+
+    @property
+    def lod_reference(self):
+        """Returns the current LOD reference"""
+        return self._lod_reference
+
+    @lod_reference.setter
+    def lod_reference(self, lod_reference):
+        """Set the LOD reference. If set, each instance uses the .ass file of the level of detail matching its 
+        distance to this reference. Levels are set on the geometries with the ``Ass_File_Representation_LOD{n}`` and 
+        ``Ass_File_LOD{n}_Distance`` attributes. Instances closer than the first LOD use ``Ass_File_Representation``.
+
+        See config.py for values
+
+        Args:
+            lod_reference: Camera object, (x, y, z) point, or None to disable the LODs
+            
+        """
+        self._lod_reference = lod_reference
+
+    @property
+    def culling(self) -> str:
+        """Returns the current culling method"""
+        return self._culling
+
+    @culling.setter
+    def culling(self, culling: str):
+        """Set the culling method of redundant instances, applied per scatterer after the selection.
+        'duplicates' removes instances of a geometry closer than ``duplicate_tolerance`` to another one.
+        'overlaps' thins instances of a geometry whose bounding spheres overlap, scaled by ``overlap_tolerance``.
+
+        See config.py for values
+
+        Args:
+            culling (str): Culling method
+            
+        """
+        valid_methods = list(config.CULLING_MODES.keys())
+        if not culling in valid_methods:
+            raise ValueError('Invalid culling method. Provided: {}. Valid: {}'.format(culling, str(valid_methods)))
+        self._culling = culling
+
+    @property
+    def thinning_method(self) -> str:
+        """Returns the current thinning method"""
+        return self._thinning_method
+
+    @thinning_method.setter
+    def thinning_method(self, thinning_method: str):
+        """Set the thinning method, applied per scatterer after the culling.
+        'hash' keeps a ``thinning_fraction`` of the instances, from the hash of their ID. The same instances are kept on every run.
+        'poisson' keeps instances further apart than ``thinning_radius``, in the order given by the hash of their ID.
+
+        If ``write_preview`` is set, the full export is kept and the thinned instances are also written to preview files.
+
+        See config.py for values
+
+        Args:
+            thinning_method (str): Thinning method
+            
+        """
+        valid_methods = list(config.THINNING_METHODS.keys())
+        if not thinning_method in valid_methods:
+            raise ValueError('Invalid thinning method. Provided: {}. Valid: {}'.format(thinning_method, str(valid_methods)))
+        self._thinning_method = thinning_method
+
     @property
     def export_dir(self) -> str:
         """Returns the current export directory"""
@@ -204,33 +489,128 @@ class ScattererToAss(QObject):
         """Returns a list of geometry objects from the scatterers"""
         return libclarisse.get_geometries_from_scatterers(self.scatterers)
     
-    def get_export_file_names(self):
-        """Returns a list of export filenames based on the chosen grouping"""
+    def get_selection_set_boxes(self):
+        """Returns every available selection set, including one set per selection box
+        
+        Returns:
+            dict: key: set name, value: list of cube objects
+            
+        """
+        set_boxes = {box.get_name(): [box] for box in self.selection_boxes}
+        set_boxes.update(self.selection_sets)
+        return set_boxes
+
+    def is_changing_frame(self):
+        """Returns if the export evaluates the scene at other frames than the current one: frame sequences, 
+        motion samples or cameras evaluated over a frame range"""
+        if self.frame_range or self.motion_samples > 1:
+            return True
+        return self.selection_type == 'frustum' and bool(self.frustum_frame_range)
+
+    def get_outputs(self):
+        """Returns the groupings written by the export, starting with the grouping, then the extra_groupings
+        
+        Returns:
+            list: (grouping, export directory) of each output
+            
+        """
+        return [(self.grouping, self.export_dir)] + list(self.extra_groupings.items())
+
+    def get_export_file_names(self, grouping=None):
+        """Returns a list of export filenames based on the chosen grouping
+        
+        Args:
+            grouping (str): Grouping method. Uses the grouping attribute if not set
+            
+        Returns:
+            list: File names
+            
+        """
         if not self.export_file_name:
             logging.warning('export_file_name not set')
             return []
         
-        file_names = []
-        if self.grouping == 'all':
-            # Simply return the configured export file name
-            file_names.append(self.export_file_name)
-
-        elif self.grouping == 'asset':
-            # Add the asset_code token to each file. This token is set to the geometry as a custom attribute by the tool.
-            # If you are not using the GUI, you must set the attribute ``Asset_Code_Representation`` as a string.
-            for geometry in self.geometries:
-                token = geometry.get_name()
-                _file_name = self.get_file_name_with_token(token=token)
-                file_names.append(_file_name)
-
-        elif self.grouping == 'scatterer':
-            # Add the scatterer's name to each file.
-            for scatterer in self.scatterers:
-                _file_name = self.get_file_name_with_token(token=scatterer.get_name())
-                file_names.append(_file_name)
-
+        # One file per key of the grouping, ie: the file name with the geometry's name added for the 'asset' grouping
+        strategy = groupings.get_grouping(grouping or self.grouping)
+        file_names = [strategy.get_file_name(self, key) for key in strategy.get_export_keys(self)]
         return file_names
+
+    def get_manifest_file_path(self, export_dir=None):
+        """Returns the path of the export's manifest, next to the exported files
+        
+        Args:
+            export_dir (str): Export directory of the manifest. Uses the export_dir attribute if not set
+            
+        Returns:
+            str: Manifest path
+            
+        """
+        base_name = os.path.splitext(self.export_file_name)[0]
+        return os.path.join(export_dir or self.export_dir, base_name + config.MANIFEST_FILE_SUFFIX)
+
+    def get_journal_file_path(self):
+        """Returns the path of the export's checkpoint journal, next to the exported files"""
+        base_name = os.path.splitext(self.export_file_name)[0]
+        return os.path.join(self.export_dir, base_name + config.JOURNAL_FILE_SUFFIX)
+
+    def get_preview_file_name(self, file_name):
+        """Returns the preview file name of an export file name
+        
+        Args:
+            file_name (str): Export file name
+            
+        Returns:
+            str: Preview file name
+        
+        """
+        base_name, ext = os.path.splitext(file_name)
+        return '{base_name}_{token}{ext}'.format(base_name=base_name, token=config.PREVIEW_FILE_TOKEN, ext=ext)
     
+    def get_sequence_frames(self):
+        """Returns the frames of the frame_range
+
+        Returns:
+            list: Frames (int). Empty if the frame_range is not set
+
+        """
+        if not self.frame_range:
+            return []
+        first, last = self.frame_range
+        return list(range(int(first), int(last) + 1))
+
+    def get_static_file_name(self, file_name):
+        """Returns the file name holding the static instances of an export file name, for sequence exports
+        
+        Args:
+            file_name (str): Export file name
+            
+        Returns:
+            str: Static file name
+        
+        """
+        base_name, ext = os.path.splitext(file_name)
+        return '{base_name}_{token}{ext}'.format(base_name=base_name, token=config.STATIC_FILE_TOKEN, ext=ext)
+
+    def get_frame_file_name(self, file_name, frame):
+        """Returns the file name holding the animated instances of an export file name at a frame, for sequence exports
+        
+        Args:
+            file_name (str): Export file name
+            frame (int): Frame
+            
+        Returns:
+            str: Frame file name, ie: name.0012.ass
+        
+        """
+        base_name, ext = os.path.splitext(file_name)
+        return '{base_name}.{frame:0{padding}d}{ext}'.format(base_name=base_name, frame=int(frame), padding=config.FRAME_PADDING, ext=ext)
+
+    def _get_preview_file_names(self, file_names):
+        """Returns the preview file name of each export file name, if write_preview is set"""
+        if not self.write_preview:
+            return {}
+        return {file_name: self.get_preview_file_name(file_name) for file_name in file_names}
+
     def get_file_name_with_token(self, token):
         """Returns a file name with the given token.
         The token can represent either a scatterer, an asset, or any string.
@@ -250,30 +630,6 @@ class ScattererToAss(QObject):
         file_name = '{base_name}_{token}{ext}'.format(base_name=base_name, token=token, ext=ext)
         return file_name
     
-    def get_export_file(self, export_files, geometry_name, scatterer_name):
-        """Returns the export file based on the current context
-        
-        Args:
-            export_files (list): List of export_files
-            geometry_name (str): Geometry name
-            scatterer_name (str): Scatterer name
-            
-        Returns:
-            AssFileGenerator: Export file
-
-        """
-        if self.grouping == 'all':
-            return export_files[0]
-
-        elif self.grouping == 'asset':
-            file_name = self.get_file_name_with_token(token=geometry_name)
-
-        elif self.grouping == 'scatterer':
-            file_name = self.get_file_name_with_token(token=scatterer_name)
-
-        export_file = [file for file in export_files if os.path.basename(file.file_path) == file_name][0]
-        return export_file
-
     # __________________________________________________________________________________________________________________
     # VALIDATION
 
@@ -289,7 +645,16 @@ class ScattererToAss(QObject):
         _warnings = []
 
         if not self._validate_selection():
-            _errors.append('An {} selection_type requires at least one selection_box'.format(self.selection_type))
+            if self.selection_type == 'frustum':
+                _errors.append('A frustum selection_type requires at least one selection_camera')
+            elif self.selection_type == 'image_mask':
+                _errors.append('An image_mask selection_type requires an existing selection_mask_path and a selection_mask_extent')
+            elif self.selection_type == 'distance':
+                _errors.append('A distance selection_type requires at least one selection_reference_object and a positive selection_distance')
+            else:
+                _errors.append('An {} selection_type requires at least one selection_box'.format(self.selection_type))
+        if not self._validate_selection_expression():
+            _errors.append('Invalid selection_expression: "{}"'.format(self.selection_expression))
 
         if not self._validate_export_dir():
             _warnings.append('Export directory does not exist, it will be created')
@@ -297,8 +662,26 @@ class ScattererToAss(QObject):
             _warnings.append('Export files already exists, they will be overwritten')
         if not self._validate_selection_boxes():
             _warnings.append('Chosen selection_type does not require any selection boxes, they will be ignored')
+        if not self._validate_outputs():
+            _errors.append('extra_groupings must not write the same files as another grouping')
         if not self._validate_ass_file_attr():
             _errors.append('Some geometries do not have the {} attribute set.'.format(config.ATTR_ASS_FILE))
+        if not self._validate_size_camera():
+            _errors.append('A min_screen_size requires a size_camera')
+        if not self._validate_thinning():
+            _errors.append('thinning_fraction must be between 0 and 1, and thinning_radius positive')
+        if not self._validate_motion():
+            _errors.append('motion_samples must be at least 1, and motion_start before motion_end')
+        if not self._validate_frame_range():
+            _errors.append('frame_range must be (first, last), first not after last')
+        if self.frame_range and (self.motion_samples > 1 or self.incremental or self.checkpoint):
+            _errors.append('frame_range does not support motion_samples, incremental nor checkpoint exports')
+        if self.buffer_budget <= 0:
+            _errors.append('buffer_budget must be positive')
+        if self.write_preview and not self._is_thinning():
+            _warnings.append('write_preview is set, but no thinning is set. Preview files will hold every instance')
+        if not self._validate_lod_attrs():
+            _warnings.append('lod_reference is set, but no geometry has LOD attributes set. LODs will be ignored')
 
         return _errors, _warnings
 
@@ -308,37 +691,118 @@ class ScattererToAss(QObject):
         if self.selection_type in ['inclusive', 'exclusive']:
             if len(self.selection_boxes) == 0:
                 valid = False
+        elif self.selection_type == 'expression':
+            if len(self.get_selection_set_boxes()) == 0:
+                valid = False
+        elif self.selection_type == 'frustum':
+            if len(self.selection_cameras) == 0:
+                valid = False
+        elif self.selection_type == 'distance':
+            if len(self.selection_reference_objects) == 0 or self.selection_distance <= 0:
+                valid = False
+        elif self.selection_type == 'image_mask':
+            if not os.path.isfile(self.selection_mask_path) or not self.selection_mask_extent:
+                valid = False
 
         return valid
+
+    def _validate_selection_expression(self):
+        """Returns if the selection expression is valid, and only uses known selection sets"""
+        if self.selection_type != 'expression':
+            return True
+
+        try:
+            tree = selection_expression.parse(self.selection_expression)
+        except ValueError as e:
+            logging.error(str(e))
+            return False
+
+        unknown_sets = selection_expression.get_set_names(tree) - set(self.get_selection_set_boxes().keys())
+        if unknown_sets:
+            logging.error('Unknown selection sets: {}'.format(', '.join(sorted(unknown_sets))))
+            return False
+
+        return True
     
     def _validate_selection_boxes(self):
         """Returns False if there's selectionboxes but no selection_type for them"""
-        return not (self.selection_type == 'no_selection' and len(self.selection_boxes) > 1)
+        return not (self.selection_type == 'no_selection' and len(self.selection_boxes) + len(self.selection_sets) > 1)
     
     def _validate_export_dir(self):
-        """Returns if the destination directory exists"""
-        return os.path.exists(self.export_dir)
+        """Returns if the destination directories exist"""
+        return all(os.path.exists(export_dir) for grouping, export_dir in self.get_outputs())
 
     def _validate_export_files(self):
         """Returns if any export file already exists"""
         exists = False
-        file_names = self.get_export_file_names()
-        for file_name in file_names:
-            file_path = os.path.join(self.export_dir, file_name)
+        for file_path in self._get_output_file_paths():
             if os.path.exists(file_path):
                 exists = True
 
         return exists
+
+    def _validate_outputs(self):
+        """Returns if each grouping writes its own files"""
+        file_paths = self._get_output_file_paths()
+        return len(file_paths) == len(set(file_paths))
+
+    def _get_output_file_paths(self):
+        """Returns the path of every file written by the outputs, including the preview files"""
+        file_paths = []
+        for grouping, export_dir in self.get_outputs():
+            file_names = self.get_export_file_names(grouping=grouping)
+            file_names += list(self._get_preview_file_names(file_names).values())
+            if self.frame_range:
+                frame_names = [self.get_frame_file_name(f, frame) for frame in self.get_sequence_frames() for f in file_names]
+                file_names = [self.get_static_file_name(f) for f in file_names] + frame_names
+            file_paths += [os.path.join(export_dir, file_name) for file_name in file_names]
+        return file_paths
     
     def _validate_ass_file_attr(self):
         """Returns if each geometries have the ass file attribute set"""
         for geometry in self.geometries:
-            attr = libclarisse.get_str_attribute(item=geometry, attr_name=config.ATTR_ASS_FILE)
+            attr = libclarisse.get_str_attribute(item=geometry, attr_name=config.ATTR_ASS_FILE, use_cache=True)
             if not attr:
                 return False
 
         return True
 
+    def _validate_size_camera(self):
+        """Returns False if there's a min_screen_size but no camera to project the instances with"""
+        return not (self.min_screen_size > 0 and self.size_camera is None)
+
+    def _validate_thinning(self):
+        """Returns if the thinning values are in range"""
+        return 0 <= self.thinning_fraction <= 1 and self.thinning_radius >= 0
+
+    def _validate_motion(self):
+        """Returns if the motion samples are in range"""
+        return self.motion_samples >= 1 and self.motion_start <= self.motion_end
+
+    def _validate_frame_range(self):
+        """Returns if the frame_range is valid, or not set"""
+        if not self.frame_range:
+            return True
+        return len(self.frame_range) == 2 and self.frame_range[0] <= self.frame_range[1]
+
+    def _is_thinning(self):
+        """Returns if the thinning_method removes any instance with the current values"""
+        if self.thinning_method == 'poisson':
+            return self.thinning_radius > 0
+        return self.thinning_fraction < 1
+
+    def _validate_shardable(self):
+        """Returns if the instances can be filtered one shard at a time. 
+        Culling and poisson thinning compare neighbouring instances, which may be in other shards"""
+        return self.culling == 'none' and not (self.thinning_method == 'poisson' and self._is_thinning())
+
+    def _validate_lod_attrs(self):
+        """Returns False if there's a lod_reference but no geometry with levels of details"""
+        if self.lod_reference is None:
+            return True
+
+        return any(libclarisse.get_geometry_lods(geometry) for geometry in self.geometries)
+
     def _validate_asset_code_attr(self):
         """
         NOTE: DEPRECATED
@@ -365,21 +829,126 @@ class ScattererToAss(QObject):
         if not self.request_user_input_on_warning:
             self._warning_event.set()
 
-        # Parse selection boxes
-        self.box_definitions = []
-        for box in self.selection_boxes:
-            box_definition = box_parser.get_box_definition(box)
-            self.box_definitions.append(box_definition)
+        self._prepare_export()
 
         # Start process
         self._export_thread = threading.Thread(target=self._export, args=(self._cancel_event, self._warning_event, ))
         self._export_thread.start()
 
+    def _prepare_export(self):
+        """Parses the selection objects and cameras once for the whole export"""
+        self.grouping_cache = {}
+        self.fingerprint_cache = {}
+
+        # Transforms, bounding boxes and attributes have no change stamp: they are read once per export, at each frame.
+        # ie: the LOD attributes can be edited by hand between exports
+        libclarisse.invalidate_scene_cache('matrix')
+        libclarisse.invalidate_scene_cache('bbox')
+        libclarisse.invalidate_scene_cache('attribute')
+        # The inventory stamp misses instances reassigned with the same counts: read them once per export too
+        libclarisse.invalidate_scene_cache('inventory')
+
+        # Parse selection boxes. Boxes shared between sets are only parsed once
+        _definitions = {}
+        def _get_box_definition(box):
+            if box.get_full_name() not in _definitions:
+                _definitions[box.get_full_name()] = box_parser.get_box_definition(box)
+            return _definitions[box.get_full_name()]
+
+        self.box_definitions = [_get_box_definition(box) for box in self.selection_boxes]
+        self.selection_set_definitions = {}
+        if self.selection_type == 'expression':
+            for set_name, boxes in self.get_selection_set_boxes().items():
+                self.selection_set_definitions[set_name] = [_get_box_definition(box) for box in boxes]
+
+        # Parse selection cameras, at each frame of the range
+        self.camera_definitions = []
+        if self.selection_type == 'frustum':
+            for camera in self.selection_cameras:
+                self.camera_definitions += camera_parser.get_camera_definitions(
+                    camera, 
+                    frame_range=self.frustum_frame_range,
+                    padding=self.frustum_padding,
+                    aspect_ratio=self.frustum_aspect_ratio
+                    )
+
+        # Load the mask once for the whole export
+        self.mask_definition = None
+        if self.selection_type == 'image_mask' and self._validate_selection():
+            self.mask_definition = mask_parser.get_mask_definition(
+                self.selection_mask_path, 
+                extent=self.selection_mask_extent, 
+                plane=self.selection_mask_plane
+                )
+
+        # Sample the reference objects once, and hash them for the distance queries
+        self.reference_hash = None
+        if self.selection_type == 'distance' and self._validate_selection():
+            reference_points = [self._get_reference_points(item) for item in self.selection_reference_objects]
+            self.reference_hash = spatial_hash.SpatialHash(np.concatenate(reference_points), cell_size=self.selection_distance)
+
+        # Get the camera used to compute the instances' size on screen
+        self.size_camera_definition = None
+        if self.min_screen_size > 0 and self.size_camera is not None:
+            self.size_camera_definition = camera_parser.get_camera_definition(self.size_camera, aspect_ratio=self.frustum_aspect_ratio)
+
+        # Get the LOD reference's location
+        self.lod_reference_point = None
+        if self.lod_reference is not None:
+            if isinstance(self.lod_reference, (tuple, list, np.ndarray)):
+                self.lod_reference_point = np.array(self.lod_reference, dtype=np.float64)
+            else:
+                self.lod_reference_point = camera_parser.get_camera_definition(self.lod_reference).get('position')
+
+    def wait(self, timeout=None):
+        """Blocks until the running export finished
+        
+        Args:
+            timeout (float): Maximum time to wait, in seconds
+            
+        """
+        if self._export_thread is not None:
+            self._export_thread.join(timeout)
+
     def abort_export(self):
         """Stops the export process"""
         if self._cancel_event:
             self._cancel_event.set()
 
+    def iter_instance_batches(self, batch_size=config.INSTANCE_BATCH_SIZE, grouping_names=None, cancel_event=None):
+        """Yields the filtered instances of the scatterers as NumPy batches, without writing any file. 
+        Runs in the calling thread, ie: to build USD point instancers or compute QC metrics.
+        Each scatterer is extracted and filtered once reached, so at most one scatterer's instances are held at once
+        
+        Usage:
+            for batch in exporter.iter_instance_batches(grouping_names=['asset']):
+                positions = batch.matrices[:, 3, :3]
+        
+        Args:
+            batch_size (int): Maximum number of instances in a batch
+            grouping_names (list): Names of the groupings whose keys are computed for each batch. 
+                Defaults to the groupings of get_outputs
+            cancel_event (threading.Event): Stops the iteration when set
+            
+        Yields:
+            InstanceBatch: Filtered instances, with their key in each grouping
+            
+        """
+        if batch_size < 1:
+            raise ValueError('Invalid batch size. Provided: {}. Valid: at least 1'.format(batch_size))
+        if grouping_names is None:
+            grouping_names = [grouping for grouping, export_dir in self.get_outputs()]
+        for name in grouping_names:
+            groupings.get_grouping(name)
+
+        self._prepare_export()
+        self.culled_instances = {}
+        try:
+            yield from self._iter_instance_batches(self.scatterers, batch_size=batch_size, grouping_names=grouping_names, cancel_event=cancel_event)
+        finally:
+            self.grouping_cache = None
+            self.fingerprint_cache = None
+
     def accept_warnings(self):
         """Accepts the warning logs"""
         if self._warning_event:
@@ -408,7 +977,26 @@ class ScattererToAss(QObject):
 
         if not cancel_event.is_set():
             # Start exporting
-            self._export_scatterers(cancel_event=cancel_event)
+            self.culled_instances = {}
+            self.skipped_files = []
+            self.identical_files = []
+            self.resumed_from = None
+            self.peak_buffered_bytes = 0
+            self.sequence_counts = None
+            try:
+                if self.frame_range:
+                    self._export_sequence(cancel_event=cancel_event)
+                else:
+                    self._export_scatterers(cancel_event=cancel_event)
+            finally:
+                # Remove the temp files of an aborted or failed export, the exported files are left untouched.
+                # With checkpoints, they are kept for the next export to resume from
+                if not self.checkpoint:
+                    self._discard_files(self._staged_files)
+                for ass_file in self._staged_files:
+                    ass_file.close()
+                self._staged_files = []
+            self.export_summary.emit(self.get_export_summary())
 
         if cancel_event.is_set():
             success = False
@@ -416,149 +1004,1003 @@ class ScattererToAss(QObject):
         # Finished/cancelled
         self.export_finished.emit(success)
         logging.info('Export completed')
+        self.grouping_cache = None
+        self.fingerprint_cache = None
         self._cancel_event = None
         self._warning_event = None
 
     def _export_scatterers(self, cancel_event):
-        """Exports the scatterers based on the configured attributes"""
-        # Let us declare some values
-        tr_vector3D = ix.api.GMathVec3d()
-        scale_vector3D = ix.api.GMathVec3d()
-        rot_vector3D = ix.api.GMathVec3d()
-        shear_vector3D  = ix.api.GMathVec3d()
-        rot_matrix4X4 = ix.api.GMathMatrix4x4d()
-
-        # First get the amount of points to parse based on the scatterers selected for the signals
+        """Exports the scatterers based on the configured attributes. 
+        Each instance is formatted once, and written to one file of each grouping from get_outputs"""
+        outputs = self.get_outputs()
+        output_file_names = [self.get_export_file_names(grouping=grouping) for grouping, export_dir in outputs]
+
+        # Skip the files whose inputs did not change since the last export, and the scatterers only found in them
+        scatterers = self.scatterers
+        manifests = {}
+        file_fingerprints = {}
+        if self.incremental or self.skip_identical:
+            manifests = {export_dir: export_manifest.ExportManifest(self.get_manifest_file_path(export_dir)) for grouping, export_dir in outputs}
+        if self.incremental or self.checkpoint:
+            for grouping, export_dir in outputs:
+                for file_name, fingerprint in self._get_file_fingerprints(grouping=grouping).items():
+                    file_fingerprints[os.path.join(export_dir, file_name)] = fingerprint
+        if self.incremental:
+            changed_scatterers = set()
+            for i, (grouping, export_dir) in enumerate(outputs):
+                file_names = output_file_names[i]
+                changed = [f for f in file_names if self._is_file_changed(manifests[export_dir], export_dir, f, file_fingerprints[os.path.join(export_dir, f)])]
+                self.skipped_files += [f for f in file_names if f not in changed]
+                output_file_names[i] = changed
+                for s in self.scatterers:
+                    if set(self._get_scatterer_file_names(s, grouping=grouping)) & set(changed):
+                        changed_scatterers.add(s.get_full_name())
+            scatterers = [s for s in self.scatterers if s.get_full_name() in changed_scatterers]
+
+        # Get the file paths of each output, and the preview file path of each export file
+        output_paths = [[os.path.join(export_dir, f) for f in file_names] for (grouping, export_dir), file_names in zip(outputs, output_file_names)]
+        preview_paths = {}
+        if self.write_preview:
+            for file_path in [file_path for file_paths in output_paths for file_path in file_paths]:
+                preview_paths[file_path] = os.path.join(os.path.dirname(file_path), self.get_preview_file_name(os.path.basename(file_path)))
+        all_paths = [file_path for file_paths in output_paths for file_path in file_paths] + list(preview_paths.values())
+
+        # Resume the files of an interrupted export with the same inputs
+        journal = None
+        offsets = {}
+        if self.checkpoint:
+            journal = self._get_journal(file_fingerprints, scatterers, all_paths)
+            if journal.offsets:
+                offsets = journal.offsets
+                self.resumed_from = (len(journal.completed), journal.current.get('instances', 0))
+                logging.info('Resuming export from checkpoint {}'.format(journal.file_path))
+
+        # Get Files. They share a pool bounding their open handles and buffers
+        pool = ass_generator.WriterPool(buffer_budget=self.buffer_budget)
+        files = {}
+        for file_path in all_paths:
+            files[file_path] = self._create_export_file(
+                os.path.basename(file_path), 
+                export_dir=os.path.dirname(file_path), 
+                resume_offset=offsets.get(file_path),
+                pool=pool
+                )
+        output_files = [(grouping, {os.path.basename(f): files[f] for f in file_paths}) for (grouping, export_dir), file_paths in zip(outputs, output_paths)]
+        preview_files = {file_path: files[preview_path] for file_path, preview_path in preview_paths.items()}
+        all_files = list(files.values())
+        self._staged_files = all_files
+            
+        # Skip the instances already written by the interrupted export
+        start_indices = None
+        if journal is not None:
+            start_indices = {s.get_full_name(): journal.get_resume_index(s.get_full_name()) for s in scatterers}
+
+        # Now write the filtered instances, one batch at a time, checkpointing the instances written so far
+        batches = self._iter_instance_batches(
+            scatterers,
+            batch_size=config.CHECKPOINT_CHUNK_SIZE,
+            grouping_names=[grouping for grouping, export_dir in outputs],
+            cancel_event=cancel_event,
+            progress_callback=self.export_progress.emit,
+            start_indices=start_indices
+            )
+        for batch in batches:
+            if not self._write_table(batch.scatterer, batch.table, output_files, preview_files, batch.preview_mask, cancel_event, instance_keys=batch.keys):
+                return False
+
+            if journal is not None:
+                if batch.is_last:
+                    self._checkpoint(journal, all_files, completed=batch.scatterer.get_full_name())
+                else:
+                    self._checkpoint(journal, all_files, current=(batch.scatterer.get_full_name(), batch.start + len(batch)))
+        if cancel_event.is_set():
+            return False
+
+        # Complete the export
+        for ass_file in all_files:
+            ass_file.on_export_complete()
+        self.peak_buffered_bytes = pool.peak_buffered_bytes
+        self._finalize_files(all_files, manifests=manifests)
+
+        # Record the inputs of the written files
+        if self.incremental:
+            for file_paths in output_paths:
+                for file_path in file_paths:
+                    manifests[os.path.dirname(file_path)].set(os.path.basename(file_path), fingerprint=file_fingerprints[file_path])
+        for manifest in manifests.values():
+            manifest.save()
+        if journal is not None:
+            journal.remove()
+
+        return True
+
+    def _export_sequence(self, cancel_event):
+        """Exports each frame of the frame_range. The scene is evaluated at every frame: the instances static over the 
+        frames are written once to the static files, and the animated ones to the files of each frame.
+        Instances are filtered, named and routed at the first frame"""
+        frames = self.get_sequence_frames()
+        outputs = self.get_outputs()
+        manifests = {}
+        if self.skip_identical:
+            manifests = {export_dir: export_manifest.ExportManifest(self.get_manifest_file_path(export_dir)) for grouping, export_dir in outputs}
+
+        # Get Files: the static files, then the files of each frame. They share a pool bounding their open handles and buffers
+        pool = ass_generator.WriterPool(buffer_budget=self.buffer_budget)
+        all_files = []
+        def _create_files(get_file_name):
+            output_files = []
+            preview_files = {}
+            for grouping, export_dir in outputs:
+                files_by_name = {}
+                for file_name in self.get_export_file_names(grouping=grouping):
+                    files_by_name[file_name] = self._create_export_file(get_file_name(file_name), export_dir=export_dir, pool=pool)
+                    if self.write_preview:
+                        preview_name = get_file_name(self.get_preview_file_name(file_name))
+                        preview_files[files_by_name[file_name].file_path] = self._create_export_file(preview_name, export_dir=export_dir, pool=pool)
+                output_files.append((grouping, files_by_name))
+                all_files.extend(files_by_name.values())
+            all_files.extend(preview_files.values())
+            return output_files, preview_files
+
+        static_files = _create_files(self.get_static_file_name)
+        frame_files = [_create_files(lambda file_name, frame=frame: self.get_frame_file_name(file_name, frame)) for frame in frames]
+        self._staged_files = all_files
+
         total_points = 0
         for _scatterer in self.scatterers:
-            scatterer = _scatterer.get_module()
-            instances_id = scatterer.get_instances()
-            total_points += scatterer.get_instance_count()
-
-        # Get Files
-        ass_files = []
-        file_names = self.get_export_file_names()
-        for file_name in file_names:
-            file_path = os.path.join(self.export_dir, file_name)
-            ass_file = ass_generator.AssFileGenerator(file_path=file_path)
-            ass_file.ASS_NODE_TYPES.update(self.ASS_NODE_TYPES)
-            ass_files.append(ass_file)
-            
-        # Now parse points
-        current_point = 0
-        for _scatterer in self.scatterers:
-            scatterer = _scatterer.get_module()
-            scatterer_name = scatterer.get_object_name().split('/')[-1]
-            instances_id = scatterer.get_instances()
-            for i in range(scatterer.get_instance_count()):
-                # Loop each scatter
-                current_point += 1
-                self.export_progress.emit(current_point, total_points)
-                instance_id = instances_id.get_item(i)
-                instance = scatterer.get_base_objects().get_item(instance_id)
-                geometry = ix.get_item(instance.get_object_name())
-                geometry_name = geometry.get_name()
-                module = geometry.get_module()
-
-                # Validate that is geometry is selected to export
-                if geometry not in self.geometries:
-                    continue
+            total_points += _scatterer.get_module().get_instance_count()
+
+        parsed_points = 0
+        static_count = 0
+        animated_count = 0
+        current_frame = libclarisse.get_current_frame()
+        libclarisse.set_current_frame(frames[0])
+        try:
+            for _scatterer in self.scatterers:
+                progress_callback = lambda current, offset=parsed_points: self.export_progress.emit(offset + current, total_points)
+                table = self._get_instance_table(_scatterer, frames=frames, progress_callback=progress_callback, cancel_event=cancel_event)
+                parsed_points += _scatterer.get_module().get_instance_count()
+                if cancel_event.is_set():
+                    return False
 
-                # Get the instance's matrix
-                matrix = scatterer.get_instance_matrix(i)
-                ix.api.GMathMatrix4x4d.extract_translation(matrix, tr_vector3D)
-                ix.api.GMathMatrix4x4d.compute_euler_angles(matrix, rot_vector3D)
-                ix.api.GMathMatrix4x4d.extract_scaling(matrix, scale_vector3D)
-                ix.api.GMathMatrix4x4d.extract_shearing(matrix, shear_vector3D)
-                ix.api.GMathMatrix4x4d.extract_rotation(matrix, rot_matrix4X4)
-                matrix.transpose()
-
-                # See if the point is selected by the user
-                if self.selection_type == 'inclusive':
-                    if not box_parser.is_point_in_any_box(point=tr_vector3D, boxes=self.box_definitions):
-                        continue
-                elif self.selection_type == 'exclusive':
-                    if box_parser.is_point_in_any_box(point=tr_vector3D, boxes=self.box_definitions):
-                        continue
-
-                # Find a unique ID for this instance. 
-                # We will has the location of the point to define its ID, appended with the geometry name
-                loc_hash = hashlib.md5(str(matrix).split('\n')[3].encode('utf-8'))
-                loc_hash = loc_hash.hexdigest()
-                unique_id = f'id_{loc_hash}_{geometry_name}'
-
-                # We must multiple the scale of the geometry, if any
-                geo_scale_vector3D = self._get_geo_scale_vector3D(module)
-
-                rescaled_vector3D = ix.api.GMathVec3d(
-                    geo_scale_vector3D[0] * scale_vector3D[0], 
-                    geo_scale_vector3D[1] * scale_vector3D[1], 
-                    geo_scale_vector3D[2] * scale_vector3D[2]
-                    )
-                
-                # Define a new matrix and compose it with the new scale
-                scaled_matrix = ix.api.GMathMatrix4x4d()
-                scaled_matrix.compose(tr_vector3D, rot_matrix4X4, shear_vector3D, rescaled_vector3D)
-                scaled_matrix.transpose()
-
-                # Prepare the matrix to be printed out to the .ass file
-                matrix_str = self._format_matrix_to_ass_string(scaled_matrix)        
-
-                # FIND FILE
-                ass_file = self.get_export_file(ass_files, geometry_name=geometry_name, scatterer_name=scatterer_name)
-
-                # Get procedural dict from the default
-                procedural_dict = ass_file.ASS_NODE_TYPES['procedural'].copy()
-                dcc_name = f'{unique_id}Shape'
-                procedural_dict.update({
-                    'name': f'/scatterers/{scatterer_name}/{geometry_name}/{unique_id}',
-                    'matrix': matrix_str,
-                    'filename': '"{}"'.format(libclarisse.get_str_attribute(item=geometry, attr_name=config.ATTR_ASS_FILE)),
-                    'dcc_name': f'"{dcc_name}"',
-                })
-
-                # Verify if we've aborted, else add our new dict to the .ass file
-                if cancel_event.is_set():  
+                table, preview_mask = self._filter_table(table)
+                animated = table.get_animated_mask()
+                static_count += np.count_nonzero(~animated)
+                animated_count += np.count_nonzero(animated)
+
+                # The static instances once
+                static_mask = None if preview_mask is None else preview_mask[~animated]
+                if not self._write_table(_scatterer, table.subset(~animated), *static_files, static_mask, cancel_event):
                     return False
-                else:
-                    ass_file.add_node(node_type='procedural', value=procedural_dict)
+
+                # The animated instances at each frame. They are routed once, the scene is not read again
+                animated_table = table.subset(animated)
+                animated_mask = None if preview_mask is None else preview_mask[animated]
+                instance_keys = {grouping: groupings.get_grouping(grouping).get_instance_keys(self, _scatterer, animated_table) for grouping, export_dir in outputs}
+                ass_file_paths = self._get_ass_file_paths(animated_table)
+                for index in range(len(frames)):
+                    frame_table = animated_table.get_frame(index)
+                    if not self._write_table(_scatterer, frame_table, *frame_files[index], animated_mask, cancel_event, 
+                                             instance_keys=instance_keys, ass_file_paths=ass_file_paths):
+                        return False
+        finally:
+            libclarisse.set_current_frame(current_frame)
 
         # Complete the export
-        for ass_file in ass_files:
+        for ass_file in all_files:
             ass_file.on_export_complete()
+        self.peak_buffered_bytes = pool.peak_buffered_bytes
+        self.sequence_counts = (static_count, animated_count)
+        self._finalize_files(all_files, manifests=manifests)
+        for manifest in manifests.values():
+            manifest.save()
 
         return True
+
+    def _iter_instance_batches(self, scatterers, batch_size, grouping_names, cancel_event=None, progress_callback=None, start_indices=None):
+        """Yields the filtered instances of the scatterers, in batches. See iter_instance_batches
+
+        Args:
+            scatterers (list): SceneObjectScatterers, in order
+            batch_size (int): Maximum number of instances in a batch
+            grouping_names (list): Names of the groupings whose keys are computed
+            cancel_event (threading.Event): Stops the iteration when set
+            progress_callback (callable): Called with the number of instances extracted so far, and their total
+            start_indices (dict): key: scatterer full name, value: index of its first filtered instance to yield.
+                -1 to skip the scatterer
+
+        Yields:
+            InstanceBatch: Filtered instances. Every scatterer yields at least one batch, the last one flagged is_last
+
+        """
+        # First get the amount of points to parse based on the scatterers for the progress
+        total_points = 0
+        for _scatterer in scatterers:
+            total_points += _scatterer.get_module().get_instance_count()
+
+        parsed_points = 0
+        for _scatterer in scatterers:
+            start = 0 if start_indices is None else start_indices.get(_scatterer.get_full_name(), 0)
+            if start < 0:
+                parsed_points += _scatterer.get_module().get_instance_count()
+                continue
+
+            # Only one scatterer's table is held at once: culling and thinning compare its instances
+            scatterer_callback = None
+            if progress_callback is not None:
+                scatterer_callback = lambda current, offset=parsed_points: progress_callback(offset + current, total_points)
+            table = self._get_instance_table(_scatterer, progress_callback=scatterer_callback, cancel_event=cancel_event)
+            parsed_points += _scatterer.get_module().get_instance_count()
+            if cancel_event is not None and cancel_event.is_set():
+                return
+
+            table, preview_mask = self._filter_table(table)
+            keys = {name: groupings.get_grouping(name).get_instance_keys(self, _scatterer, table) for name in grouping_names}
+
+            # Batches are views of the filtered table
+            batch_starts = list(range(start, len(table), batch_size)) or [start]
+            for batch_start in batch_starts:
+                if cancel_event is not None and cancel_event.is_set():
+                    return
+
+                batch_slice = slice(batch_start, batch_start + batch_size)
+                yield instance_table.InstanceBatch(
+                    scatterer=_scatterer,
+                    table=table.subset(batch_slice),
+                    start=batch_start,
+                    keys={name: instance_keys[batch_slice] for name, instance_keys in keys.items()},
+                    preview_mask=None if preview_mask is None else preview_mask[batch_slice],
+                    is_last=batch_start == batch_starts[-1]
+                    )
+
+    def _filter_table(self, table):
+        """Filters the instances selected by the user, then removes the redundant ones, and thins them
+
+        Args:
+            table (InstanceTable): Instances to filter
+
+        Returns:
+            InstanceTable: Remaining instances
+            None|np.ndarray: (N,) Mask of the instances to write to the preview files. None to write all of them
+
+        """
+        table = table.subset(self._get_selection_mask(table))
+        table = self._cull_instances(table)
+
+        # Thin the instances, or only flag the ones to write to the preview files
+        preview_mask = None
+        if self._is_thinning():
+            keep = self._get_thinning_mask(table)
+            if self.write_preview:
+                preview_mask = keep
+            else:
+                self._add_culled_instances(reason='thinning', table=table, culled=~keep)
+                table = table.subset(keep)
+
+        return table, preview_mask
+
+    def _write_table(self, scatterer, table, output_files, preview_files, preview_mask=None, cancel_event=None, instance_keys=None, ass_file_paths=None):
+        """Writes the instances of a table to their export files. 
+        Each instance is formatted once, and written to one file of each output
+
+        Args:
+            scatterer (SceneObjectScatterer): Scatterer the instances come from
+            table (InstanceTable): Filtered instances
+            output_files (list): (grouping, dict) of each output the instances are routed to. 
+                dict: key: export file name, value: AssFileGenerator written for it
+            preview_files (dict): key: export file path, value: its preview AssFileGenerator
+            preview_mask (np.ndarray): (N,) Mask of the instances to write to the preview files. None to write all of them
+            cancel_event (threading.Event): Stops the writing when set
+            instance_keys (dict): key: grouping name, value: (N,) Key indices of the instances, see InstanceBatch.
+                Computed for the groupings not found
+            ass_file_paths (np.ndarray): (N,) .ass file of each instance, see _get_ass_file_paths. Computed if not set
+
+        Returns:
+            bool: False if cancelled
+
+        """
+        geometry_names = table.geometry_names
+        if ass_file_paths is None:
+            ass_file_paths = self._get_ass_file_paths(table)
+        moving = table.get_moving_mask()
+
+        # Route the instances: the key of each instance, and the file of each key, per output
+        output_routes = []
+        instance_keys = instance_keys or {}
+        for grouping, files_by_name in output_files:
+            strategy = groupings.get_grouping(grouping)
+            keys = instance_keys.get(grouping)
+            if keys is None:
+                keys = strategy.get_instance_keys(self, scatterer, table)
+            # Files skipped by an incremental export are not found
+            files_by_key = [files_by_name.get(strategy.get_file_name(self, key)) for key in strategy.get_export_keys(self)]
+            output_routes.append((keys, files_by_key))
+
+        for i in range(len(table)):
+            geometry_index = table.geometry_indices[i]
+            geometry_name = geometry_names[geometry_index]
+
+            # Find a unique ID for this instance, from the hashed location of the point and the geometry name
+            unique_id = f'id_{table.ids[i]}_{geometry_name}'
+
+            # Prepare the matrix to be printed out to the .ass file. Moving instances get one matrix per motion sample
+            if moving[i]:
+                matrix_str = self._format_motion_matrix_to_ass_string(table.motion_matrices[i])
+            else:
+                matrix_str = self._format_matrix_to_ass_string(table.matrices[i])
+
+            # FIND FILES, one per output
+            routed_files = []
+            for instance_keys, files_by_key in output_routes:
+                key_index = instance_keys[i]
+                if key_index >= 0 and files_by_key[key_index] is not None:
+                    routed_files.append(files_by_key[key_index])
+            if not routed_files:
+                continue
+            ass_file = routed_files[0]
+
+            # Get procedural dict from the default
+            procedural_dict = ass_file.ASS_NODE_TYPES['procedural'].copy()
+            dcc_name = f'{unique_id}Shape'
+            procedural_dict.update({
+                'name': f'/scatterers/{table.scatterer_name}/{geometry_name}/{unique_id}',
+                'matrix': matrix_str,
+                'filename': '"{}"'.format(ass_file_paths[i]),
+                'dcc_name': f'"{dcc_name}"',
+            })
+            if moving[i]:
+                procedural_dict.update({'motion_start': f'{self.motion_start:f}', 'motion_end': f'{self.motion_end:f}'})
+
+            # Verify if we've aborted, else add our new dict to the .ass file
+            if cancel_event is not None and cancel_event.is_set():
+                return False
+            else:
+                # The node is formatted once, and shared with the other outputs and the preview files
+                node_str = ass_file.format_node(node_type='procedural', value=procedural_dict)
+                for ass_file in routed_files:
+                    ass_file.add_node_str(node_str)
+                    if self.write_preview and (preview_mask is None or preview_mask[i]):
+                        preview_files[ass_file.file_path].add_node_str(node_str)
+
+        return True
+
+    def _create_export_file(self, file_name, export_dir=None, resume_offset=None, pool=None):
+        """Returns a new export file. It is written to a sibling temp file, so the exported file is never partial
+        
+        Args:
+            file_name (str): Export file name
+            export_dir (str): Directory of the file. Uses the export_dir attribute if not set
+            resume_offset (int): If set, the temp file of an interrupted export is resumed from this byte offset
+            pool (WriterPool): Pool shared by the export files
+            
+        Returns:
+            AssFileGenerator: Export file
+            
+        """
+        file_path = os.path.join(export_dir or self.export_dir, file_name)
+        temp_path = file_path + config.TEMP_FILE_SUFFIX
+        ass_file = ass_generator.AssFileGenerator(file_path=file_path, temp_path=temp_path, resume_offset=resume_offset, pool=pool)
+        ass_file.ASS_NODE_TYPES.update(self.ASS_NODE_TYPES)
+        return ass_file
+
+    def _finalize_files(self, export_files, manifests=None):
+        """Moves the completed temp files in place, once every file is complete. 
+        The renames run as one batch on a thread pool, so readers only see the complete previous or new set of files.
+        With skip_identical, a file whose content hash matches the manifest is left untouched, so its modification time
+        and the caches depending on it are kept
+        
+        Args:
+            export_files (list): Completed AssFileGenerators
+            manifests (dict): key: export directory, value: ExportManifest holding the content hash of the previous exports
+            
+        """
+        moved_files = []
+        for ass_file in export_files:
+            file_name = os.path.basename(ass_file.file_path)
+            content_hash = ass_file.get_content_hash()
+            manifest = (manifests or {}).get(os.path.dirname(ass_file.file_path))
+            if manifest is not None:
+                identical = manifest.get(file_name, 'content_hash') == content_hash
+                if self.skip_identical and identical and os.path.isfile(ass_file.file_path):
+                    ass_file.discard()
+                    self.identical_files.append(file_name)
+                    continue
+
+                manifest.set(file_name, content_hash=content_hash)
+            moved_files.append(ass_file)
+
+        with ThreadPoolExecutor(max_workers=config.FINALIZE_WORKERS) as pool:
+            list(pool.map(lambda ass_file: ass_file.finalize(), moved_files))
+
+    def _discard_files(self, export_files):
+        """Removes the temp files of an aborted export
+        
+        Args:
+            export_files (list): AssFileGenerators
+            
+        """
+        for ass_file in export_files:
+            ass_file.discard()
+
+    def _get_journal(self, file_fingerprints, scatterers, file_paths):
+        """Returns the checkpoint journal of the export. The journal of an interrupted export is kept if it had the same 
+        inputs and its temp files are intact, else a new journal is started
+        
+        Args:
+            file_fingerprints (dict): key: file path, value: fingerprint of its inputs
+            scatterers (list): SceneObjectScatterers exported, in order
+            file_paths (list): Paths of the files written, including the preview files
+            
+        Returns:
+            ExportJournal: Journal
+            
+        """
+        journal = export_journal.ExportJournal(self.get_journal_file_path())
+        fingerprint = export_manifest.get_fingerprint(file_fingerprints, scatterers, file_paths)
+        temp_paths = {file_path: file_path + config.TEMP_FILE_SUFFIX for file_path in file_paths}
+        if not journal.can_resume(fingerprint, temp_paths):
+            journal.reset(fingerprint)
+        return journal
+
+    def _checkpoint(self, journal, export_files, completed=None, current=None):
+        """Flushes the export files, and records the progress in the journal. See ExportJournal.checkpoint"""
+        for ass_file in export_files:
+            ass_file.save_buffer_to_file()
+        journal.checkpoint(export_files, completed=completed, current=current)
+
+    def _get_file_fingerprints(self, grouping=None):
+        """Returns a fingerprint of the inputs of each export file: the export settings, the scatterers and the 
+        geometries written to it. Scatterers are fingerprinted from every instance matrix once per export, and shared 
+        by the outputs and the journal, see _get_scatterer_fingerprint
+        
+        Args:
+            grouping (str): Grouping method of the files. Uses the grouping attribute if not set
+        
+        Returns:
+            dict: key: file name, value: fingerprint
+            
+        """
+        grouping = grouping or self.grouping
+        strategy = groupings.get_grouping(grouping)
+        settings = self._get_settings_fingerprint()
+        geometry_fingerprints = {geometry: self._get_geometry_fingerprint(geometry) for geometry in self.geometries}
+        file_inputs = {file_name: [] for file_name in self.get_export_file_names(grouping=grouping)}
+        for scatterer in self.scatterers:
+            geometries = [g for g in libclarisse.get_scatterer_inventory(scatterer)[0] if g in geometry_fingerprints]
+            scatterer_fingerprint = self._get_scatterer_fingerprint(scatterer)
+            for key in strategy.get_scatterer_keys(self, scatterer, geometries):
+                file_inputs[strategy.get_file_name(self, key)].append(scatterer_fingerprint)
+            # A file only holds the geometries routed to it, ie: one of the scatterer's geometries with the 'asset' grouping
+            for geometry in geometries:
+                for key in strategy.get_scatterer_keys(self, scatterer, [geometry]):
+                    file_inputs[strategy.get_file_name(self, key)].append(geometry_fingerprints[geometry])
+
+        return {file_name: export_manifest.get_fingerprint(settings, grouping, strategy.get_settings(), inputs) for file_name, inputs in file_inputs.items()}
+
+    def _get_scatterer_file_names(self, scatterer, grouping=None):
+        """Returns the names of the export files a scatterer's instances are written to
+        
+        Args:
+            scatterer (SceneObjectScatterer): Scatterer
+            grouping (str): Grouping method of the files. Uses the grouping attribute if not set
+            
+        Returns:
+            list: File names
+            
+        """
+        strategy = groupings.get_grouping(grouping or self.grouping)
+        inventory = libclarisse.get_scatterer_inventory(scatterer)[0]
+        geometries = [g for g in self.geometries if g in inventory]
+        return [strategy.get_file_name(self, key) for key in strategy.get_scatterer_keys(self, scatterer, geometries)]
+
+    def _get_scatterer_fingerprint(self, scatterer):
+        """Returns the full fingerprint of a scatterer at the current frame, see libclarisse.get_scatterer_fingerprint.
+        It reads every instance, so it is computed once per export"""
+        if self.fingerprint_cache is None:
+            return libclarisse.get_scatterer_fingerprint(scatterer, full=True)
+
+        key = (scatterer.get_full_name(), libclarisse.get_current_frame())
+        if key not in self.fingerprint_cache:
+            self.fingerprint_cache[key] = libclarisse.get_scatterer_fingerprint(scatterer, full=True)
+        return self.fingerprint_cache[key]
+
+    def _get_settings_fingerprint(self):
+        """Returns a fingerprint of the export settings shared by every file, from the parsed selection definitions"""
+        return export_manifest.get_fingerprint(
+            pkginfo.version,
+            self.export_file_name,
+            self.ASS_NODE_TYPES,
+            self.selection_type,
+            self.selection_expression,
+            [self._get_box_fingerprint(definition) for definition in self.box_definitions],
+            {name: [self._get_box_fingerprint(definition) for definition in definitions] for name, definitions in self.selection_set_definitions.items()},
+            self.camera_definitions,
+            self.frustum_use_bounding_radius,
+            self.mask_definition,
+            [self.selection_mask_mode, self.selection_mask_threshold, self.selection_mask_seed, self.selection_mask_invert],
+            None if self.reference_hash is None else self.reference_hash.points,
+            [self.selection_distance, self.selection_distance_mode],
+            self.lod_reference_point,
+            [self.culling, self.duplicate_tolerance, self.overlap_tolerance],
+            [self.min_instance_size, self.min_screen_size, self.size_camera_definition],
+            [self.thinning_method, self.thinning_fraction, self.thinning_radius, self.write_preview],
+            self._get_motion_times(),
+            )
+
+    def _get_box_fingerprint(self, box_definition):
+        """Returns the values of a box definition to fingerprint: its name and vectors. 
+        Its module and bounding box are skipped, their string holds a memory address changing on every session"""
+        return {key: value for key, value in box_definition.items() if key not in ('geometry', 'bounding_box')}
+
+    def _get_geometry_fingerprint(self, geometry):
+        """Returns a fingerprint of what a geometry's instances depend on: its .ass files, scale and bounds"""
+        return export_manifest.get_fingerprint(
+            geometry,
+            libclarisse.get_str_attribute(item=geometry, attr_name=config.ATTR_ASS_FILE, use_cache=True),
+            libclarisse.get_geometry_lods(geometry),
+            self._get_geo_scale_vector3D(geometry),
+            libclarisse.get_geometry_bounding_radius(geometry),
+            )
+
+    def _is_file_changed(self, manifest, export_dir, file_name, fingerprint):
+        """Returns if an export file must be written again: its inputs changed, or it is missing"""
+        file_names = [file_name]
+        if self.write_preview:
+            file_names.append(self.get_preview_file_name(file_name))
+
+        if any(not os.path.isfile(os.path.join(export_dir, f)) for f in file_names):
+            return True
+
+        return manifest.get(file_name, 'fingerprint') != fingerprint
+
+    def _get_instance_table(self, scatterer, instance_range=None, frames=None, progress_callback=None, cancel_event=None):
+        """Extracts the instances of the selected geometries of a scatterer, with the geometries' scale applied
+
+        Args:
+            scatterer (SceneObjectScatterer): Scatterer to read
+            instance_range (tuple): (start, stop) If set, only the scatterer's instances in this range are extracted
+            frames (list): If set, the instances are also sampled at these frames, see InstanceTable.sample_frames
+            progress_callback (callable): Called with the number of instances read so far
+            cancel_event (threading.Event): Stops the extraction when set
+
+        Returns:
+            InstanceTable: Instances of the scatterer
+
+        """
+        def _extract():
+            # Read the instances from the scan cache if the scatterer did not change, else from the scene
+            table = None
+            cache = scan_cache.ScanCache() if self.use_scan_cache and instance_range is None else None
+            if cache is not None:
+                table = cache.get_table(scatterer, geometries=self.geometries, fingerprint=self._get_scatterer_fingerprint(scatterer))
+                if table is not None and progress_callback is not None:
+                    progress_callback(scatterer.get_module().get_instance_count())
+
+            if table is None:
+                table = instance_table.InstanceTable.from_scatterer(
+                    scatterer, 
+                    geometries=self.geometries, 
+                    instance_range=instance_range,
+                    progress_callback=progress_callback, 
+                    cancel_event=cancel_event
+                    )
+                if cache is not None and not (cancel_event is not None and cancel_event.is_set()):
+                    cache.save_table(scatterer, table, fingerprint=self._get_scatterer_fingerprint(scatterer))
+            return table
+
+        # Exports sharing a table cache extract each scatterer once
+        if self.table_cache is not None and instance_range is None:
+            table = self.table_cache.get(
+                scatterer, 
+                self.geometries, 
+                extract=_extract, 
+                cancel_event=cancel_event, 
+                fingerprint=self._get_scatterer_fingerprint(scatterer)
+                )
+            if progress_callback is not None:
+                progress_callback(scatterer.get_module().get_instance_count())
+        else:
+            table = _extract()
+
+        # Sample the instances at sub-frames for motion blur. Not cached, as the samples depend on the current frame
+        if self.motion_samples > 1 and not (cancel_event is not None and cancel_event.is_set()):
+            table.sample_motion(
+                scatterer, 
+                self._get_motion_times(), 
+                geometries=self.geometries, 
+                instance_range=instance_range, 
+                cancel_event=cancel_event
+                )
+        if frames and not (cancel_event is not None and cancel_event.is_set()):
+            table.sample_frames(
+                scatterer, 
+                frames, 
+                geometries=self.geometries, 
+                instance_range=instance_range, 
+                cancel_event=cancel_event
+                )
+
+        # We must multiply the scale of the geometry, if any
+        geo_scales = [self._get_geo_scale_vector3D(geometry) for geometry in table.geometries]
+        table.scale_geometries(geo_scales)
+        return table
+
+    def _cull_instances(self, table):
+        """Removes the redundant instances based on the culling method, and keeps count of them
+
+        Args:
+            table (InstanceTable): Instances to cull
+
+        Returns:
+            InstanceTable: Remaining instances
+
+        """
+        # Cull the tiny instances first, from their world space or on screen size
+        if self.min_instance_size > 0 or self.size_camera_definition is not None:
+            radii = table.get_bounding_radii(self._get_geometry_radii(table.geometries))
+            keep = radii >= self.min_instance_size
+            if self.size_camera_definition is not None:
+                sizes = camera_parser.get_projected_sizes(
+                    points=table.translations, 
+                    radii=radii, 
+                    camera=self.size_camera_definition, 
+                    resolution=self._get_resolution()
+                    )
+                keep &= sizes >= self.min_screen_size
+
+            self._add_culled_instances(reason='size', table=table, culled=~keep)
+            table = table.subset(keep)
+
+        if self.culling == 'duplicates':
+            keep = instance_culling.get_duplicate_mask(table, tolerance=self.duplicate_tolerance)
+        elif self.culling == 'overlaps':
+            radii = table.get_bounding_radii(self._get_geometry_radii(table.geometries))
+            keep = instance_culling.get_overlap_mask(table, radii=radii, tolerance=self.overlap_tolerance)
+        else:
+            return table
+
+        self._add_culled_instances(reason=self.culling, table=table, culled=~keep)
+        return table.subset(keep)
+
+    def _get_thinning_mask(self, table):
+        """Returns the mask of the instances kept by the thinning_method. 
+        Instances are ranked by the hash of their ID, so the same instances are kept on every run.
+
+        Args:
+            table (InstanceTable): Instances to thin
+
+        Returns:
+            np.ndarray: (N,) Boolean mask of the instances to keep
+
+        """
+        id_values = table.get_id_values()
+        if self.thinning_method == 'poisson':
+            return instance_culling.get_thinning_mask(table.translations, radius=self.thinning_radius, priorities=id_values)
+
+        return instance_culling.get_fraction_mask(id_values, fraction=self.thinning_fraction)
+
+    def _get_resolution(self):
+        """Returns the horizontal resolution of the render, from the .ass options"""
+        options = ass_generator.ASS_NODE_TYPES['options'].copy()
+        options.update(self.ASS_NODE_TYPES.get('options', {}))
+        return int(options.get('xres'))
+
+    def _add_culled_instances(self, reason, table, culled):
+        """Adds the culled instances to the count of their geometry
+
+        Args:
+            reason (str): Culling reason
+            table (InstanceTable): Instances tested
+            culled (np.ndarray): (N,) Boolean mask of the culled instances
+
+        """
+        counts = np.bincount(table.geometry_indices[culled], minlength=len(table.geometries))
+        culled_per_geometry = self.culled_instances.setdefault(reason, {})
+        for geometry_name, count in zip(table.geometry_names, counts):
+            if count:
+                culled_per_geometry[geometry_name] = culled_per_geometry.get(geometry_name, 0) + int(count)
+
+    def get_export_summary(self):
+        """Returns a summary of the last export
+        
+        Returns:
+            list: Summary strings
+            
+        """
+        summary = []
+        if self.resumed_from is not None:
+            summary.append('Resumed from checkpoint: {} scatterers and {} instances already written'.format(*self.resumed_from))
+            logging.info(summary[-1])
+        if self.skipped_files:
+            summary.append('{} unchanged files skipped: {}'.format(len(self.skipped_files), ', '.join(self.skipped_files)))
+            logging.info(summary[-1])
+        if self.identical_files:
+            summary.append('{} identical files kept: {}'.format(len(self.identical_files), ', '.join(self.identical_files)))
+            logging.info(summary[-1])
+        if self.sequence_counts is not None:
+            summary.append('{} static instances written once, {} animated instances written to {} frames'.format(
+                *self.sequence_counts, len(self.get_sequence_frames())))
+            logging.info(summary[-1])
+        if self.peak_buffered_bytes:
+            summary.append('Peak buffered: {:.1f} MB of {:.1f} MB budget'.format(self.peak_buffered_bytes / 1024**2, self.buffer_budget / 1024**2))
+            logging.info(summary[-1])
+
+        for reason, culled_per_geometry in self.culled_instances.items():
+            total = sum(culled_per_geometry.values())
+            details = ', '.join('{}: {}'.format(name, count) for name, count in sorted(culled_per_geometry.items()))
+            summary.append('{} instances culled ({}){}'.format(total, reason, ' - ' + details if details else ''))
+            logging.info(summary[-1])
+
+        return summary
+
+    def _get_ass_file_paths(self, table):
+        """Returns the .ass file of each instance. 
+        If a lod_reference is set, each instance gets the level of detail matching its distance to the reference
+        
+        Args:
+            table (InstanceTable): Instances to get the files of
+            
+        Returns:
+            np.ndarray: (N,) .ass file paths
+            
+        """
+        # One row per geometry: the base .ass file, followed by the files of each LOD
+        file_paths = np.empty((len(table.geometries), config.MAX_LOD_LEVELS + 1), dtype=object)
+        for geometry_index, geometry in enumerate(table.geometries):
+            file_paths[geometry_index, :] = libclarisse.get_str_attribute(item=geometry, attr_name=config.ATTR_ASS_FILE, use_cache=True)
+
+        levels = np.zeros(len(table), dtype=np.int64)
+        if self.lod_reference_point is not None:
+            distances = np.linalg.norm(table.translations - self.lod_reference_point, axis=1)
+            for geometry_index, geometry in enumerate(table.geometries):
+                lods = libclarisse.get_geometry_lods(geometry)
+                if not lods:
+                    continue
+
+                for level, (distance, ass_file) in enumerate(lods, start=1):
+                    file_paths[geometry_index, level] = ass_file
+
+                # The level is the number of LOD distances the instance is beyond
+                thresholds = np.array([distance for distance, ass_file in lods])
+                instances = table.geometry_indices == geometry_index
+                levels[instances] = np.searchsorted(thresholds, distances[instances], side='right')
+
+        return file_paths[table.geometry_indices, levels]
+
+    def _get_selection_mask(self, table):
+        """Returns the mask of the instances selected by the selection_type
+
+        Args:
+            table (InstanceTable): Instances to test
+
+        Returns:
+            np.ndarray: (N,) Boolean mask of the instances to export
+
+        """
+        if self.selection_type == 'inclusive':
+            return box_parser.get_points_in_any_box_mask(points=table.translations, boxes=self.box_definitions)
+
+        elif self.selection_type == 'exclusive':
+            return ~box_parser.get_points_in_any_box_mask(points=table.translations, boxes=self.box_definitions)
+
+        elif self.selection_type == 'expression':
+            tree = selection_expression.parse(self.selection_expression)
+            return selection_expression.evaluate(tree, points=table.translations, set_definitions=self.selection_set_definitions)
+
+        elif self.selection_type == 'frustum':
+            radii = 0.0
+            if self.frustum_use_bounding_radius:
+                radii = table.get_bounding_radii(self._get_geometry_radii(table.geometries))
+            return camera_parser.get_points_in_any_frustum_mask(points=table.translations, cameras=self.camera_definitions, radii=radii)
+
+        elif self.selection_type == 'image_mask':
+            mask = mask_parser.get_points_in_mask(
+                points=table.translations, 
+                mask=self.mask_definition, 
+                threshold=self.selection_mask_threshold, 
+                mode=self.selection_mask_mode, 
+                random_values=self._get_mask_random_values(table)
+                )
+            return ~mask if self.selection_mask_invert else mask
+
+        elif self.selection_type == 'distance':
+            mask = self.reference_hash.any_within(points=table.translations, radius=self.selection_distance)
+            return mask if self.selection_distance_mode == 'near' else ~mask
+
+        return np.ones(len(table), dtype=bool)
     
-    def _get_geo_scale_vector3D(self, module):
-        """Gets the scale vector3D from a ModuleSceneObjectTree
+    def _get_mask_random_values(self, table):
+        """Returns the random value of each instance for the 'random' image mask mode. Values are drawn per instance, 
+        from its ID, the seed and the scatterer, so an instance is kept whichever instances are exported with it, 
+        ie: by the shards of a sharded export"""
+        seed = hashlib.md5('{}/{}'.format(self.selection_mask_seed, table.scatterer_name).encode('utf-8')).hexdigest()
+        return table.get_id_values(seed=int(seed[:16], 16))
+
+    def _get_reference_points(self, item):
+        """Returns the points of a reference object: the instances of a scatterer, or the vertices of a geometry
+        
+        Args:
+            item: Scatterer or geometry object
+            
+        Returns:
+            np.ndarray: (N, 3) World space points
+            
+        """
+        if item.get_type() == 'SceneObjectScatterer':
+            return instance_table.InstanceTable.from_scatterer(item).translations
+
+        return libclarisse.get_geometry_points(item)
+
+    def _get_geometry_radii(self, geometries):
+        """Returns the local bounding radius of each geometry
+        
+        Args:
+            geometries (list): Geometry objects
+            
+        Returns:
+            np.ndarray: (G,) Bounding radii
+            
+        """
+        return np.array([libclarisse.get_geometry_bounding_radius(geometry) for geometry in geometries], dtype=np.float64)
+
+    def _get_geo_scale_vector3D(self, geometry):
+        """Gets the scale vector3D from a geometry's global matrix
         
         Returns:
             tuple: (x, y, z)
         
         """
         # Get scale matrix from a combiner and return a simple dict
-        matrix = module.get_global_matrix()
-        matrix = str(matrix).split('\n')
+        matrix = libclarisse.get_global_matrix_array(geometry)
         vector3D = (
-            float(matrix[0].split(' ')[0]), 
-            float(matrix[1].split(' ')[1]), 
-            float(matrix[2].split(' ')[2])
+            float(matrix[0, 0]), 
+            float(matrix[1, 1]), 
+            float(matrix[2, 2])
             )
         return vector3D
 
     def _format_matrix_to_ass_string(self, matrix):
-        """Formats the given matrix to an .ass file string"""
-        matrix_str = str()
-        for line in str(matrix).split('\n'):
-            if line.strip() == '': 
-                continue
+        """Formats the given matrix to an .ass file string
+        
+        Args:
+            matrix (np.ndarray): (4, 4) Matrix, in the .ass layout
+            
+        Returns:
+            str: Matrix string
+            
+        """
+        return MATRIX_STR_FORMAT.format(*np.ravel(matrix))
+
+    def _format_motion_matrix_to_ass_string(self, matrices):
+        """Formats the given motion samples to an .ass file matrix array string, one key per sample
+        
+        Args:
+            matrices (np.ndarray): (K, 4, 4) Matrices, in the .ass layout
+            
+        Returns:
+            str: Matrix array string
+            
+        """
+        return '1 {} MATRIX'.format(len(matrices)) + ''.join(self._format_matrix_to_ass_string(matrix) for matrix in matrices)
+
+    def _get_motion_times(self):
+        """Returns the frames at which the instances are sampled for motion blur. None without motion blur"""
+        if self.motion_samples <= 1:
+            return None
+        frame = libclarisse.get_current_frame()
+        return list(np.linspace(frame + self.motion_start, frame + self.motion_end, int(self.motion_samples)))
 
-            # Add value to the string
-            matrix_str += '\n ' 
-            for value in line.strip().split():
-                normalized = '{:f}'.format(float(value))
-                matrix_str += f'{normalized} '
+    # __________________________________________________________________________________________________________________
+    # SHARDS
 
-        return matrix_str
+    def run_shard_pre_validation(self):
+        """Runs the validation of a sharded export, see export_shards
+        
+        Returns:
+            list: Error strings
+            list: Warning strings
+            
+        """
+        errors, warnings = self._run_pre_validation()
+        if not self._validate_shardable():
+            errors.append('Sharded exports do not support culling nor poisson thinning, as they compare instances of different shards')
+        if self.frame_range:
+            errors.append('Sharded exports do not support frame_range')
+        return errors, warnings
+
+    def export_shard(self, scatterer, instance_range, part_dir):
+        """Exports a range of a scatterer's instances to part files, one per export file, to be merged by merge_shards.
+        Runs in the calling thread, ie: in a batch process
+        
+        Args:
+            scatterer (SceneObjectScatterer): Scatterer to export
+            instance_range (tuple): (start, stop) Range of the scatterer's instances to export
+            part_dir (str): Directory of the part files
+            
+        Returns:
+            dict: Shard manifest. 'files': size and content_hash of each part file, by '{output index}/{file name}'.
+                'culled_instances': instances culled by the shard, see culled_instances attribute
+            
+        """
+        self._prepare_export()
+        self.culled_instances = {}
+
+        # One part directory per output, see get_outputs
+        pool = ass_generator.WriterPool(buffer_budget=self.buffer_budget)
+        files = {}
+        output_files = []
+        preview_files = {}
+        for index, (grouping, export_dir) in enumerate(self.get_outputs()):
+            file_names = self.get_export_file_names(grouping=grouping)
+            preview_names = self._get_preview_file_names(file_names)
+            for name in file_names + list(preview_names.values()):
+                part_file = ass_generator.AssFileGenerator(file_path=os.path.join(part_dir, str(index), name), fragment=True, pool=pool)
+                part_file.ASS_NODE_TYPES.update(self.ASS_NODE_TYPES)
+                files['{}/{}'.format(index, name)] = part_file
+            output_files.append((grouping, {name: files['{}/{}'.format(index, name)] for name in file_names}))
+            for file_name, preview_name in preview_names.items():
+                preview_files[files['{}/{}'.format(index, file_name)].file_path] = files['{}/{}'.format(index, preview_name)]
+
+        table = self._get_instance_table(scatterer, instance_range=instance_range)
+        table, preview_mask = self._filter_table(table)
+        self._write_table(scatterer, table, output_files, preview_files, preview_mask)
+        for part_file in files.values():
+            part_file.on_export_complete()
+        self.grouping_cache = None
+        self.fingerprint_cache = None
+
+        return {
+            'files': {name: {'size': os.path.getsize(f.write_path), 'content_hash': f.get_content_hash()} for name, f in files.items()},
+            'culled_instances': self.culled_instances,
+        }
+
+    def merge_shards(self, shards):
+        """Merges the part files of the shards into the export files, in the shards' order. 
+        The merged files are the same as the files of a single export. Runs in the calling thread
+        
+        Args:
+            shards (list): (part directory, shard manifest) of each shard, in order
+            
+        Returns:
+            list: Summary strings, see get_export_summary
+            
+        """
+        self.culled_instances = {}
+        self.skipped_files = []
+        self.identical_files = []
+        self.resumed_from = None
+        self.peak_buffered_bytes = 0
+
+        # The export files of each output, with the part directory of the output
+        pool = ass_generator.WriterPool()
+        export_files = []
+        manifests = {}
+        for index, (grouping, export_dir) in enumerate(self.get_outputs()):
+            file_names = self.get_export_file_names(grouping=grouping)
+            for name in file_names + list(self._get_preview_file_names(file_names).values()):
+                export_files.append((str(index), self._create_export_file(name, export_dir=export_dir, pool=pool)))
+            if self.skip_identical:
+                manifests[export_dir] = export_manifest.ExportManifest(self.get_manifest_file_path(export_dir))
+        self._staged_files = [ass_file for index, ass_file in export_files]
+        try:
+            for part_dir, shard_manifest in shards:
+                for index, ass_file in export_files:
+                    ass_file.append_file(os.path.join(part_dir, index, os.path.basename(ass_file.file_path)))
+                for reason, culled_per_geometry in shard_manifest.get('culled_instances', {}).items():
+                    for geometry_name, count in culled_per_geometry.items():
+                        culled = self.culled_instances.setdefault(reason, {})
+                        culled[geometry_name] = culled.get(geometry_name, 0) + count
+
+            for ass_file in self._staged_files:
+                ass_file.on_export_complete()
+            self._finalize_files(self._staged_files, manifests=manifests)
+            for manifest in manifests.values():
+                manifest.save()
+        finally:
+            # Remove the temp files of a failed merge, the exported files are left untouched
+            self._discard_files(self._staged_files)
+            self._staged_files = []
+
+        return self.get_export_summary()
 
 # ______________________________________________________________________________________________________________________
@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+"""
+    Name:           export_journal.py
+    Description:    Checkpoint journal of a running export, letting an interrupted export resume where it stopped
+
+"""
+# System Imports
+import os
+import sys
+import logging
+import json
+
+# Third-Party Imports
+
+# Local Imports
+from scatterertoarnold.configs import config
+
+# ______________________________________________________________________________________________________________________
+
+class ExportJournal():
+    """Class reading and writing the checkpoint journal of an export.
+
+    The journal is a JSON file next to the exported files, rewritten at each checkpoint. It holds:
+        - fingerprint: fingerprint of the export's inputs. A journal is only resumed by an export with the same inputs
+        - completed: full names of the scatterers completely written
+        - current: ``{'scatterer': full name, 'instances': count}`` Instances of the next scatterer already written
+        - offsets: key: export file path, value: size of its temp file at the checkpoint, in bytes
+    """
+
+    def __init__(self, file_path):
+        """Constructor.
+
+        Args:
+            file_path (str): Path to the journal file
+
+        """
+        super(ExportJournal, self).__init__()
+        self.file_path = file_path
+        self.fingerprint = None
+        self.completed = []
+        self.current = {}
+        self.offsets = {}
+        self.load()
+
+    def load(self):
+        """Loads the journal from disk. A missing or unreadable journal is empty"""
+        self.reset()
+        if not os.path.isfile(self.file_path):
+            return
+
+        try:
+            with open(self.file_path, 'r') as f:
+                values = json.load(f)
+        except (OSError, ValueError) as e:
+            logging.warning('Could not read export journal {}: {}'.format(self.file_path, e))
+            return
+
+        if values.get('version') != config.JOURNAL_VERSION:
+            return
+
+        self.fingerprint = values.get('fingerprint')
+        self.completed = values.get('completed', [])
+        self.current = values.get('current', {})
+        self.offsets = values.get('offsets', {})
+
+    def save(self):
+        """Saves the journal to disk. The file is replaced at once, so a crash never leaves half of it"""
+        os.makedirs(os.path.dirname(self.file_path), exist_ok=True)
+        values = {
+            'version': config.JOURNAL_VERSION,
+            'fingerprint': self.fingerprint,
+            'completed': self.completed,
+            'current': self.current,
+            'offsets': self.offsets,
+        }
+        with open(self.file_path + '.tmp', 'w') as f:
+            json.dump(values, f, indent=4, sort_keys=True)
+        os.replace(self.file_path + '.tmp', self.file_path)
+
+    def reset(self, fingerprint=None):
+        """Clears the journal's progress, for a new export
+
+        Args:
+            fingerprint (str): Fingerprint of the new export's inputs
+
+        """
+        self.fingerprint = fingerprint
+        self.completed = []
+        self.current = {}
+        self.offsets = {}
+
+    def remove(self):
+        """Removes the journal from disk, once the export completed"""
+        if os.path.exists(self.file_path):
+            os.remove(self.file_path)
+
+    def can_resume(self, fingerprint, export_files) -> bool:
+        """Returns if an export can resume from the journal: same inputs, and every temp file still holds at least the
+        checkpointed content
+
+        Args:
+            fingerprint (str): Fingerprint of the export's inputs
+            export_files (dict): key: export file path, value: path of its temp file
+
+        Returns:
+            bool: True if the export can resume
+
+        """
+        if self.fingerprint is None or self.fingerprint != fingerprint:
+            return False
+
+        if set(self.offsets) != set(export_files):
+            return False
+
+        for file_path, temp_path in export_files.items():
+            if not os.path.isfile(temp_path) or os.path.getsize(temp_path) < self.offsets[file_path]:
+                return False
+
+        return True
+
+    def get_resume_index(self, scatterer_name) -> int:
+        """Returns the number of a scatterer's instances already written
+
+        Args:
+            scatterer_name (str): Full name of the scatterer
+
+        Returns:
+            int: Instance index to resume from. -1 if the scatterer was completely written
+
+        """
+        if scatterer_name in self.completed:
+            return -1
+
+        if self.current.get('scatterer') == scatterer_name:
+            return self.current.get('instances', 0)
+
+        return 0
+
+    def checkpoint(self, export_files, completed=None, current=None):
+        """Records the progress of the export and the size of its files, and saves the journal.
+        The files' buffers must be flushed first
+
+        Args:
+            export_files (list): AssFileGenerators of the export
+            completed (str): Full name of a scatterer just completely written
+            current (tuple): (full name, count) Instances of the scatterer being written so far
+
+        """
+        if completed is not None:
+            self.completed.append(completed)
+            self.current = {}
+        if current is not None:
+            self.current = {'scatterer': current[0], 'instances': current[1]}
+
+        self.offsets = {f.file_path: os.path.getsize(f.write_path) for f in export_files}
+        self.save()
+
+# ______________________________________________________________________________________________________________________
@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+"""
+    Name:           export_manifest.py
+    Description:    Manifest of the files written by an export, and fingerprints of their inputs
+
+"""
+# System Imports
+import os
+import sys
+import logging
+import json
+import hashlib
+
+# Third-Party Imports
+import numpy as np
+
+# Local Imports
+from scatterertoarnold.configs import config
+
+# ______________________________________________________________________________________________________________________
+
+def get_fingerprint(*values) -> str:
+    """Returns a fingerprint of the given values
+
+    Args:
+        *values: Values to hash. See update_fingerprint for the supported types
+
+    Returns:
+        str: md5 hex digest
+
+    """
+    fingerprint = hashlib.md5()
+    for value in values:
+        update_fingerprint(fingerprint, value)
+    return fingerprint.hexdigest()
+
+def update_fingerprint(fingerprint, value):
+    """Adds a value to a fingerprint.
+    Dicts, lists and tuples are hashed recursively, arrays by their bytes, and clarisse objects by their full name.
+
+    Args:
+        fingerprint (hashlib.md5): Fingerprint to update
+        value: Value to hash
+
+    """
+    if isinstance(value, dict):
+        fingerprint.update(b'{')
+        for key in sorted(value.keys(), key=str):
+            update_fingerprint(fingerprint, key)
+            update_fingerprint(fingerprint, value[key])
+        fingerprint.update(b'}')
+
+    elif isinstance(value, (list, tuple)):
+        fingerprint.update(b'[')
+        for item in value:
+            update_fingerprint(fingerprint, item)
+        fingerprint.update(b']')
+
+    elif isinstance(value, np.ndarray):
+        fingerprint.update(str((value.dtype, value.shape)).encode('utf-8'))
+        fingerprint.update(np.ascontiguousarray(value).tobytes())
+
+    elif hasattr(value, 'get_full_name'):
+        fingerprint.update(value.get_full_name().encode('utf-8'))
+
+    elif value is None or isinstance(value, (str, bytes, bool, int, float, np.generic)):
+        fingerprint.update(repr(value).encode('utf-8'))
+
+    else:
+        # Objects without a stable value, ie: clarisse math types. Hashed through their string representation
+        fingerprint.update(type(value).__name__.encode('utf-8'))
+        fingerprint.update(str(value).encode('utf-8'))
+
+    fingerprint.update(b';')
+
+class ExportManifest():
+    """Class reading and writing the manifest of an export directory.
+
+    The manifest is a JSON file next to the exported files. It holds one entry per exported file name, ie:
+    ``{'fingerprint': fingerprint of the file's inputs, 'content_hash': hash of the file's content}``
+    """
+
+    def __init__(self, file_path):
+        """Constructor.
+
+        Args:
+            file_path (str): Path to the manifest file
+
+        """
+        super(ExportManifest, self).__init__()
+        self.file_path = file_path
+        self.entries = {}
+        self.load()
+
+    def load(self):
+        """Loads the manifest from disk. A missing or unreadable manifest is empty"""
+        self.entries = {}
+        if not os.path.isfile(self.file_path):
+            return
+
+        try:
+            with open(self.file_path, 'r') as f:
+                self.entries = json.load(f).get('files', {})
+        except (OSError, ValueError) as e:
+            logging.warning('Could not read export manifest {}: {}'.format(self.file_path, e))
+
+    def save(self):
+        """Saves the manifest to disk"""
+        os.makedirs(os.path.dirname(self.file_path), exist_ok=True)
+        with open(self.file_path + '.tmp', 'w') as f:
+            json.dump({'version': config.MANIFEST_VERSION, 'files': self.entries}, f, indent=4, sort_keys=True)
+        os.replace(self.file_path + '.tmp', self.file_path)
+
+    def get(self, file_name, key, default=None):
+        """Returns a value of a file's entry
+
+        Args:
+            file_name (str): Exported file name
+            key (str): Value to get, ie: 'fingerprint'
+            default: Returned if the file or value is not found
+
+        Returns:
+            Value
+
+        """
+        return self.entries.get(file_name, {}).get(key, default)
+
+    def set(self, file_name, **values):
+        """Updates a file's entry
+
+        Args:
+            file_name (str): Exported file name
+            **values: Values to set, ie: fingerprint='...'
+
+        """
+        self.entries.setdefault(file_name, {}).update(values)
+
+# ______________________________________________________________________________________________________________________
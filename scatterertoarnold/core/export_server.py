@@ -0,0 +1,521 @@
+#!/usr/bin/env python
+"""
+    Name:           export_server.py
+    Description:    Local export server: queues export jobs from several clients, and runs them in one Clarisse session
+
+    Usage:
+        # In a Clarisse session with the project loaded, ie:    cnode <project> -script export_server.py -args --port 8765
+        server = export_server.ExportServer()
+        server.start()
+
+        # From any client
+        job_id = export_server.submit_job(export_shards.get_exporter_settings(exporter), priority=10)
+        for event in export_server.stream_events(job_id):
+            print(event)
+
+    HTTP API, on localhost:
+        POST    /jobs                   Submits a job: {'settings': exporter settings, 'priority': int, 'project': path}
+        GET     /jobs                   Returns the status of every job
+        GET     /jobs/{id}              Returns the status of a job
+        GET     /jobs/{id}/events       Streams the events of a job, one JSON object per line, until it finished
+        DELETE  /jobs/{id}              Cancels a job
+
+    Jobs run in the server's session, so they share its scene caches and an in-memory cache of the extracted scatterers:
+    jobs of the same project extract each scatterer once. Jobs evaluating the scene at other frames run alone, the others
+    may run at once. The last SERVER_JOB_RETENTION finished jobs are kept.
+
+"""
+# System Imports
+import os
+import sys
+import logging
+import json
+import threading
+import itertools
+import heapq
+import time
+import argparse
+import urllib.request
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Third-Party Imports
+import ix
+
+# Local Imports
+from scatterertoarnold.core import export_shards, instance_table
+from scatterertoarnold.configs import config
+
+# ______________________________________________________________________________________________________________________
+
+class ExportJob():
+    """Class holding an export job, and the events streamed to its clients"""
+
+    def __init__(self, job_id, settings, priority=0):
+        """Constructor.
+
+        Args:
+            job_id (str): Unique ID of the job
+            settings (dict): Exporter settings, see export_shards.get_exporter_settings
+            priority (int): Jobs with a higher priority run first
+
+        """
+        super(ExportJob, self).__init__()
+        self.id = job_id
+        self.settings = settings
+        self.priority = priority
+        self.status = 'queued'
+        self.events = []
+        self.exporter = None
+        self.cancel_requested = False
+        self._condition = threading.Condition()
+        self.add_event('queued', priority=priority)
+
+    @property
+    def finished(self) -> bool:
+        """Returns if the job will not run anymore"""
+        return self.status in ['succeeded', 'failed', 'cancelled']
+
+    def add_event(self, event_type, **values):
+        """Adds an event, and wakes the clients streaming them
+
+        Args:
+            event_type (str): Event type, ie: 'progress'
+            **values: Event values, JSON serializable
+
+        """
+        with self._condition:
+            self.events.append(dict(values, type=event_type, job=self.id, time=time.time()))
+            self._condition.notify_all()
+
+    def set_status(self, status, **values):
+        """Sets the status of the job, and adds it as an event"""
+        self.status = status
+        self.add_event(status, **values)
+
+    def iter_events(self, timeout=None):
+        """Yields the events of the job as they are added, until it finished
+
+        Args:
+            timeout (float): Maximum time to wait for the next event, in seconds
+
+        Yields:
+            dict: Event
+
+        """
+        index = 0
+        while True:
+            with self._condition:
+                if index >= len(self.events) and not self.finished:
+                    self._condition.wait(timeout)
+                events = self.events[index:]
+                finished = self.finished
+
+            for event in events:
+                yield event
+            index += len(events)
+
+            if finished and index >= len(self.events):
+                return
+
+    def to_dict(self) -> dict:
+        """Returns the status of the job"""
+        progress = next((event for event in reversed(self.events) if event['type'] == 'progress'), {})
+        return {
+            'id': self.id,
+            'status': self.status,
+            'priority': self.priority,
+            'current': progress.get('current', 0),
+            'total': progress.get('total', 0),
+        }
+
+class SceneLock():
+    """Class sharing the scene between the running jobs. Jobs reading it at the current frame share it, while jobs 
+    changing the frame hold it alone, so they never move the scene under another job's extraction. 
+    Waiting exclusive jobs go first, so they are not starved by a stream of shared ones
+    """
+
+    def __init__(self):
+        """Constructor."""
+        super(SceneLock, self).__init__()
+        self._condition = threading.Condition()
+        self._readers = 0
+        self._writing = False
+        self._waiting_writers = 0
+
+    @contextmanager
+    def shared(self):
+        """Holds the scene with the other shared jobs"""
+        with self._condition:
+            while self._writing or self._waiting_writers:
+                self._condition.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._readers -= 1
+                self._condition.notify_all()
+
+    @contextmanager
+    def exclusive(self):
+        """Holds the scene alone"""
+        with self._condition:
+            self._waiting_writers += 1
+            while self._writing or self._readers:
+                self._condition.wait()
+            self._waiting_writers -= 1
+            self._writing = True
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._writing = False
+                self._condition.notify_all()
+
+class ExportServer():
+    """Class queuing export jobs by priority, and running them in the current Clarisse session"""
+
+    def __init__(self, host=config.SERVER_HOST, port=config.SERVER_PORT, max_concurrent_jobs=config.SERVER_MAX_CONCURRENT_JOBS,
+                 job_retention=config.SERVER_JOB_RETENTION):
+        """Constructor.
+
+        Args:
+            host (str): Host to listen on. Only local addresses should be used
+            port (int): Port to listen on. 0 to pick a free port
+            max_concurrent_jobs (int): Number of jobs run at once
+            job_retention (int): Number of finished jobs kept, with their events. Older ones are forgotten
+
+        """
+        super(ExportServer, self).__init__()
+        self.host = host
+        self.port = port
+        self.max_concurrent_jobs = max_concurrent_jobs
+        self.job_retention = job_retention
+        self.project_path = ix.application.get_current_project_filename()
+        self.table_cache = instance_table.TableCache() # Shared by every job
+        self.jobs = {}
+        self.scene_lock = SceneLock()
+
+        self._queue = [] # Heap of (-priority, submission order, job)
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._http_server = None
+        self._threads = []
+        self._stopped = False
+
+    @property
+    def address(self) -> str:
+        """Returns the URL of the server"""
+        return 'http://{}:{}'.format(self.host, self.port)
+
+    def start(self):
+        """Starts the HTTP server and the job workers in background threads"""
+        self._stopped = False
+        self._http_server = ThreadingHTTPServer((self.host, self.port), _RequestHandler)
+        self._http_server.export_server = self
+        self._http_server.daemon_threads = True
+        self.port = self._http_server.server_address[1]
+
+        self._threads = [threading.Thread(target=self._http_server.serve_forever, daemon=True)]
+        for _ in range(self.max_concurrent_jobs):
+            self._threads.append(threading.Thread(target=self._run_jobs, daemon=True))
+        for thread in self._threads:
+            thread.start()
+
+        logging.info('Export server listening on {}'.format(self.address))
+
+    def stop(self):
+        """Stops the server. Running jobs are cancelled"""
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+
+        for job in self.get_jobs():
+            self.cancel(job.id)
+
+        if self._http_server is not None:
+            self._http_server.shutdown()
+            self._http_server.server_close()
+            self._http_server = None
+
+    def submit(self, settings, priority=0, project=None) -> ExportJob:
+        """Queues an export job
+
+        Args:
+            settings (dict): Exporter settings, see export_shards.get_exporter_settings
+            priority (int): Jobs with a higher priority run first
+            project (str): Project the job was made for. Must be the server's project if set
+
+        Raises:
+            ValueError: The job is for another project
+
+        Returns:
+            ExportJob: Queued job
+
+        """
+        if project and os.path.normpath(project) != os.path.normpath(self.project_path):
+            raise ValueError('Invalid project. Provided: {}. Valid: {}'.format(project, self.project_path))
+
+        job = ExportJob(job_id=str(next(self._counter)), settings=settings, priority=priority)
+        with self._condition:
+            self.jobs[job.id] = job
+            heapq.heappush(self._queue, (-priority, int(job.id), job))
+            self._condition.notify()
+
+        return job
+
+    def get_jobs(self) -> list:
+        """Returns a snapshot of the jobs, as finished jobs are pruned by the worker thread"""
+        with self._condition:
+            return list(self.jobs.values())
+
+    def get_job(self, job_id):
+        """Returns a job by ID, or None if not found or pruned"""
+        with self._condition:
+            return self.jobs.get(job_id)
+
+    def cancel(self, job_id) -> bool:
+        """Cancels a queued or running job
+
+        Args:
+            job_id (str): ID of the job
+
+        Returns:
+            bool: False if the job is not found or already finished
+
+        """
+        job = self.get_job(job_id)
+        if job is None or job.finished:
+            return False
+
+        job.cancel_requested = True
+        with self._condition:
+            if job.status == 'queued':
+                self._queue = [item for item in self._queue if item[2] is not job]
+                heapq.heapify(self._queue)
+                job.set_status('cancelled')
+                self._prune_jobs()
+                return True
+
+        if job.exporter is not None:
+            job.exporter.abort_export()
+        return True
+
+    def _run_jobs(self):
+        """Runs the queued jobs, by priority, until the server is stopped"""
+        while True:
+            with self._condition:
+                while not self._queue and not self._stopped:
+                    self._condition.wait()
+                if self._stopped:
+                    return
+                job = heapq.heappop(self._queue)[2]
+                job.set_status('running')
+
+            self._run_job(job)
+            with self._condition:
+                self._prune_jobs()
+
+    def _prune_jobs(self):
+        """Forgets the oldest finished jobs beyond the job_retention. Called with the condition held"""
+        finished = [job for job in self.jobs.values() if job.finished]
+        for job in finished[:max(len(finished) - self.job_retention, 0)]:
+            del self.jobs[job.id]
+
+    def _run_job(self, job):
+        """Runs an export job, and streams its signals as events"""
+        try:
+            exporter = export_shards.create_exporter(job.settings)
+        except Exception as e:
+            job.set_status('failed', error=str(e))
+            return
+
+        if job.cancel_requested:
+            job.set_status('cancelled')
+            return
+
+        exporter.table_cache = self.table_cache
+        exporter.pre_validation_finished.connect(lambda errors, warnings: job.add_event('validation', errors=errors, warnings=warnings))
+        exporter.export_progress.connect(lambda current, total: job.add_event('progress', current=current, total=total))
+        exporter.export_summary.connect(lambda summary: job.add_event('summary', summary=summary))
+        results = []
+        exporter.export_finished.connect(results.append)
+        job.exporter = exporter
+
+        # Jobs moving the scene to other frames hold it alone
+        scene_lock = self.scene_lock.exclusive() if exporter.is_changing_frame() else self.scene_lock.shared()
+        try:
+            with scene_lock:
+                exporter.export()
+                exporter.wait()
+        except Exception as e:
+            logging.exception('Export job {} failed'.format(job.id))
+            job.set_status('failed', error=str(e))
+            return
+        finally:
+            job.exporter = None
+
+        # A failed export does not emit export_finished
+        if results and results[0]:
+            job.set_status('succeeded')
+        elif job.cancel_requested:
+            job.set_status('cancelled')
+        else:
+            job.set_status('failed', error='Export failed, see the validation events and the server log')
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    """Handler of the server's HTTP API"""
+
+    @property
+    def export_server(self) -> ExportServer:
+        """Returns the server handling the request"""
+        return self.server.export_server
+
+    def do_GET(self):
+        """Returns the jobs' status, or streams a job's events"""
+        parts = self.path.strip('/').split('/')
+        if parts == ['jobs']:
+            return self._send_json([job.to_dict() for job in self.export_server.get_jobs()])
+
+        job = self._get_job(parts)
+        if job is None:
+            return self._send_json({'error': 'Job not found'}, status=404)
+
+        if parts[2:] == ['events']:
+            # Streamed until the job finished, the connection is closed after the last event
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/x-ndjson')
+            self.end_headers()
+            for event in job.iter_events():
+                self.wfile.write((json.dumps(event) + '\n').encode('utf-8'))
+                self.wfile.flush()
+            return
+
+        return self._send_json(job.to_dict())
+
+    def do_POST(self):
+        """Submits a job"""
+        if self.path.strip('/') != 'jobs':
+            return self._send_json({'error': 'Not found'}, status=404)
+
+        try:
+            values = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            job = self.export_server.submit(values['settings'], priority=int(values.get('priority', 0)), project=values.get('project'))
+        except (ValueError, KeyError, TypeError) as e:
+            return self._send_json({'error': str(e)}, status=400)
+
+        return self._send_json(job.to_dict(), status=201)
+
+    def do_DELETE(self):
+        """Cancels a job"""
+        job = self._get_job(self.path.strip('/').split('/'))
+        if job is None:
+            return self._send_json({'error': 'Job not found'}, status=404)
+
+        self.export_server.cancel(job.id)
+        return self._send_json(job.to_dict())
+
+    def log_message(self, format, *args):
+        """Logs the requests to the debug level, instead of stderr"""
+        logging.debug('Export server: ' + format % args)
+
+    def _get_job(self, parts):
+        """Returns the job of a /jobs/{id} path"""
+        if len(parts) < 2 or parts[0] != 'jobs':
+            return None
+        return self.export_server.get_job(parts[1])
+
+    def _send_json(self, values, status=200):
+        """Sends a JSON response"""
+        content = json.dumps(values).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+# ______________________________________________________________________________________________________________________
+# CLIENT
+
+def submit_job(settings, priority=0, project=None, address=None) -> str:
+    """Submits a job to an export server
+
+    Args:
+        settings (dict): Exporter settings, see export_shards.get_exporter_settings
+        priority (int): Jobs with a higher priority run first
+        project (str): Project the job was made for
+        address (str): URL of the server. Defaults to the configured host and port
+
+    Returns:
+        str: ID of the job
+
+    """
+    content = json.dumps({'settings': settings, 'priority': priority, 'project': project}).encode('utf-8')
+    request = urllib.request.Request(_get_url(address, 'jobs'), data=content, method='POST', headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(request) as response:
+        return json.loads(response.read())['id']
+
+def get_job_status(job_id, address=None) -> dict:
+    """Returns the status of a job, see ExportJob.to_dict"""
+    with urllib.request.urlopen(_get_url(address, 'jobs', job_id)) as response:
+        return json.loads(response.read())
+
+def cancel_job(job_id, address=None) -> dict:
+    """Cancels a job, and returns its status"""
+    request = urllib.request.Request(_get_url(address, 'jobs', job_id), method='DELETE')
+    with urllib.request.urlopen(request) as response:
+        return json.loads(response.read())
+
+def stream_events(job_id, address=None):
+    """Yields the events of a job as they happen, until it finished
+
+    Args:
+        job_id (str): ID of the job
+        address (str): URL of the server. Defaults to the configured host and port
+
+    Yields:
+        dict: Event, ie: ``{'type': 'progress', 'job': '0', 'current': 1000, 'total': 5000, 'time': 1700000000.0}``
+
+    """
+    with urllib.request.urlopen(_get_url(address, 'jobs', job_id, 'events')) as response:
+        for line in response:
+            if line.strip():
+                yield json.loads(line)
+
+def _get_url(address, *parts) -> str:
+    """Returns the URL of an API path"""
+    address = address or 'http://{}:{}'.format(config.SERVER_HOST, config.SERVER_PORT)
+    return '/'.join([address.rstrip('/')] + list(parts))
+
+def main(args=None) -> int:
+    """Command line entry point, runs a server until interrupted
+
+    Args:
+        args (list): Arguments. Defaults to sys.argv
+
+    Returns:
+        int: Exit code
+
+    """
+    parser = argparse.ArgumentParser(description='Runs an export server for the current project')
+    parser.add_argument('--host', default=config.SERVER_HOST)
+    parser.add_argument('--port', type=int, default=config.SERVER_PORT)
+    parser.add_argument('--jobs', type=int, default=config.SERVER_MAX_CONCURRENT_JOBS, help='Number of jobs run at once')
+    parser.add_argument('--retention', type=int, default=config.SERVER_JOB_RETENTION, help='Number of finished jobs kept')
+    args = parser.parse_args(args)
+
+    server = ExportServer(host=args.host, port=args.port, max_concurrent_jobs=args.jobs, job_retention=args.retention)
+    server.start()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.stop()
+
+    return 0
+
+# ______________________________________________________________________________________________________________________
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,349 @@
+#!/usr/bin/env python
+"""
+    Name:           export_shards.py
+    Description:    Sharded exports: a job is split into shards, each a range of a scatterer's instances, exported by
+                    independent batch processes (ie: cnode on farm nodes) and merged into the final files
+
+    Usage:
+        job_path = export_shards.write_job(exporter)    # From a configured ScattererToAss
+        # Each shard, from the job's 'commands':        cnode <project> -script export_shards.py -args run <job> <shard>
+        # Once all shards completed:                    cnode <project> -script export_shards.py -args merge <job>
+
+        export_shards.run_locally(job_path)             # Runs the shards as local subprocesses, then merges them
+
+    Layout:
+        {job_dir}/job.json                  Exporter settings, evaluated frame, shards and their commands
+        {job_dir}/shard_{index}/            Part files of a shard, one per export file
+        {job_dir}/shard_{index}.json        Shard manifest, written once the shard completed
+
+"""
+# System Imports
+import os
+import sys
+import logging
+import json
+import shutil
+import subprocess
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+# Third-Party Imports
+import ix
+import numpy as np
+
+# Local Imports
+from scatterertoarnold.lib import libclarisse
+from scatterertoarnold.core import clarisse_exporter
+from scatterertoarnold.configs import config
+
+# ______________________________________________________________________________________________________________________
+
+# Exporter attributes saved in the job, objects are saved by their full name
+SETTINGS = [
+    'scatterers', 'geometries', 'grouping', 'extra_groupings',
+    'selection_type', 'selection_boxes', 'selection_sets', 'selection_expression',
+    'selection_cameras', 'frustum_frame_range', 'frustum_padding', 'frustum_use_bounding_radius', 'frustum_aspect_ratio',
+    'selection_mask_path', 'selection_mask_extent', 'selection_mask_plane', 'selection_mask_mode',
+    'selection_mask_threshold', 'selection_mask_seed', 'selection_mask_invert',
+    'selection_reference_objects', 'selection_distance', 'selection_distance_mode',
+    'lod_reference', 'culling', 'duplicate_tolerance', 'overlap_tolerance',
+    'min_instance_size', 'min_screen_size', 'size_camera',
+    'thinning_method', 'thinning_fraction', 'thinning_radius', 'write_preview', 'motion_samples', 'motion_start', 'motion_end', 'frame_range',
+    'use_scan_cache', 'incremental', 'skip_identical', 'checkpoint', 'buffer_budget', 'export_dir', 'export_file_name', 'ASS_NODE_TYPES',
+]
+
+def get_shards(scatterers, shard_size=config.DEFAULT_SHARD_SIZE) -> list:
+    """Splits the instances of the scatterers into shards
+
+    Args:
+        scatterers (list): SceneObjectScatterers to export, in order
+        shard_size (int): Maximum number of a scatterer's instances in one shard
+
+    Returns:
+        list: Shards, in export order. ie: ``{'scatterer': full name, 'start': 0, 'stop': shard_size}``
+
+    """
+    shards = []
+    for scatterer in scatterers:
+        instance_count = scatterer.get_module().get_instance_count()
+        for start in range(0, instance_count, shard_size):
+            shards.append({'scatterer': scatterer.get_full_name(), 'start': start, 'stop': min(start + shard_size, instance_count)})
+
+    return shards
+
+def get_exporter_settings(exporter) -> dict:
+    """Returns the settings of an exporter, as JSON serializable values
+
+    Args:
+        exporter (ScattererToAss): Configured exporter
+
+    Returns:
+        dict: key: attribute name, value: encoded value
+
+    """
+    return {name: _encode(getattr(exporter, name)) for name in SETTINGS}
+
+def create_exporter(settings) -> clarisse_exporter.ScattererToAss:
+    """Returns an exporter from saved settings. The objects are found in the current project
+
+    Args:
+        settings (dict): Settings, from get_exporter_settings
+
+    Returns:
+        ScattererToAss: Configured exporter
+
+    """
+    exporter = clarisse_exporter.ScattererToAss()
+    for name in SETTINGS:
+        if name in settings:
+            setattr(exporter, name, _decode(settings[name]))
+
+    return exporter
+
+def write_job(exporter, job_dir=None, shard_size=config.DEFAULT_SHARD_SIZE) -> str:
+    """Writes the job of a sharded export
+
+    Args:
+        exporter (ScattererToAss): Configured exporter
+        job_dir (str): Job directory. Defaults to a directory next to the exported files
+        shard_size (int): Maximum number of a scatterer's instances in one shard
+
+    Raises:
+        ValueError: The exporter's settings are invalid, or cannot be sharded
+
+    Returns:
+        str: Path to the job file
+
+    """
+    errors, warnings = exporter.run_shard_pre_validation()
+    if errors:
+        raise ValueError('Invalid sharded export: {}'.format(', '.join(errors)))
+    for warning in warnings:
+        logging.warning(warning)
+
+    if job_dir is None:
+        base_name = os.path.splitext(exporter.export_file_name)[0]
+        job_dir = os.path.join(exporter.export_dir, base_name + config.SHARD_DIR_SUFFIX)
+
+    # Parts of a previous job must not be merged
+    if os.path.isdir(job_dir):
+        shutil.rmtree(job_dir)
+    os.makedirs(job_dir)
+
+    job_path = os.path.join(job_dir, 'job.json')
+    project_path = ix.application.get_current_project_filename()
+    shards = get_shards(exporter.scatterers, shard_size=shard_size)
+    job = {
+        'version': config.SHARD_JOB_VERSION,
+        'project': project_path,
+        'frame': libclarisse.get_current_frame(),
+        'settings': get_exporter_settings(exporter),
+        'shards': shards,
+        'commands': [_format_command(config.SHARD_COMMAND, project_path, job_path, index) for index in range(len(shards))],
+        'merge_command': _format_command(config.MERGE_COMMAND, project_path, job_path),
+    }
+    _write_json(job_path, job)
+    logging.info('Sharded export job written to {}: {} shards'.format(job_path, len(shards)))
+    return job_path
+
+def read_job(job_path) -> dict:
+    """Returns a job written by write_job
+
+    Args:
+        job_path (str): Path to the job file
+
+    Raises:
+        ValueError: The job is from another version
+
+    Returns:
+        dict: Job
+
+    """
+    with open(job_path, 'r') as f:
+        job = json.load(f)
+
+    if job.get('version') != config.SHARD_JOB_VERSION:
+        raise ValueError('Invalid job version. Provided: {}. Valid: {}'.format(job.get('version'), config.SHARD_JOB_VERSION))
+
+    return job
+
+def get_part_dir(job_path, shard_index) -> str:
+    """Returns the directory of a shard's part files"""
+    return os.path.join(os.path.dirname(job_path), 'shard_{:05d}'.format(shard_index))
+
+def get_shard_manifest_path(job_path, shard_index) -> str:
+    """Returns the path of a shard's manifest"""
+    return get_part_dir(job_path, shard_index) + '.json'
+
+def run_shard(job_path, shard_index) -> str:
+    """Exports one shard of a job. The scatterer's project must be loaded
+
+    Args:
+        job_path (str): Path to the job file
+        shard_index (int): Index of the shard in the job
+
+    Returns:
+        str: Path to the shard's manifest
+
+    """
+    job = read_job(job_path)
+    shard = job['shards'][shard_index]
+    exporter = create_exporter(job['settings'])
+
+    # Evaluate the scene at the frame of the session that wrote the job, not the project's saved frame
+    libclarisse.set_current_frame(job['frame'])
+
+    part_dir = get_part_dir(job_path, shard_index)
+    if os.path.isdir(part_dir):
+        shutil.rmtree(part_dir)
+
+    shard_manifest = exporter.export_shard(
+        ix.get_item(shard['scatterer']),
+        instance_range=(shard['start'], shard['stop']),
+        part_dir=part_dir
+        )
+    shard_manifest['shard'] = shard
+
+    # Written last, a shard without manifest did not complete
+    manifest_path = get_shard_manifest_path(job_path, shard_index)
+    _write_json(manifest_path, shard_manifest)
+    return manifest_path
+
+def merge(job_path, cleanup=True) -> list:
+    """Merges the part files of every shard of a job into the export files, in the shards' order
+
+    Args:
+        job_path (str): Path to the job file
+        cleanup (bool): If set, the job directory is removed once merged
+
+    Raises:
+        RuntimeError: A shard did not complete, or its part files are incomplete
+
+    Returns:
+        list: Summary strings
+
+    """
+    job = read_job(job_path)
+    shards = []
+    for shard_index in range(len(job['shards'])):
+        manifest_path = get_shard_manifest_path(job_path, shard_index)
+        if not os.path.isfile(manifest_path):
+            raise RuntimeError('Shard {} did not complete: {}'.format(shard_index, manifest_path))
+
+        with open(manifest_path, 'r') as f:
+            shard_manifest = json.load(f)
+
+        part_dir = get_part_dir(job_path, shard_index)
+        for file_name, entry in shard_manifest['files'].items():
+            part_path = os.path.join(part_dir, file_name)
+            if not os.path.isfile(part_path) or os.path.getsize(part_path) != entry['size']:
+                raise RuntimeError('Part file of shard {} is incomplete: {}'.format(shard_index, part_path))
+
+        shards.append((part_dir, shard_manifest))
+
+    exporter = create_exporter(job['settings'])
+    summary = exporter.merge_shards(shards)
+
+    if cleanup:
+        shutil.rmtree(os.path.dirname(job_path))
+
+    return summary
+
+def run_locally(job_path, command=None, workers=config.LOCAL_SHARD_WORKERS, cleanup=True) -> list:
+    """Runs the shards of a job as local subprocesses, then merges them in this process
+
+    Args:
+        job_path (str): Path to the job file
+        command (list): Command template of a shard, formatted with ``{project}``, ``{script}``, ``{job}`` and
+            ``{shard}``. Defaults to config.SHARD_COMMAND
+        workers (int): Number of shards run at once
+        cleanup (bool): If set, the job directory is removed once merged
+
+    Raises:
+        RuntimeError: A shard failed
+
+    Returns:
+        list: Summary strings
+
+    """
+    job = read_job(job_path)
+    command = command or config.SHARD_COMMAND
+
+    def _run_shard(shard_index):
+        args = _format_command(command, job['project'], job_path, shard_index)
+        return subprocess.run(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(_run_shard, range(len(job['shards']))))
+
+    failed = [index for index, result in enumerate(results) if result.returncode != 0]
+    for index in failed:
+        logging.error('Shard {} failed:\n{}'.format(index, results[index].stderr))
+    if failed:
+        raise RuntimeError('{} shards failed: {}'.format(len(failed), failed))
+
+    return merge(job_path, cleanup=cleanup)
+
+def main(args=None) -> int:
+    """Command line entry point, run by the shard and merge commands
+
+    Args:
+        args (list): Arguments. Defaults to sys.argv
+
+    Returns:
+        int: Exit code
+
+    """
+    parser = argparse.ArgumentParser(description='Runs a step of a sharded export')
+    parser.add_argument('action', choices=['run', 'merge'])
+    parser.add_argument('job', help='Path to the job file')
+    parser.add_argument('shard', nargs='?', type=int, help='Index of the shard to run')
+    args = parser.parse_args(args)
+
+    if args.action == 'run':
+        if args.shard is None:
+            parser.error('run requires a shard index')
+        run_shard(args.job, args.shard)
+    else:
+        for line in merge(args.job):
+            print(line)
+
+    return 0
+
+def _format_command(command, project_path, job_path, shard_index=None) -> list:
+    """Returns a command from its template"""
+    values = {'project': project_path, 'script': os.path.abspath(__file__), 'job': job_path, 'shard': shard_index}
+    return [arg.format(**values) for arg in command]
+
+def _encode(value):
+    """Returns a JSON serializable value. Objects are replaced by their full name"""
+    if hasattr(value, 'get_full_name'):
+        return {'__item__': value.get_full_name()}
+    elif isinstance(value, dict):
+        return {key: _encode(item) for key, item in value.items()}
+    elif isinstance(value, (list, tuple, np.ndarray)):
+        return [_encode(item) for item in value]
+    elif isinstance(value, np.generic):
+        return value.item()
+    return value
+
+def _decode(value):
+    """Returns a value encoded by _encode. Objects are found in the current project"""
+    if isinstance(value, dict):
+        if '__item__' in value:
+            return ix.get_item(value['__item__'])
+        return {key: _decode(item) for key, item in value.items()}
+    elif isinstance(value, list):
+        return [_decode(item) for item in value]
+    return value
+
+def _write_json(path, values):
+    """Writes a JSON file at once, so readers never see half of it"""
+    with open(path + '.tmp', 'w') as f:
+        json.dump(values, f, indent=4)
+    os.replace(path + '.tmp', path)
+
+# ______________________________________________________________________________________________________________________
+
+if __name__ == '__main__':
+    sys.exit(main())
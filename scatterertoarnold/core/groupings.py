@@ -0,0 +1,377 @@
+#!/usr/bin/env python
+"""
+    Name:           groupings.py
+    Description:    Grouping strategies, splitting the instances of an export into files.
+                    Strategies are registered by name, and set to the exporter's grouping attribute
+
+    Usage:
+        # Custom strategies are registered once, ie: from a startup script, so batch processes find them too
+        groupings.register_grouping(groupings.TileGrouping('tile', 'One file per 500 units tile', tile_size=500,
+                                                           extent=(-5000, -5000, 5000, 5000)))
+        exporter.grouping = 'tile'
+
+"""
+# System Imports
+import os
+import sys
+import logging
+import re
+
+# Third-Party Imports
+import numpy as np
+
+# Local Imports
+from scatterertoarnold.lib import libclarisse
+from scatterertoarnold.configs import config
+
+# ______________________________________________________________________________________________________________________
+# STRATEGIES
+
+class Grouping():
+    """Base class of the grouping strategies. A grouping writes one file per key, ie: one per asset.
+
+    Subclasses return the keys of an export in get_keys, and the key of every instance of a table at once in
+    get_instance_keys, as indices in the keys. The exporter routes each instance with a lookup in these indices.
+    While an export runs, the keys and their indices are computed once, see get_export_keys and get_key_indices.
+    """
+
+    def __init__(self, name, label):
+        """Constructor.
+
+        Args:
+            name (str): Name of the grouping, set to the exporter's grouping attribute
+            label (str): Description shown in the GUI
+
+        """
+        super(Grouping, self).__init__()
+        self.name = name
+        self.label = label
+
+    def get_keys(self, exporter) -> list:
+        """Returns the keys of the export, one file is written per key
+
+        Args:
+            exporter (ScattererToAss): Exporter
+
+        Returns:
+            list: Unique keys (str), in file order
+
+        """
+        raise NotImplementedError
+
+    def get_export_keys(self, exporter) -> list:
+        """Returns the keys of get_keys. While an export runs, they are computed once for the whole export
+
+        Args:
+            exporter (ScattererToAss): Exporter
+
+        Returns:
+            list: Unique keys (str), in file order
+
+        """
+        return _get_cached(exporter, (self.name, 'keys'), lambda: self.get_keys(exporter))
+
+    def get_key_indices(self, exporter) -> dict:
+        """Returns the index of each key of the export, computed once while an export runs
+
+        Args:
+            exporter (ScattererToAss): Exporter
+
+        Returns:
+            dict: key: key, value: index in get_export_keys
+
+        """
+        return _get_cached(exporter, (self.name, 'key_indices'), lambda: {key: i for i, key in enumerate(self.get_export_keys(exporter))})
+
+    def get_instance_keys(self, exporter, scatterer, table) -> np.ndarray:
+        """Returns the key of each instance of a table
+
+        Args:
+            exporter (ScattererToAss): Exporter
+            scatterer (SceneObjectScatterer): Scatterer the instances come from
+            table (InstanceTable): Instances
+
+        Returns:
+            np.ndarray: (N,) Index of each instance's key in get_keys. -1 for instances not written
+
+        """
+        raise NotImplementedError
+
+    def get_scatterer_keys(self, exporter, scatterer, geometries) -> list:
+        """Returns the keys a scatterer's instances of some geometries may be written to.
+        Used to find the files to write again when a scatterer or a geometry changed
+
+        Args:
+            exporter (ScattererToAss): Exporter
+            scatterer (SceneObjectScatterer): Scatterer
+            geometries (list): Exported geometries of the scatterer
+
+        Returns:
+            list: Keys
+
+        """
+        return self.get_keys(exporter)
+
+    def get_file_name(self, exporter, key) -> str:
+        """Returns the file name of a key
+
+        Args:
+            exporter (ScattererToAss): Exporter
+            key (str): Key
+
+        Returns:
+            str: File name
+
+        """
+        return exporter.get_file_name_with_token(token=key)
+
+    def get_settings(self) -> dict:
+        """Returns the settings of the grouping, added to the fingerprint of its files"""
+        return {}
+
+
+class AllGrouping(Grouping):
+    """Writes every instance to the export file"""
+
+    def get_keys(self, exporter) -> list:
+        return ['']
+
+    def get_instance_keys(self, exporter, scatterer, table) -> np.ndarray:
+        return np.zeros(len(table), dtype=np.int64)
+
+    def get_file_name(self, exporter, key) -> str:
+        return exporter.export_file_name
+
+
+class ScattererKeyGrouping(Grouping):
+    """Base class of the groupings with one key per scatterer. Subclasses implement get_scatterer_key"""
+
+    def get_scatterer_key(self, exporter, scatterer) -> str:
+        """Returns the key of a scatterer's instances"""
+        raise NotImplementedError
+
+    def get_keys(self, exporter) -> list:
+        return _unique([self.get_scatterer_key(exporter, scatterer) for scatterer in exporter.scatterers])
+
+    def get_instance_keys(self, exporter, scatterer, table) -> np.ndarray:
+        key = _get_cached(exporter, (self.name, 'scatterer', scatterer), lambda: self.get_scatterer_key(exporter, scatterer))
+        return np.full(len(table), self.get_key_indices(exporter).get(key, -1), dtype=np.int64)
+
+    def get_scatterer_keys(self, exporter, scatterer, geometries) -> list:
+        return [self.get_scatterer_key(exporter, scatterer)]
+
+
+class GeometryKeyGrouping(Grouping):
+    """Base class of the groupings with one key per geometry. Subclasses implement get_geometry_key"""
+
+    def get_geometry_key(self, exporter, geometry) -> str:
+        """Returns the key of a geometry's instances"""
+        raise NotImplementedError
+
+    def get_keys(self, exporter) -> list:
+        return _unique([self._get_cached_geometry_key(exporter, geometry) for geometry in exporter.geometries])
+
+    def get_instance_keys(self, exporter, scatterer, table) -> np.ndarray:
+        # One lookup per geometry, then one per instance through its geometry index
+        key_indices = self.get_key_indices(exporter)
+        geometry_keys = [key_indices.get(self._get_cached_geometry_key(exporter, g), -1) for g in table.geometries]
+        return np.array(geometry_keys + [-1], dtype=np.int64)[table.geometry_indices]
+
+    def get_scatterer_keys(self, exporter, scatterer, geometries) -> list:
+        return _unique([self._get_cached_geometry_key(exporter, geometry) for geometry in geometries])
+
+    def _get_cached_geometry_key(self, exporter, geometry) -> str:
+        """Returns the key of a geometry, read once while an export runs"""
+        return _get_cached(exporter, (self.name, 'geometry', geometry), lambda: self.get_geometry_key(exporter, geometry))
+
+
+class ScattererGrouping(ScattererKeyGrouping):
+    """Writes the instances of each scatterer to their own file"""
+
+    def get_scatterer_key(self, exporter, scatterer) -> str:
+        return scatterer.get_name()
+
+
+class ContextGrouping(ScattererKeyGrouping):
+    """Writes the instances of the scatterers of each context to their own file, ie: one file per set dressing layer"""
+
+    def get_scatterer_key(self, exporter, scatterer) -> str:
+        context_name = scatterer.get_context().get_full_name().split('://')[-1]
+        return get_token(context_name) or 'project'
+
+
+class AssetGrouping(GeometryKeyGrouping):
+    """Writes the instances of each geometry to their own file"""
+
+    def get_geometry_key(self, exporter, geometry) -> str:
+        return geometry.get_name()
+
+
+class AttributeGrouping(GeometryKeyGrouping):
+    """Writes the instances of the geometries sharing the value of a custom attribute to their own file.
+    Geometries without value are grouped by their name"""
+
+    def __init__(self, name, label, attr_name):
+        """Constructor.
+
+        Args:
+            name (str): Name of the grouping
+            label (str): Description shown in the GUI
+            attr_name (str): Name of the geometries' string attribute
+
+        """
+        super(AttributeGrouping, self).__init__(name, label)
+        self.attr_name = attr_name
+
+    def get_geometry_key(self, exporter, geometry) -> str:
+        value = libclarisse.get_str_attribute(geometry, self.attr_name, use_cache=True)
+        return get_token(value or '') or geometry.get_name()
+
+    def get_settings(self) -> dict:
+        return {'attr_name': self.attr_name}
+
+
+class TileGrouping(Grouping):
+    """Writes the instances of each square tile of a world space area to their own file.
+    Instances outside of the area are written to the nearest tile"""
+
+    def __init__(self, name, label, tile_size, extent, plane=config.DEFAULT_MASK_PLANE):
+        """Constructor.
+
+        Args:
+            name (str): Name of the grouping
+            label (str): Description shown in the GUI
+            tile_size (float): World space size of the tiles
+            extent (tuple): (min_u, min_v, max_u, max_v) World space area covered by the tiles
+            plane (str): Plane on which the instances are projected. See mask_parser.PLANE_AXES
+
+        """
+        super(TileGrouping, self).__init__(name, label)
+        self.tile_size = float(tile_size)
+        self.extent = tuple(float(value) for value in extent)
+        self.plane = plane
+        self.tile_count = (
+            max(int(np.ceil((self.extent[2] - self.extent[0]) / self.tile_size)), 1),
+            max(int(np.ceil((self.extent[3] - self.extent[1]) / self.tile_size)), 1),
+        )
+
+    def get_keys(self, exporter) -> list:
+        return ['tile_{}_{}'.format(u, v) for v in range(self.tile_count[1]) for u in range(self.tile_count[0])]
+
+    def get_instance_keys(self, exporter, scatterer, table) -> np.ndarray:
+        axes = ['xyz'.index(axis) for axis in self.plane]
+        points = table.translations[:, axes]
+        tiles = np.floor((points - np.array(self.extent[:2])) / self.tile_size).astype(np.int64)
+        tiles = np.clip(tiles, 0, np.array(self.tile_count) - 1)
+        return tiles[:, 1] * self.tile_count[0] + tiles[:, 0]
+
+    def get_settings(self) -> dict:
+        return {'tile_size': self.tile_size, 'extent': self.extent, 'plane': self.plane}
+
+
+class CallableGrouping(Grouping):
+    """Groups the instances with custom functions"""
+
+    def __init__(self, name, label, keys_function, instance_keys_function):
+        """Constructor.
+
+        Args:
+            name (str): Name of the grouping
+            label (str): Description shown in the GUI
+            keys_function (callable): Returns the keys of an export. Called with the exporter
+            instance_keys_function (callable): Returns the (N,) key of each instance of a table.
+                Called with the exporter, the scatterer and the table
+
+        """
+        super(CallableGrouping, self).__init__(name, label)
+        self.keys_function = keys_function
+        self.instance_keys_function = instance_keys_function
+
+    def get_keys(self, exporter) -> list:
+        return _unique([str(key) for key in self.keys_function(exporter)])
+
+    def get_instance_keys(self, exporter, scatterer, table) -> np.ndarray:
+        values = np.asarray(self.instance_keys_function(exporter, scatterer, table)).astype(str)
+        return get_key_indices(self.get_key_indices(exporter), values)
+
+# ______________________________________________________________________________________________________________________
+# REGISTRY
+
+_groupings = {}
+
+def register_grouping(grouping):
+    """Registers a grouping strategy, replacing any grouping of the same name. It is listed in the GUI
+
+    Args:
+        grouping (Grouping): Grouping strategy
+
+    """
+    _groupings[grouping.name] = grouping
+    config.GROUPINGS[grouping.name] = grouping.label
+
+def get_grouping(name) -> Grouping:
+    """Returns a registered grouping strategy
+
+    Args:
+        name (str): Name of the grouping
+
+    Raises:
+        ValueError: The grouping is not registered
+
+    Returns:
+        Grouping: Grouping strategy
+
+    """
+    if name not in _groupings:
+        raise ValueError('Invalid grouping method. Provided: {}. Valid: {}'.format(name, str(get_grouping_names())))
+    return _groupings[name]
+
+def get_grouping_names() -> list:
+    """Returns the names of the registered groupings"""
+    return list(_groupings.keys())
+
+def get_key_indices(keys, values) -> np.ndarray:
+    """Returns the index of each value in the keys. Each unique value is looked up once
+
+    Args:
+        keys (list|dict): Keys, or the index of each key
+        values (np.ndarray): (N,) Values
+
+    Returns:
+        np.ndarray: (N,) Index of each value in the keys. -1 if not found
+
+    """
+    if len(values) == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    if not isinstance(keys, dict):
+        keys = {key: i for i, key in enumerate(keys)}
+    unique_values, inverse = np.unique(values, return_inverse=True)
+    unique_indices = np.array([keys.get(value, -1) for value in unique_values], dtype=np.int64)
+    return unique_indices[inverse.reshape(-1)]
+
+def get_token(value) -> str:
+    """Returns a value usable in a file name"""
+    return re.sub(r'[^\w\-.]+', '_', str(value)).strip('_')
+
+def _unique(keys) -> list:
+    """Returns the keys without duplicates, in order"""
+    return list(dict.fromkeys(keys))
+
+def _get_cached(exporter, key, query):
+    """Returns a value computed once per export, stored in the exporter's grouping_cache.
+    Outside of an export the cache is None, and the value is computed on every call"""
+    cache = exporter.grouping_cache
+    if cache is None:
+        return query()
+    if key not in cache:
+        cache[key] = query()
+    return cache[key]
+
+register_grouping(AllGrouping('all', config.GROUPINGS['all']))
+register_grouping(ScattererGrouping('scatterer', config.GROUPINGS['scatterer']))
+register_grouping(AssetGrouping('asset', config.GROUPINGS['asset']))
+register_grouping(AttributeGrouping('asset_code', config.GROUPINGS['asset_code'], attr_name=config.ATTR_ASSET_CODE))
+register_grouping(ContextGrouping('context', config.GROUPINGS['context']))
+
+# ______________________________________________________________________________________________________________________
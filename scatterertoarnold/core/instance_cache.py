@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+"""
+    Name:           instance_cache.py
+    Description:    Binary instance cache format, read as memory-mapped arrays
+
+    Format:
+        {base_path}.json                    Sidecar: format version, instance count, name tables and any metadata
+        {base_path}.matrices.npy            (N, 4, 4) float64 matrices, in the .ass layout
+        {base_path}.geometry_indices.npy    (N,) int64 index of each instance's geometry in the sidecar's geometries
+        {base_path}.ids.npy                 (N,) <U32 location hash of each instance
+
+    This module only depends on NumPy, so external tools (QC scripts, statistics) can read caches without Clarisse.
+
+"""
+# System Imports
+import os
+import sys
+import logging
+import json
+
+# Third-Party Imports
+import numpy as np
+
+# Local Imports
+
+# ______________________________________________________________________________________________________________________
+
+FORMAT_VERSION = 1
+ARRAY_NAMES = ['matrices', 'geometry_indices', 'ids']
+
+def get_array_path(base_path, array_name) -> str:
+    """Returns the path of one of the cache's arrays
+
+    Args:
+        base_path (str): Path of the cache, without extension
+        array_name (str): Name of the array, from ARRAY_NAMES
+
+    Returns:
+        str: .npy file path
+
+    """
+    return f'{base_path}.{array_name}.npy'
+
+def get_sidecar_path(base_path) -> str:
+    """Returns the path of the cache's JSON sidecar
+
+    Args:
+        base_path (str): Path of the cache, without extension
+
+    Returns:
+        str: .json file path
+
+    """
+    return f'{base_path}.json'
+
+def write_instance_cache(base_path, scatterer_name, geometries, geometry_indices, matrices, ids, **metadata):
+    """Writes an instance cache. The sidecar is written last, so a cache without sidecar is incomplete and ignored
+
+    Args:
+        base_path (str): Path of the cache, without extension
+        scatterer_name (str): Name of the scatterer the instances come from
+        geometries (list): Full names of the geometries, indexed by ``geometry_indices``
+        geometry_indices (np.ndarray): (N,) Index of each instance's geometry
+        matrices (np.ndarray): (N, 4, 4) Matrix of each instance
+        ids (np.ndarray): (N,) Location hash of each instance
+        **metadata: JSON serializable values saved in the sidecar, ie: fingerprints
+
+    """
+    os.makedirs(os.path.dirname(base_path), exist_ok=True)
+    arrays = {
+        'matrices': np.asarray(matrices, dtype=np.float64),
+        'geometry_indices': np.asarray(geometry_indices, dtype=np.int64),
+        'ids': np.asarray(ids, dtype='<U32'),
+    }
+
+    # Remove the sidecar first, readers never see arrays from two different writes
+    sidecar_path = get_sidecar_path(base_path)
+    if os.path.exists(sidecar_path):
+        os.remove(sidecar_path)
+
+    for array_name, array in arrays.items():
+        temp_path = get_array_path(base_path, array_name) + '.tmp'
+        with open(temp_path, 'wb') as f:
+            np.save(f, array)
+        os.replace(temp_path, get_array_path(base_path, array_name))
+
+    sidecar = dict(metadata)
+    sidecar.update({
+        'version': FORMAT_VERSION,
+        'count': len(arrays['geometry_indices']),
+        'scatterer_name': scatterer_name,
+        'geometries': list(geometries),
+    })
+    with open(sidecar_path + '.tmp', 'w') as f:
+        json.dump(sidecar, f, indent=4)
+    os.replace(sidecar_path + '.tmp', sidecar_path)
+
+def read_sidecar(base_path):
+    """Returns the sidecar of a cache, without reading its arrays
+
+    Args:
+        base_path (str): Path of the cache, without extension
+
+    Returns:
+        None|dict: Sidecar values, None if the cache is missing, incomplete or from another format version
+
+    """
+    sidecar_path = get_sidecar_path(base_path)
+    if not os.path.isfile(sidecar_path):
+        return None
+
+    try:
+        with open(sidecar_path, 'r') as f:
+            sidecar = json.load(f)
+    except (OSError, ValueError) as e:
+        logging.warning('Could not read instance cache {}: {}'.format(sidecar_path, e))
+        return None
+
+    if sidecar.get('version') != FORMAT_VERSION:
+        return None
+
+    return sidecar
+
+def read_instance_cache(base_path, mmap_mode='r'):
+    """Reads an instance cache. Arrays are memory-mapped, so only the pages used are read from disk
+
+    Args:
+        base_path (str): Path of the cache, without extension
+        mmap_mode (str): 'r' for read-only arrays, 'c' for copy-on-write arrays that can be edited in memory
+
+    Returns:
+        None|dict, dict: Sidecar values, and arrays by name. None if the cache is missing or incomplete
+
+    """
+    sidecar = read_sidecar(base_path)
+    if sidecar is None:
+        return None, {}
+
+    try:
+        arrays = {name: np.load(get_array_path(base_path, name), mmap_mode=mmap_mode) for name in ARRAY_NAMES}
+    except (OSError, ValueError) as e:
+        logging.warning('Could not read instance cache {}: {}'.format(base_path, e))
+        return None, {}
+
+    if any(len(array) != sidecar.get('count') for array in arrays.values()):
+        return None, {}
+
+    return sidecar, arrays
+
+# ______________________________________________________________________________________________________________________
@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+"""
+    Name:           instance_culling.py
+    Description:    Culling functions removing redundant instances from an InstanceTable
+
+"""
+# System Imports
+import os
+import sys
+import logging
+
+# Third-Party Imports
+import numpy as np
+
+# Local Imports
+from scatterertoarnold.core import spatial_hash
+
+# ______________________________________________________________________________________________________________________
+
+def get_duplicate_mask(table, tolerance) -> np.ndarray:
+    """
+    Returns the mask of the instances to keep, removing instances of the same geometry closer than the tolerance.
+    The first instance of each group of duplicates is kept.
+
+    Args:
+        table (InstanceTable): Instances to test
+        tolerance (float): Distance under which two instances are duplicates
+
+    Returns:
+        np.ndarray: (N,) Boolean mask of the instances to keep
+
+    """
+    keep = np.ones(len(table), dtype=bool)
+    translations = table.translations
+    tolerance = max(tolerance, 1e-9)
+    for geometry_index in np.unique(table.geometry_indices):
+        instances = np.flatnonzero(table.geometry_indices == geometry_index)
+        points = translations[instances]
+        grid = spatial_hash.SpatialHash(points, cell_size=tolerance)
+        first, second = _get_pairs(grid, points, radius=tolerance)
+        keep[instances] = resolve_conflicts(len(instances), first, second)
+
+    return keep
+
+def get_overlap_mask(table, radii, tolerance) -> np.ndarray:
+    """
+    Returns the mask of the instances to keep, thinning instances of the same geometry whose bounding spheres overlap.
+    Two instances overlap if their distance is under ``tolerance * (radius_a + radius_b)``.
+    Instances are kept in order, any instance overlapping an already kept one is removed.
+
+    Args:
+        table (InstanceTable): Instances to test
+        radii (np.ndarray): (N,) World space bounding radius of each instance
+        tolerance (float): Factor applied to the sum of the radii. ie: 0.5 allows spheres to overlap up to half of them
+
+    Returns:
+        np.ndarray: (N,) Boolean mask of the instances to keep
+
+    """
+    keep = np.ones(len(table), dtype=bool)
+    translations = table.translations
+    for geometry_index in np.unique(table.geometry_indices):
+        instances = np.flatnonzero(table.geometry_indices == geometry_index)
+        points = translations[instances]
+        geometry_radii = radii[instances]
+
+        # The grid is sized by the geometry's largest bounding radius
+        max_distance = tolerance * 2 * geometry_radii.max()
+        if max_distance <= 0:
+            continue
+
+        grid = spatial_hash.SpatialHash(points, cell_size=max_distance)
+        first, second = _get_pairs(grid, points, radius=max_distance)
+        distances = np.linalg.norm(points[first] - points[second], axis=1)
+        overlapping = distances < tolerance * (geometry_radii[first] + geometry_radii[second])
+        keep[instances] = resolve_conflicts(len(instances), first[overlapping], second[overlapping])
+
+    return keep
+
+def get_fraction_mask(values, fraction) -> np.ndarray:
+    """
+    Returns the mask of the items to keep, keeping a fraction of them from stable per-item values.
+    The subset kept with a lower fraction is always included in the subset kept with a higher one.
+
+    Args:
+        values (np.ndarray): (N,) Uniformly distributed values in [0, 1), ie: from hashed IDs
+        fraction (float): Fraction of items to keep, in [0, 1]
+
+    Returns:
+        np.ndarray: (N,) Boolean mask of the items to keep
+
+    """
+    return np.asarray(values) < fraction
+
+def get_thinning_mask(points, radius, priorities=None) -> np.ndarray:
+    """
+    Returns the mask of the points to keep so that no two kept points are closer than the radius (Poisson-disc).
+
+    Args:
+        points (np.ndarray): (N, 3) Points to thin
+        radius (float): Minimum distance between two kept points
+        priorities (np.ndarray): (N,) Order in which the points are kept. Uses the points' order if not set
+
+    Returns:
+        np.ndarray: (N,) Boolean mask of the points to keep
+
+    """
+    if radius <= 0 or not len(points):
+        return np.ones(len(points), dtype=bool)
+
+    order = np.arange(len(points)) if priorities is None else np.argsort(priorities, kind='stable')
+    points = np.asarray(points, dtype=np.float64)[order]
+    grid = spatial_hash.SpatialHash(points, cell_size=radius)
+    first, second = _get_pairs(grid, points, radius=radius)
+
+    keep = np.empty(len(points), dtype=bool)
+    keep[order] = resolve_conflicts(len(points), first, second)
+    return keep
+
+def resolve_conflicts(count, first, second) -> np.ndarray:
+    """
+    Greedily keeps items in index order, removing any item conflicting with an item already kept.
+
+    The sequential greedy is resolved in vectorized rounds: an item with no kept conflicting item of lower index is
+    certainly kept, so every item conflicting with it is removed. The lowest remaining conflicting item is always such an
+    anchor, so each round makes progress.
+
+    Args:
+        count (int): Number of items
+        first (np.ndarray): (P,) Lower index of each conflicting pair
+        second (np.ndarray): (P,) Higher index of each conflicting pair
+
+    Returns:
+        np.ndarray: (count,) Boolean mask of the items to keep
+
+    """
+    keep = np.ones(count, dtype=bool)
+    while len(first):
+        # Only pairs of items still kept matter
+        valid = keep[first] & keep[second]
+        first = first[valid]
+        second = second[valid]
+        if not len(first):
+            break
+
+        has_lower_conflict = np.zeros(count, dtype=bool)
+        has_lower_conflict[second] = True
+        anchored = ~has_lower_conflict[first]
+        keep[second[anchored]] = False
+
+    return keep
+
+def _get_pairs(grid, points, radius):
+    """Returns every pair of points closer than the radius, as (lower index, higher index) arrays"""
+    first = []
+    second = []
+    for query_indices, ref_indices, distances in grid.query_pairs(points, radius):
+        lower = query_indices < ref_indices
+        first.append(query_indices[lower])
+        second.append(ref_indices[lower])
+
+    if not first:
+        return np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+
+    return np.concatenate(first), np.concatenate(second)
+
+# ______________________________________________________________________________________________________________________
@@ -0,0 +1,529 @@
+#!/usr/bin/env python
+"""
+    Name:           instance_table.py
+    Description:    Batch representation of a scatterer's instances, as NumPy arrays
+
+"""
+# System Imports
+import os
+import sys
+import logging
+import hashlib
+import threading
+from collections import OrderedDict
+
+# Third-Party Imports
+import numpy as np
+
+# Local Imports
+from scatterertoarnold.lib import libclarisse
+from scatterertoarnold.configs import config
+
+# ______________________________________________________________________________________________________________________
+
+class InstanceTable():
+    """Class holding the instances of one scatterer as arrays.
+
+    Matrices are stored in the .ass layout (transposed from clarisse's layout), the translation being the last row.
+    """
+
+    def __init__(self, scatterer_name, geometries, geometry_indices, matrices, ids, motion_matrices=None, frame_rows=None, frame_matrices=None):
+        """Constructor.
+
+        Args:
+            scatterer_name (str): Name of the scatterer the instances come from
+            geometries (list): Geometry objects, indexed by ``geometry_indices``
+            geometry_indices (np.ndarray): (N,) Index of each instance's geometry in ``geometries``
+            matrices (np.ndarray): (N, 4, 4) Matrix of each instance
+            ids (np.ndarray): (N,) Location hash of each instance
+            motion_matrices (np.ndarray): (N, K, 4, 4) Matrix of each instance at each motion sample, see sample_motion. 
+                None without motion blur
+            frame_rows (np.ndarray): (N,) Row of each instance in the frame_matrices, see sample_frames. 
+                -1 for instances static over the frames. None without frames
+            frame_matrices (np.ndarray): (M, F, 4, 4) Matrix of each animated instance at each frame
+
+        """
+        super(InstanceTable, self).__init__()
+        self.scatterer_name = scatterer_name
+        self.geometries = geometries
+        self.geometry_indices = geometry_indices
+        self.matrices = matrices
+        self.ids = ids
+        self.motion_matrices = motion_matrices
+        self.frame_rows = frame_rows
+        self.frame_matrices = frame_matrices
+
+    def __len__(self):
+        """Returns the number of instances"""
+        return len(self.geometry_indices)
+
+    @property
+    def translations(self) -> np.ndarray:
+        """Returns the (N, 3) translations of the instances"""
+        return self.matrices[:, 3, :3]
+
+    @property
+    def geometry_names(self) -> list:
+        """Returns the names of the geometries, indexed by ``geometry_indices``"""
+        return [geometry.get_name() for geometry in self.geometries]
+
+    def get_id_values(self, seed=None) -> np.ndarray:
+        """Returns a stable value in [0, 1) for each instance, from the hash of its ID.
+        The same instance gets the same value on every run, whichever other instances are in the table.
+
+        Args:
+            seed (int): If set, the values are mixed with the seed, so each seed gives values independent from the 
+                unseeded ones and from other seeds
+
+        Returns:
+            np.ndarray: (N,) Values
+
+        """
+        if not len(self.ids):
+            return np.zeros(0, dtype=np.float64)
+
+        # Use the first 32 bits of each md5 digest
+        digests = np.frombuffer(bytes.fromhex(''.join(self.ids)), dtype='>u4').reshape(len(self.ids), 4)
+        if seed is None:
+            return digests[:, 0] / 2**32
+
+        # Mix the next 64 bits with the seed (splitmix64 finalizer). The uint64 products wrap around
+        values = (digests[:, 1].astype(np.uint64) << np.uint64(32)) | digests[:, 2].astype(np.uint64)
+        values ^= np.uint64(seed & 0xFFFFFFFFFFFFFFFF)
+        values ^= values >> np.uint64(30)
+        values *= np.uint64(0xBF58476D1CE4E5B9)
+        values ^= values >> np.uint64(27)
+        values *= np.uint64(0x94D049BB133111EB)
+        values ^= values >> np.uint64(31)
+        return (values >> np.uint64(11)) / 2**53
+
+    def get_bounding_radii(self, geometry_radii) -> np.ndarray:
+        """Returns the world space bounding radius of each instance, from its largest scale axis
+
+        Args:
+            geometry_radii (np.ndarray): (G,) Local bounding radius of each geometry in ``geometries``
+
+        Returns:
+            np.ndarray: (N,) Bounding radius of each instance
+
+        """
+        scales = np.linalg.norm(self.matrices[:, :3, :3], axis=2).max(axis=1)
+        return np.asarray(geometry_radii, dtype=np.float64)[self.geometry_indices] * scales
+
+    def get_moving_mask(self, tolerance=config.MOTION_STATIC_TOLERANCE) -> np.ndarray:
+        """Returns which instances move between their motion samples. Static instances only need one matrix
+
+        Args:
+            tolerance (float): Largest difference between two samples of a static instance's matrix
+
+        Returns:
+            np.ndarray: (N,) True for moving instances. All False without motion samples
+
+        """
+        if self.motion_matrices is None:
+            return np.zeros(len(self), dtype=bool)
+
+        deltas = np.abs(self.motion_matrices - self.motion_matrices[:, :1])
+        return deltas.max(axis=(1, 2, 3), initial=0) > tolerance
+
+    def subset(self, mask):
+        """Returns a new table with only the given instances
+
+        Args:
+            mask (np.ndarray): Boolean mask or indices of the instances to keep
+
+        Returns:
+            InstanceTable: Filtered table
+
+        """
+        return InstanceTable(
+            scatterer_name=self.scatterer_name,
+            geometries=self.geometries,
+            geometry_indices=self.geometry_indices[mask],
+            matrices=self.matrices[mask],
+            ids=self.ids[mask],
+            motion_matrices=None if self.motion_matrices is None else self.motion_matrices[mask],
+            frame_rows=None if self.frame_rows is None else self.frame_rows[mask],
+            frame_matrices=self.frame_matrices,
+        )
+
+    def copy(self):
+        """Returns a copy of the table, whose arrays can be edited without changing this table"""
+        return InstanceTable(
+            scatterer_name=self.scatterer_name,
+            geometries=list(self.geometries),
+            geometry_indices=self.geometry_indices.copy(),
+            matrices=self.matrices.copy(),
+            ids=self.ids.copy(),
+            motion_matrices=None if self.motion_matrices is None else self.motion_matrices.copy(),
+            frame_rows=None if self.frame_rows is None else self.frame_rows.copy(),
+            frame_matrices=None if self.frame_matrices is None else self.frame_matrices.copy(),
+        )
+
+    def select_geometries(self, geometries):
+        """Returns a new table with only the instances of the given geometries
+
+        Args:
+            geometries (list): Geometry objects to keep, all found in ``geometries``
+
+        Returns:
+            InstanceTable: Filtered table, indexed by the given geometries
+
+        """
+        if list(geometries) == self.geometries:
+            # Nothing to filter, the arrays are shared
+            return InstanceTable(self.scatterer_name, list(geometries), self.geometry_indices, self.matrices, self.ids, 
+                                 self.motion_matrices, self.frame_rows, self.frame_matrices)
+
+        old_to_new = np.full(len(self.geometries), -1, dtype=np.int64)
+        for i, geometry in enumerate(geometries):
+            old_to_new[self.geometries.index(geometry)] = i
+
+        geometry_indices = old_to_new[self.geometry_indices]
+        selected = geometry_indices >= 0
+        return InstanceTable(
+            scatterer_name=self.scatterer_name,
+            geometries=list(geometries),
+            geometry_indices=geometry_indices[selected],
+            matrices=self.matrices[selected],
+            ids=self.ids[selected],
+            motion_matrices=None if self.motion_matrices is None else self.motion_matrices[selected],
+            frame_rows=None if self.frame_rows is None else self.frame_rows[selected],
+            frame_matrices=self.frame_matrices,
+        )
+
+    def scale_geometries(self, geo_scales):
+        """Multiplies each instance's scale by the scale of its geometry.
+        Matrices are in the .ass layout, so the scale is applied to the first three rows.
+
+        Args:
+            geo_scales (np.ndarray): (G, 3) Scale of each geometry in ``geometries``
+
+        """
+        geo_scales = np.asarray(geo_scales, dtype=np.float64).reshape(-1, 3)
+        self.matrices[:, :3, :] *= geo_scales[self.geometry_indices][:, :, np.newaxis]
+        if self.motion_matrices is not None:
+            self.motion_matrices[:, :, :3, :] *= geo_scales[self.geometry_indices][:, np.newaxis, :, np.newaxis]
+        if self.frame_rows is not None:
+            animated = self.frame_rows >= 0
+            frame_scales = geo_scales[self.geometry_indices[animated]][:, np.newaxis, :, np.newaxis]
+            self.frame_matrices[self.frame_rows[animated], :, :3, :] *= frame_scales
+
+    def get_animated_mask(self) -> np.ndarray:
+        """Returns which instances move over the frames, see sample_frames
+
+        Returns:
+            np.ndarray: (N,) True for animated instances. All False without frames
+
+        """
+        if self.frame_rows is None:
+            return np.zeros(len(self), dtype=bool)
+        return self.frame_rows >= 0
+
+    def get_frame(self, index):
+        """Returns the table at one of its frames: the animated instances get their matrix at the frame
+
+        Args:
+            index (int): Index of the frame, in the frames sampled
+
+        Returns:
+            InstanceTable: Table at the frame
+
+        """
+        matrices = self.matrices.copy()
+        animated = self.get_animated_mask()
+        matrices[animated] = self.frame_matrices[self.frame_rows[animated], index]
+        return InstanceTable(self.scatterer_name, self.geometries, self.geometry_indices, matrices, self.ids)
+
+    def sample_frames(self, scatterer, frames, geometries=None, instance_range=None, tolerance=config.MOTION_STATIC_TOLERANCE, 
+                      cancel_event=None):
+        """Reads the matrices of the instances at each frame, and keeps the ones of the animated instances.
+        The table's matrices are the reference: instances matching them at every frame are static.
+        Each frame is set once, and all the instances are read at it. The current frame is restored after.
+
+        Args:
+            scatterer (SceneObjectScatterer): Scatterer the table was extracted from
+            frames (list): Frames to sample
+            geometries (list): Geometries the table was extracted with
+            instance_range (tuple): (start, stop) Instance range the table was extracted with
+            tolerance (float): Largest matrix difference of a static instance
+            cancel_event (threading.Event): Stops the sampling when set, leaving the frames unset
+
+        Raises:
+            ValueError: The scatterer's instances changed since the table was extracted
+
+        """
+        module = scatterer.get_module()
+        selected = self._get_selected_instances(scatterer, geometries, instance_range)[2]
+        if len(selected) != len(self):
+            raise ValueError('Invalid frame samples. The instances of {} changed since they were extracted'.format(self.scatterer_name))
+
+        # Only the matrices differing from the reference are kept, animated instances are usually a small fraction
+        changes = []
+        animated = np.zeros(len(self), dtype=bool)
+        current_frame = libclarisse.get_current_frame()
+        try:
+            for frame in frames:
+                libclarisse.set_current_frame(frame)
+                matrices = np.empty((len(selected), 4, 4), dtype=np.float64)
+                for row, i in enumerate(selected):
+                    if row % 1000 == 0 and cancel_event is not None and cancel_event.is_set():
+                        return
+
+                    matrix = module.get_instance_matrix(int(i))
+                    matrix.transpose()
+                    matrices[row] = libclarisse.get_matrix_array(str(matrix))
+
+                rows = np.flatnonzero(np.abs(matrices - self.matrices).max(axis=(1, 2), initial=0) > tolerance)
+                changes.append((rows, matrices[rows]))
+                animated[rows] = True
+        finally:
+            libclarisse.set_current_frame(current_frame)
+
+        frame_rows = np.full(len(self), -1, dtype=np.int64)
+        frame_rows[animated] = np.arange(np.count_nonzero(animated))
+        frame_matrices = np.repeat(self.matrices[animated][:, np.newaxis], len(frames), axis=1)
+        for index, (rows, matrices) in enumerate(changes):
+            frame_matrices[frame_rows[rows], index] = matrices
+
+        self.frame_rows = frame_rows
+        self.frame_matrices = frame_matrices
+
+    def sample_motion(self, scatterer, times, geometries=None, instance_range=None, cancel_event=None):
+        """Reads the matrices of the instances at each time, ie: sub-frames around the current frame for motion blur.
+        Each time is set once, and all the instances are read at it. The current frame is restored after.
+
+        Args:
+            scatterer (SceneObjectScatterer): Scatterer the table was extracted from
+            times (list): Frames to sample
+            geometries (list): Geometries the table was extracted with
+            instance_range (tuple): (start, stop) Instance range the table was extracted with
+            cancel_event (threading.Event): Stops the sampling when set, leaving motion_matrices unset
+
+        Raises:
+            ValueError: The scatterer's instances changed since the table was extracted
+
+        """
+        module = scatterer.get_module()
+        selected = self._get_selected_instances(scatterer, geometries, instance_range)[2]
+        if len(selected) != len(self):
+            raise ValueError('Invalid motion samples. The instances of {} changed since they were extracted'.format(self.scatterer_name))
+
+        motion_matrices = np.empty((len(selected), len(times), 4, 4), dtype=np.float64)
+        current_frame = libclarisse.get_current_frame()
+        try:
+            for sample, time in enumerate(times):
+                libclarisse.set_current_frame(time)
+                for row, i in enumerate(selected):
+                    if row % 1000 == 0 and cancel_event is not None and cancel_event.is_set():
+                        return
+
+                    matrix = module.get_instance_matrix(int(i))
+                    matrix.transpose()
+                    motion_matrices[row, sample] = libclarisse.get_matrix_array(str(matrix))
+        finally:
+            libclarisse.set_current_frame(current_frame)
+
+        self.motion_matrices = motion_matrices
+
+    @staticmethod
+    def _get_selected_instances(scatterer, geometries=None, instance_range=None):
+        """Returns the instances of a scatterer to extract
+
+        Args:
+            scatterer (SceneObjectScatterer): Scatterer to read
+            geometries (list): If set, only instances of these geometries are selected
+            instance_range (tuple): (start, stop) If set, only the scatterer's instances in this range are selected
+
+        Returns:
+            list: Geometries of the selected instances
+            np.ndarray: (M,) Index of each scatterer instance's geometry in the geometries. -1 if not selected
+            np.ndarray: (N,) Scatterer indices of the selected instances
+
+        """
+        # Map each base object to its geometry once, instead of once per instance
+        base_geometries = libclarisse.get_base_object_geometries(scatterer)
+
+        table_geometries = []
+        base_to_table = np.full(len(base_geometries), -1, dtype=np.int64)
+        for i, geometry in enumerate(base_geometries):
+            if geometries is not None and geometry not in geometries:
+                continue
+            if geometry not in table_geometries:
+                table_geometries.append(geometry)
+            base_to_table[i] = table_geometries.index(geometry)
+
+        geometry_indices = base_to_table[libclarisse.get_instance_base_indices(scatterer)]
+        selected = np.flatnonzero(geometry_indices >= 0)
+        if instance_range is not None:
+            start, stop = instance_range
+            selected = selected[(selected >= start) & (selected < stop)]
+
+        return table_geometries, geometry_indices, selected
+
+    @classmethod
+    def from_scatterer(cls, scatterer, geometries=None, instance_range=None, progress_callback=None, cancel_event=None):
+        """Extracts the instances of a scatterer.
+
+        Args:
+            scatterer (SceneObjectScatterer): Scatterer to read
+            geometries (list): If set, only instances of these geometries are extracted
+            instance_range (tuple): (start, stop) If set, only the scatterer's instances in this range are extracted
+            progress_callback (callable): Called with the number of instances read so far
+            cancel_event (threading.Event): Stops the extraction when set
+
+        Returns:
+            InstanceTable: Table of the scatterer's instances
+
+        """
+        module = scatterer.get_module()
+        scatterer_name = module.get_object_name().split('/')[-1]
+        instance_count = module.get_instance_count()
+        table_geometries, geometry_indices, selected = cls._get_selected_instances(scatterer, geometries, instance_range)
+
+        # Read the matrices of the selected instances
+        matrices = np.empty((len(selected), 4, 4), dtype=np.float64)
+        ids = np.empty(len(selected), dtype='<U32')
+        for row, i in enumerate(selected):
+            if row % 1000 == 0:
+                if cancel_event is not None and cancel_event.is_set():
+                    break
+                if progress_callback is not None:
+                    progress_callback(int(i))
+
+            matrix = module.get_instance_matrix(int(i))
+            matrix.transpose()
+
+            # We hash the location of the point to define its ID
+            matrix_str = str(matrix)
+            ids[row] = hashlib.md5(matrix_str.split('\n')[3].encode('utf-8')).hexdigest()
+            matrices[row] = libclarisse.get_matrix_array(matrix_str)
+
+        if progress_callback is not None:
+            progress_callback(instance_count)
+
+        return cls(
+            scatterer_name=scatterer_name,
+            geometries=table_geometries,
+            geometry_indices=geometry_indices[selected],
+            matrices=matrices,
+            ids=ids,
+        )
+
+class InstanceBatch():
+    """Class holding a batch of a scatterer's filtered instances, as yielded by ScattererToAss.iter_instance_batches.
+
+    The arrays are views of the scatterer's filtered table, valid until the next batch of the same scatterer.
+    """
+
+    def __init__(self, scatterer, table, start, keys, preview_mask=None, is_last=True):
+        """Constructor.
+
+        Args:
+            scatterer (SceneObjectScatterer): Scatterer the instances come from
+            table (InstanceTable): Instances of the batch
+            start (int): Index of the batch's first instance in the scatterer's filtered instances
+            keys (dict): key: grouping name, value: (N,) Index of each instance's key in the grouping's keys.
+                -1 for instances not written by the grouping
+            preview_mask (np.ndarray): (N,) Mask of the instances written to the preview files. None for all of them
+            is_last (bool): If set, this is the last batch of the scatterer
+
+        """
+        super(InstanceBatch, self).__init__()
+        self.scatterer = scatterer
+        self.table = table
+        self.start = start
+        self.keys = keys
+        self.preview_mask = preview_mask
+        self.is_last = is_last
+
+    def __len__(self):
+        """Returns the number of instances"""
+        return len(self.table)
+
+    @property
+    def matrices(self) -> np.ndarray:
+        """Returns the (N, 4, 4) matrices of the instances, in the .ass layout"""
+        return self.table.matrices
+
+    @property
+    def geometry_indices(self) -> np.ndarray:
+        """Returns the (N,) index of each instance's geometry in ``geometries``"""
+        return self.table.geometry_indices
+
+    @property
+    def geometries(self) -> list:
+        """Returns the geometry objects, indexed by ``geometry_indices``"""
+        return self.table.geometries
+
+    @property
+    def ids(self) -> np.ndarray:
+        """Returns the (N,) location hash of each instance"""
+        return self.table.ids
+
+class TableCache():
+    """Thread-safe in-memory cache of extracted InstanceTables, shared by the exports of one session.
+
+    Tables are stamped with the scatterer's full fingerprint, and the least recently used ones are dropped past max_tables.
+    Concurrent requests for the same scatterer wait for a single extraction.
+    """
+
+    def __init__(self, max_tables=config.DEFAULT_TABLE_CACHE_SIZE):
+        """Constructor.
+
+        Args:
+            max_tables (int): Maximum number of tables kept
+
+        """
+        super(TableCache, self).__init__()
+        self.max_tables = max_tables
+        self._tables = OrderedDict() # key: (scatterer, geometries), value: (fingerprint, InstanceTable)
+        self._key_locks = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        """Returns the number of cached tables"""
+        return len(self._tables)
+
+    def get(self, scatterer, geometries, extract, cancel_event=None, fingerprint=None):
+        """Returns a copy of the cached table of a scatterer, extracting it if missing or stale
+
+        Args:
+            scatterer (SceneObjectScatterer): Scatterer to read
+            geometries (list): Geometries whose instances are extracted
+            extract (callable): Returns the InstanceTable of the scatterer, if not cached
+            cancel_event (threading.Event): If set after the extraction, the partial table is not cached
+            fingerprint (str): Full fingerprint of the scatterer, see libclarisse.get_scatterer_fingerprint. Computed if not set
+
+        Returns:
+            InstanceTable: Copy of the table, which can be edited
+
+        """
+        key = (scatterer.get_full_name(), tuple(geometry.get_full_name() for geometry in geometries))
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            if fingerprint is None:
+                fingerprint = libclarisse.get_scatterer_fingerprint(scatterer, full=True)
+            with self._lock:
+                entry = self._tables.get(key)
+
+            if entry is not None and entry[0] == fingerprint:
+                table = entry[1]
+            else:
+                table = extract()
+                if cancel_event is not None and cancel_event.is_set():
+                    return table
+
+                with self._lock:
+                    self._tables[key] = (fingerprint, table)
+
+            with self._lock:
+                self._tables.move_to_end(key)
+                while len(self._tables) > self.max_tables:
+                    self._tables.popitem(last=False)
+
+        return table.copy()
+
+# ______________________________________________________________________________________________________________________
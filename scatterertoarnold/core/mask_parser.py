@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+"""
+    Name:           mask_parser.py
+    Description:    Parser functions for grayscale image masks projected on a world space plane
+
+"""
+# System Imports
+import os
+import sys
+import logging
+
+# Third-Party Imports
+import numpy as np
+from PySide2.QtGui import QImage
+
+# Local Imports
+from scatterertoarnold.configs import config
+
+# ______________________________________________________________________________________________________________________
+
+PLANE_AXES = {
+    'xy': (0, 1),
+    'xz': (0, 2),
+    'yz': (1, 2),
+}
+
+def get_default_mask_definition() -> dict:
+    """Returns the default mask definition dict
+
+    Returns:
+        dict: Default mask definition
+
+    """
+    mask_definition = {
+        'file_path': '', # Path to the mask file
+        'mask': np.array([]), # (H, W) Values in [0, 1], the first row being the top of the image
+        'axes': (0, 2), # World axes projected to the image's (u, v)
+        'extent': np.array([]), # (min_u, min_v, max_u, max_v) World space area covered by the image
+    }
+    return mask_definition
+
+def load_mask(file_path) -> np.ndarray:
+    """Loads a grayscale mask, from a .npy file or from any image format supported by Qt
+
+    Args:
+        file_path (str): Path to the mask
+
+    Returns:
+        np.ndarray: (H, W) Values in [0, 1]
+
+    """
+    if os.path.splitext(file_path)[-1].lower() == '.npy':
+        mask = np.load(file_path).astype(np.float32)
+        if mask.ndim == 3:
+            mask = mask.mean(axis=2)
+        if mask.max() > 1:
+            mask /= 255
+        return mask
+
+    image = QImage(file_path)
+    if image.isNull():
+        raise IOError('Could not load mask image: {}'.format(file_path))
+
+    # Read the pixels, rows are padded to 4 bytes
+    image = image.convertToFormat(QImage.Format_Grayscale8)
+    buffer = np.frombuffer(image.constBits(), dtype=np.uint8, count=image.bytesPerLine() * image.height())
+    mask = buffer.reshape(image.height(), image.bytesPerLine())[:, :image.width()]
+    return mask.astype(np.float32) / 255
+
+def get_mask_definition(file_path, extent, plane=config.DEFAULT_MASK_PLANE) -> dict:
+    """Loads the mask and defines where it lies in world space
+
+    Args:
+        file_path (str): Path to the mask
+        extent (tuple): (min_u, min_v, max_u, max_v) World space area covered by the image
+        plane (str): Plane on which the points are projected. See PLANE_AXES
+
+    Returns:
+        dict: mask definition with values
+
+    """
+    mask_def = get_default_mask_definition()
+    mask_def['file_path'] = file_path
+    mask_def['mask'] = load_mask(file_path)
+    mask_def['axes'] = PLANE_AXES[plane]
+    mask_def['extent'] = np.array(extent, dtype=np.float64)
+    return mask_def
+
+def sample_mask(points, mask) -> np.ndarray:
+    """
+    Bilinearly samples the mask at the projection of each point. Points outside of the extent get a value of 0
+
+    Args:
+        points (np.ndarray): (N, 3) Points to sample
+        mask (dict): Mask definition
+
+    Returns:
+        np.ndarray: (N,) Mask values in [0, 1]
+
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+    image = mask.get('mask')
+    height, width = image.shape
+    min_u, min_v, max_u, max_v = mask.get('extent')
+    u_axis, v_axis = mask.get('axes')
+
+    # Normalized coordinates, v is flipped as the first row is the top of the image
+    u = (points[:, u_axis] - min_u) / (max_u - min_u)
+    v = (max_v - points[:, v_axis]) / (max_v - min_v)
+    inside = (u >= 0) & (u <= 1) & (v >= 0) & (v <= 1)
+
+    # Pixel coordinates, from pixel centers
+    x = np.clip(u * width - 0.5, 0, width - 1)
+    y = np.clip(v * height - 0.5, 0, height - 1)
+    x0 = np.floor(x).astype(np.int64)
+    y0 = np.floor(y).astype(np.int64)
+    x1 = np.minimum(x0 + 1, width - 1)
+    y1 = np.minimum(y0 + 1, height - 1)
+    fx = x - x0
+    fy = y - y0
+
+    top = image[y0, x0] * (1 - fx) + image[y0, x1] * fx
+    bottom = image[y1, x0] * (1 - fx) + image[y1, x1] * fx
+    values = top * (1 - fy) + bottom * fy
+    return np.where(inside, values, 0.0)
+
+def get_points_in_mask(points, mask, threshold=config.DEFAULT_MASK_THRESHOLD, mode='threshold', random_values=None) -> np.ndarray:
+    """
+    Checks which points are kept by the mask
+
+    Args:
+        points (np.ndarray): (N, 3) Points to test
+        mask (dict): Mask definition
+        threshold (float): In 'threshold' mode, points with a mask value at or above it are kept
+        mode (str): 'threshold', or 'random' to keep each point with a probability equal to its mask value
+        random_values (np.ndarray): (N,) Random values in [0, 1) of the points, used by the 'random' mode. 
+            Drawn if not set
+
+    Returns:
+        np.ndarray: (N,) Boolean mask, True for kept points
+
+    """
+    values = sample_mask(points, mask)
+    if mode == 'random':
+        if random_values is None:
+            random_values = np.random.default_rng().random(len(values))
+        return random_values < values
+
+    return values >= threshold
+
+# ______________________________________________________________________________________________________________________
@@ -0,0 +1,304 @@
+#!/usr/bin/env python
+"""
+    Name:           scan_cache.py
+    Description:    On-disk cache of scatterer scans, stored next to the project to speed up relaunches and exports
+
+"""
+# System Imports
+import os
+import sys
+import logging
+import hashlib
+
+# Third-Party Imports
+import ix
+import numpy as np
+
+# Local Imports
+from scatterertoarnold.core import instance_cache, instance_table
+from scatterertoarnold.lib import libclarisse
+from scatterertoarnold.configs import config
+
+# ______________________________________________________________________________________________________________________
+
+def get_cache_dir(project_path) -> str:
+    """Returns the cache directory of a project, next to the project file
+
+    Args:
+        project_path (str): Path to the project file
+
+    Returns:
+        str: Cache directory path
+
+    """
+    project_name = os.path.splitext(os.path.basename(project_path))[0]
+    project_key = hashlib.md5(os.path.normpath(project_path).encode('utf-8')).hexdigest()[:8]
+    return os.path.join(os.path.dirname(project_path), config.SCAN_CACHE_DIR_NAME, f'{project_name}_{project_key}')
+
+class ScanCache():
+    """Class reading and writing the scans of a project's scatterers.
+
+    Each scatterer has an inventory .npz file (geometries and instance counts), and an instance cache (last InstanceTable
+    read, see instance_cache.py). Both are stamped with the project's mtime and the scatterer's fingerprint.
+    Inventories are validated lazily: an entry with a matching fingerprint is used right away, and if the project was
+    saved since, the entry is rebuilt once the GUI is shown. Entries whose fingerprint does not match are rebuilt too.
+    Tables are only used when both stamps match.
+    """
+
+    def __init__(self, project_path=None):
+        """Constructor.
+
+        Args:
+            project_path (str): Path to the project file. Uses the current project if not set
+
+        """
+        super(ScanCache, self).__init__()
+        if project_path is None:
+            project_path = ix.application.get_current_project_filename()
+        self.project_path = project_path
+        self.stale_scatterers = [] # Scatterers whose inventory was used, but must be rebuilt
+
+    @property
+    def enabled(self) -> bool:
+        """Returns if the cache can be used. Unsaved projects have no cache"""
+        return bool(self.project_path) and os.path.isfile(self.project_path)
+
+    @property
+    def cache_dir(self) -> str:
+        """Returns the cache directory of the project"""
+        return get_cache_dir(self.project_path)
+
+    @property
+    def project_mtime(self) -> float:
+        """Returns the modification time of the project file"""
+        return os.path.getmtime(self.project_path)
+
+    def get_entry_path(self, scatterer, kind) -> str:
+        """Returns the path of a scatterer's cache file
+
+        Args:
+            scatterer (SceneObjectScatterer): Cached scatterer
+            kind (str): 'inventory' for the .npz file, or 'table' for the instance cache's base path
+
+        Returns:
+            str: File path
+
+        """
+        scatterer_key = hashlib.md5(scatterer.get_full_name().encode('utf-8')).hexdigest()
+        base_path = os.path.join(self.cache_dir, f'{scatterer.get_name()}_{scatterer_key}.{kind}')
+        return base_path if kind == 'table' else base_path + '.npz'
+
+    # __________________________________________________________________________________________________________________
+    # INVENTORIES
+
+    def load_inventories(self, scatterers):
+        """Loads the cached inventories of the scatterers into libclarisse's SCENE_CACHE,
+        so the geometry inventory does not read the scene for them
+
+        Args:
+            scatterers (list): SceneObjectScatterers
+
+        """
+        for scatterer in scatterers:
+            inventory = self.get_inventory(scatterer)
+            if inventory is not None:
+                key = ('inventory', scatterer.get_full_name())
+                libclarisse.SCENE_CACHE.set(key, inventory, stamp=libclarisse.get_inventory_stamp(scatterer))
+
+    def get_inventory(self, scatterer, fingerprint=None):
+        """Returns the cached inventory of a scatterer
+
+        Args:
+            scatterer (SceneObjectScatterer): Cached scatterer
+            fingerprint (str): Current fingerprint of the scatterer, computed if not set
+
+        Returns:
+            None|list, np.ndarray: List of geometries, and (G,) instance count of each geometry
+
+        """
+        entry = self._read_entry(scatterer, kind='inventory', fingerprint=fingerprint)
+        if entry is None:
+            # An outdated entry is rewritten, else every launch would scan the scatterer again
+            if os.path.isfile(self.get_entry_path(scatterer, kind='inventory')):
+                self._set_stale(scatterer)
+            return None
+
+        # Used right away, but rebuilt once the project was saved since
+        if float(entry['project_mtime']) != self.project_mtime:
+            self._set_stale(scatterer)
+
+        try:
+            geometries = [ix.get_item(str(name)) for name in entry['geometries']]
+        except Exception:
+            self._set_stale(scatterer)
+            return None
+
+        return geometries, entry['counts']
+
+    def save_inventories(self, scatterers):
+        """Saves the inventory of each scatterer missing from the cache, or stale
+
+        Args:
+            scatterers (list): SceneObjectScatterers
+
+        """
+        for scatterer in scatterers:
+            path = self.get_entry_path(scatterer, kind='inventory')
+            if os.path.isfile(path) and scatterer not in self.stale_scatterers:
+                continue
+
+            geometries, counts = libclarisse.get_scatterer_inventory(scatterer)
+            self._write_entry(
+                path,
+                fingerprint=libclarisse.get_scatterer_fingerprint(scatterer),
+                geometries=np.array([geometry.get_full_name() for geometry in geometries], dtype=str),
+                counts=counts,
+                )
+
+    def rebuild_stale(self):
+        """Rebuilds the stale inventories. It reads every instance of the scatterers, so the GUI runs it in a worker 
+        thread, like the export
+
+        Returns:
+            list: Rebuilt scatterers
+            
+        """
+        scatterers = list(self.stale_scatterers)
+        for scatterer in scatterers:
+            libclarisse.invalidate_scene_cache('inventory', scatterer.get_full_name())
+        self.save_inventories(scatterers)
+        self.stale_scatterers = [s for s in self.stale_scatterers if s not in scatterers]
+        return scatterers
+
+    def _set_stale(self, scatterer):
+        """Flags a scatterer's inventory to be rebuilt"""
+        if scatterer not in self.stale_scatterers:
+            self.stale_scatterers.append(scatterer)
+
+    # __________________________________________________________________________________________________________________
+    # TABLES
+
+    def get_table(self, scatterer, geometries=None, fingerprint=None):
+        """Returns the cached InstanceTable of a scatterer, if the project and the scatterer did not change since.
+        Its arrays are memory-mapped copy-on-write, so they can be edited without touching the cache.
+
+        Args:
+            scatterer (SceneObjectScatterer): Cached scatterer
+            geometries (list): If set, only instances of these geometries are returned. The cache must hold all of them that
+                the scatterer uses
+            fingerprint (str): Full fingerprint of the scatterer, see libclarisse.get_scatterer_fingerprint. Computed if not set
+
+        Returns:
+            None|InstanceTable: Cached instances, without the geometries' scale
+
+        """
+        if not self.enabled:
+            return None
+
+        # Check the stamps from the sidecar, before mapping any array
+        base_path = self.get_entry_path(scatterer, kind='table')
+        sidecar = instance_cache.read_sidecar(base_path)
+        if sidecar is None or sidecar.get('project_path') != self.project_path:
+            return None
+        if sidecar.get('project_mtime') != self.project_mtime:
+            return None
+        if fingerprint is None:
+            fingerprint = libclarisse.get_scatterer_fingerprint(scatterer, full=True)
+        if sidecar.get('fingerprint') != fingerprint:
+            return None
+
+        sidecar, arrays = instance_cache.read_instance_cache(base_path, mmap_mode='c')
+        if sidecar is None:
+            return None
+
+        try:
+            table_geometries = [ix.get_item(name) for name in sidecar['geometries']]
+        except Exception:
+            return None
+
+        table = instance_table.InstanceTable(
+            scatterer_name=sidecar['scatterer_name'],
+            geometries=table_geometries,
+            geometry_indices=arrays['geometry_indices'],
+            matrices=arrays['matrices'],
+            ids=arrays['ids'],
+            )
+        if geometries is None:
+            return table
+
+        # Geometries of other scatterers are ignored, only a missing geometry of this scatterer is a miss
+        base_geometries = libclarisse.get_base_object_geometries(scatterer)
+        if any(geometry in base_geometries and geometry not in table_geometries for geometry in geometries):
+            return None
+
+        return table.select_geometries([geometry for geometry in table_geometries if geometry in geometries])
+
+    def save_table(self, scatterer, table, fingerprint=None):
+        """Saves the InstanceTable of a scatterer
+
+        Args:
+            scatterer (SceneObjectScatterer): Scatterer the table was read from
+            table (InstanceTable): Instances, without the geometries' scale
+            fingerprint (str): Full fingerprint of the scatterer, see libclarisse.get_scatterer_fingerprint. Computed if not set
+
+        """
+        if not self.enabled:
+            return
+
+        if fingerprint is None:
+            fingerprint = libclarisse.get_scatterer_fingerprint(scatterer, full=True)
+
+        try:
+            instance_cache.write_instance_cache(
+                self.get_entry_path(scatterer, kind='table'),
+                scatterer_name=table.scatterer_name,
+                geometries=[geometry.get_full_name() for geometry in table.geometries],
+                geometry_indices=table.geometry_indices,
+                matrices=table.matrices,
+                ids=table.ids,
+                project_path=self.project_path,
+                project_mtime=self.project_mtime,
+                scatterer=scatterer.get_full_name(),
+                fingerprint=fingerprint,
+                )
+        except OSError as e:
+            # ie: the previous cache is still mapped by another export
+            logging.warning('Could not save instance cache of {}: {}'.format(scatterer.get_full_name(), e))
+
+    # __________________________________________________________________________________________________________________
+    # FILES
+
+    def _read_entry(self, scatterer, kind, fingerprint=None):
+        """Returns a cache entry if its fingerprint matches the scatterer's, else None"""
+        if not self.enabled:
+            return None
+
+        path = self.get_entry_path(scatterer, kind=kind)
+        if not os.path.isfile(path):
+            return None
+
+        try:
+            entry = np.load(path, allow_pickle=False)
+            if str(entry['project_path']) != self.project_path:
+                return None
+            if fingerprint is None:
+                fingerprint = libclarisse.get_scatterer_fingerprint(scatterer)
+            if str(entry['fingerprint']) != fingerprint:
+                return None
+        except (OSError, KeyError, ValueError) as e:
+            logging.warning('Could not read scan cache {}: {}'.format(path, e))
+            return None
+
+        return entry
+
+    def _write_entry(self, path, **arrays):
+        """Writes a cache entry, stamped with the project. The file is replaced at once, so readers never see half of it"""
+        if not self.enabled:
+            return
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = path + '.tmp.npz'
+        np.savez(temp_path, project_path=np.array(self.project_path), project_mtime=np.array(self.project_mtime), **arrays)
+        os.replace(temp_path, path)
+
+# ______________________________________________________________________________________________________________________
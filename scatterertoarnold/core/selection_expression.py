@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+"""
+    Name:           selection_expression.py
+    Description:    Parser for boolean expressions combining named selection sets, evaluated as NumPy masks
+
+    Syntax:
+        Set names are combined with the same operators and precedence as python sets:
+            ~a      Complement (every point not in a)
+            a - b   Difference
+            a & b   Intersection
+            a ^ b   Symmetric difference
+            a | b   Union
+        Parentheses can be used to group operations. ie: ``(forest_A | forest_B) - road_clearing``
+
+"""
+# System Imports
+import os
+import sys
+import logging
+import re
+
+# Third-Party Imports
+import numpy as np
+
+# Local Imports
+from scatterertoarnold.core import box_parser
+
+# ______________________________________________________________________________________________________________________
+
+TOKEN_PATTERN = re.compile(r'\s*(?:([A-Za-z_][\w.]*)|(.))')
+
+# Binary operators, from the lowest to the highest precedence
+BINARY_OPERATORS = ['|', '^', '&', '-']
+
+def parse(expression) -> tuple:
+    """Parses an expression into a tree of tuples.
+
+    Each node of the tree is either ``('set', name)``, ``('~', node)`` or ``(operator, node, node)``
+
+    Args:
+        expression (str): Expression to parse
+
+    Returns:
+        tuple: Expression tree
+
+    Raises:
+        ValueError: The expression is not valid
+
+    """
+    tokens = []
+    for name, symbol in TOKEN_PATTERN.findall(expression.strip()):
+        if name:
+            tokens.append(('set', name))
+        elif symbol in BINARY_OPERATORS + ['~', '(', ')']:
+            tokens.append((symbol, None))
+        elif symbol.strip():
+            raise ValueError('Invalid character in selection expression: "{}"'.format(symbol))
+
+    if not tokens:
+        raise ValueError('Empty selection expression')
+
+    tree, position = _parse_binary(tokens, 0, level=0)
+    if position != len(tokens):
+        raise ValueError('Unexpected "{}" in selection expression'.format(tokens[position][1] or tokens[position][0]))
+
+    return tree
+
+def _parse_binary(tokens, position, level):
+    """Parses a binary operation of the given precedence level
+
+    Returns:
+        tuple, int: Node, and position of the next token
+
+    """
+    if level == len(BINARY_OPERATORS):
+        return _parse_unary(tokens, position)
+
+    operator = BINARY_OPERATORS[level]
+    node, position = _parse_binary(tokens, position, level + 1)
+    while position < len(tokens) and tokens[position][0] == operator:
+        right, position = _parse_binary(tokens, position + 1, level + 1)
+        node = (operator, node, right)
+
+    return node, position
+
+def _parse_unary(tokens, position):
+    """Parses a complement, a set name, or a parenthesized expression
+
+    Returns:
+        tuple, int: Node, and position of the next token
+
+    """
+    if position >= len(tokens):
+        raise ValueError('Unexpected end of selection expression')
+
+    kind, value = tokens[position]
+    if kind == '~':
+        node, position = _parse_unary(tokens, position + 1)
+        return ('~', node), position
+
+    if kind == 'set':
+        return ('set', value), position + 1
+
+    if kind == '(':
+        node, position = _parse_binary(tokens, position + 1, level=0)
+        if position >= len(tokens) or tokens[position][0] != ')':
+            raise ValueError('Missing closing parenthesis in selection expression')
+        return node, position + 1
+
+    raise ValueError('Unexpected "{}" in selection expression'.format(kind))
+
+def get_set_names(tree) -> set:
+    """Returns the set names used by an expression tree
+
+    Args:
+        tree (tuple): Expression tree
+
+    Returns:
+        set: Set names
+
+    """
+    if tree[0] == 'set':
+        return {tree[1]}
+
+    names = set()
+    for node in tree[1:]:
+        names |= get_set_names(node)
+
+    return names
+
+def evaluate(tree, points, set_definitions, mask_cache=None) -> np.ndarray:
+    """Evaluates an expression tree over a batch of points.
+    Each box's mask is computed at most once, even if the box is used by multiple sets.
+
+    Args:
+        tree (tuple): Expression tree
+        points (np.ndarray): (N, 3) Points to test
+        set_definitions (dict): key: set name, value: list of box_definition dicts
+        mask_cache (dict): Masks already computed for these points, keyed by box definition id
+
+    Returns:
+        np.ndarray: (N,) Boolean mask of the selected points
+
+    """
+    if mask_cache is None:
+        mask_cache = {}
+
+    kind = tree[0]
+    if kind == 'set':
+        mask = np.zeros(len(points), dtype=bool)
+        for box in set_definitions[tree[1]]:
+            if id(box) not in mask_cache:
+                mask_cache[id(box)] = box_parser.get_points_in_box_mask(points, box)
+            mask |= mask_cache[id(box)]
+        return mask
+
+    if kind == '~':
+        return ~evaluate(tree[1], points, set_definitions, mask_cache)
+
+    left = evaluate(tree[1], points, set_definitions, mask_cache)
+    right = evaluate(tree[2], points, set_definitions, mask_cache)
+    if kind == '|':
+        return left | right
+    elif kind == '&':
+        return left & right
+    elif kind == '^':
+        return left ^ right
+    elif kind == '-':
+        return left & ~right
+
+# ______________________________________________________________________________________________________________________
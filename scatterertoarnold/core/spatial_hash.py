@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+"""
+    Name:           spatial_hash.py
+    Description:    Uniform grid hash over a point set, for batched neighbor queries
+
+"""
+# System Imports
+import os
+import sys
+import logging
+import itertools
+
+# Third-Party Imports
+import numpy as np
+
+# Local Imports
+
+# ______________________________________________________________________________________________________________________
+
+# Number of query points processed at once, to bound the memory used by candidate pairs
+QUERY_CHUNK_SIZE = 65536
+
+# Primes used to hash the cell coordinates. Colliding cells only add candidates, which get filtered by distance
+HASH_PRIMES = np.array([73856093, 19349663, 83492791], dtype=np.int64)
+
+class SpatialHash():
+    """Class to query the neighbors of points within a reference point set.
+
+    Reference points are bucketed in cubic cells, sorted by cell key. Queries look up the cells surrounding each query
+    point with ``np.searchsorted``, so no python loop runs per point.
+    """
+
+    def __init__(self, points, cell_size):
+        """Constructor.
+
+        Args:
+            points (np.ndarray): (M, 3) Reference points
+            cell_size (float): Size of the cells. Ideally close to the query radius
+
+        """
+        super(SpatialHash, self).__init__()
+        self.points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        self.cell_size = float(cell_size)
+        if self.cell_size <= 0:
+            raise ValueError('Invalid cell size: {}'.format(cell_size))
+
+        keys = self._get_keys(self._get_cells(self.points))
+        self._order = np.argsort(keys, kind='stable')
+        self._keys, self._starts, self._counts = np.unique(keys[self._order], return_index=True, return_counts=True)
+
+    def __len__(self):
+        """Returns the number of reference points"""
+        return len(self.points)
+
+    def _get_cells(self, points) -> np.ndarray:
+        """Returns the (N, 3) integer cell coordinates of the points"""
+        return np.floor(points / self.cell_size).astype(np.int64)
+
+    def _get_keys(self, cells) -> np.ndarray:
+        """Returns the (N,) hash keys of the cells"""
+        return np.bitwise_xor.reduce(cells * HASH_PRIMES, axis=1)
+
+    def query_pairs(self, points, radius):
+        """Yields every (query point, reference point) pair closer than the radius, one chunk of query points at a time.
+
+        Args:
+            points (np.ndarray): (N, 3) Query points
+            radius (float): Maximum distance
+
+        Yields:
+            np.ndarray, np.ndarray, np.ndarray: Query indices, reference indices and distances of the pairs
+
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        if len(self.points) == 0:
+            return
+
+        rings = int(np.ceil(radius / self.cell_size))
+        offsets = np.array(list(itertools.product(range(-rings, rings + 1), repeat=3)), dtype=np.int64)
+
+        for chunk_start in range(0, len(points), QUERY_CHUNK_SIZE):
+            chunk = points[chunk_start:chunk_start + QUERY_CHUNK_SIZE]
+            cells = self._get_cells(chunk)
+            for offset in offsets:
+                keys = self._get_keys(cells + offset)
+                positions = np.searchsorted(self._keys, keys)
+                positions = np.minimum(positions, len(self._keys) - 1)
+                found = np.flatnonzero(self._keys[positions] == keys)
+                if not len(found):
+                    continue
+
+                # Expand each query point to every reference point of its neighbor cell
+                counts = self._counts[positions[found]]
+                starts = self._starts[positions[found]]
+                query_indices = np.repeat(found, counts)
+                first_pair = np.repeat(np.cumsum(counts) - counts, counts)
+                sorted_indices = np.repeat(starts, counts) + np.arange(counts.sum()) - first_pair
+                ref_indices = self._order[sorted_indices]
+
+                distances = np.linalg.norm(chunk[query_indices] - self.points[ref_indices], axis=1)
+                close = distances <= radius
+                yield query_indices[close] + chunk_start, ref_indices[close], distances[close]
+
+    def any_within(self, points, radius) -> np.ndarray:
+        """Checks which query points have at least one reference point closer than the radius
+
+        Args:
+            points (np.ndarray): (N, 3) Query points
+            radius (float): Maximum distance
+
+        Returns:
+            np.ndarray: (N,) Boolean mask
+
+        """
+        mask = np.zeros(len(points), dtype=bool)
+        for query_indices, ref_indices, distances in self.query_pairs(points, radius):
+            mask[query_indices] = True
+
+        return mask
+
+# ______________________________________________________________________________________________________________________
@@ -8,11 +8,94 @@
 import os
 import sys
 import logging
+import hashlib
+import threading
 
 # Third-Party Imports
 import ix
+import numpy as np
 
 # Local Imports
+from scatterertoarnold.configs import config
+
+# ______________________________________________________________________________________________________________________
+# CACHE
+
+class SceneCache():
+    """Class memoizing scene queries.
+
+    Each entry is stored with a stamp, a cheap value that changes when the queried data changes (ie: an instance count,
+    the current frame). The query runs again once the stamp differs, or once the entry is invalidated.
+    Keys are tuples starting with the kind of query, so a whole kind can be invalidated at once.
+    Entries are read and written under a lock, as the exports run in their own threads. Queries run outside of it.
+    """
+
+    def __init__(self):
+        """Constructor."""
+        super(SceneCache, self).__init__()
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        """Returns the number of entries"""
+        return len(self._entries)
+
+    def get(self, key, query, stamp=None):
+        """Returns the cached value of a query, running it if its entry is missing or stale
+
+        Args:
+            key (tuple): Entry key, ie: ('attribute', item full name, attribute name)
+            query (callable): Returns the value when called without arguments
+            stamp: Value compared to the stamp of the cached entry
+
+        Returns:
+            Value of the query
+
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None and entry[0] == stamp:
+            return entry[1]
+
+        value = query()
+        self.set(key, value, stamp=stamp)
+        return value
+
+    def set(self, key, value, stamp=None):
+        """Stores a value, ie: one read from an on-disk cache
+
+        Args:
+            key (tuple): Entry key
+            value: Value to store
+            stamp: Stamp of the value
+
+        """
+        with self._lock:
+            self._entries[key] = (stamp, value)
+
+    def invalidate(self, *key_prefix):
+        """Forgets the entries whose key starts with the given values. Forgets every entry if no value is given
+
+        Args:
+            *key_prefix: First values of the keys to forget, ie: 'attribute', item full name
+
+        """
+        with self._lock:
+            for key in list(self._entries.keys()):
+                if key[:len(key_prefix)] == key_prefix:
+                    self._entries.pop(key, None)
+
+SCENE_CACHE = SceneCache()
+
+def invalidate_scene_cache(*key_prefix):
+    """Forgets cached scene queries. Scripts editing the scene outside of this tool should call it before an export.
+    
+    Args:
+        *key_prefix: First values of the keys to forget ('scatterers', 'inventory', 'attribute', 'matrix', 'bbox').
+            Forgets every entry if no value is given
+            
+    """
+    SCENE_CACHE.invalidate(*key_prefix)
 
 # ______________________________________________________________________________________________________________________
 # ATTRIBUTES
@@ -34,18 +117,23 @@ def get_attribute_object(item, attr_name):
 
     return attr
 
-def get_str_attribute(item, attr_name):
+def get_str_attribute(item, attr_name, use_cache=False):
     """Returns the string value of an attribute. 
     Returns none if attribute not found
     
     Args:
         item: Item to read
         attr_name (str): Attribute to read
+        use_cache (bool): If set, the value is read from the SCENE_CACHE. Only use it for attributes set by this tool
         
     Returns:
         None|Attribute Value
         
     """
+    if use_cache:
+        key = ('attribute', item.get_full_name(), attr_name)
+        return SCENE_CACHE.get(key, query=lambda: get_str_attribute(item, attr_name))
+
     value = None
     if item.attribute_exists(attr_name):
         attr = item.get_attribute(attr_name)
@@ -53,6 +141,31 @@ def get_str_attribute(item, attr_name):
 
     return value
 
+def get_double_attribute(item, attr_name, default=None, use_cache=False):
+    """Returns the float value of an attribute. 
+    Returns the default if attribute not found
+    
+    Args:
+        item: Item to read
+        attr_name (str): Attribute to read
+        default (float): Value returned if the attribute is not found
+        use_cache (bool): If set, the value is read from the SCENE_CACHE. Only use it for attributes set by this tool
+        
+    Returns:
+        float: Attribute Value
+        
+    """
+    if use_cache:
+        key = ('attribute', item.get_full_name(), attr_name)
+        return SCENE_CACHE.get(key, query=lambda: get_double_attribute(item, attr_name, default=default), stamp=default)
+
+    value = default
+    if item.attribute_exists(attr_name):
+        attr = item.get_attribute(attr_name)
+        value = attr.get_double()
+
+    return value
+
 def set_str_attribute(attr, value):
     """Sets a string attribute
     
@@ -62,6 +175,7 @@ def set_str_attribute(attr, value):
         
     """
     attr.set_string(value)
+    invalidate_scene_cache('attribute')
 
 def create_custom_attribute(item, attr_type, attr_name):
     """Creates a custom attribute to the given object
@@ -75,6 +189,7 @@ def create_custom_attribute(item, attr_type, attr_name):
         attribute
     """
     attr = item.add_attribute(attr_name, attr_type)
+    invalidate_scene_cache('attribute', item.get_full_name())
     return attr
 
 def get_scatterer_geometry_attrs(self, scatterer):
@@ -94,11 +209,146 @@ def get_scatterer_geometry_attrs(self, scatterer):
 
     return attrs
 
+# ______________________________________________________________________________________________________________________
+# SCATTERERS
+
+def get_scatterers(source_context=''):
+    """Returns the scatterers of the scene, cached per source context.
+    The cache is stamped with the project and the scatterer count, so it is read again once scatterers are added or removed
+    
+    Args:
+        source_context (str): If set, only scatterers under this context are returned
+        
+    Returns:
+        list: SceneObjectScatterers
+        
+    """
+    scat_array = ix.api.OfObjectArray()
+    ix.application.get_factory().get_all_objects('SceneObjectScatterer', scat_array)
+
+    def _get_scatterers():
+        scatterers = [scat_array[i] for i in range(scat_array.get_count())]
+        return [scatterer for scatterer in scatterers if scatterer.get_full_name().startswith(source_context)]
+
+    stamp = (ix.application.get_current_project_filename(), scat_array.get_count())
+    return SCENE_CACHE.get(('scatterers', source_context), query=_get_scatterers, stamp=stamp)
+
+def get_base_object_geometries(scatterer):
+    """Returns the geometry of each base object of a scatterer
+    
+    Args:
+        scatterer (SceneObjectScatterer): Scatterer to read
+        
+    Returns:
+        list: Geometry objects, indexed by base object id
+        
+    """
+    base_objects = scatterer.get_module().get_base_objects()
+    return [ix.get_item(base_objects.get_item(i).get_object_name()) for i in range(base_objects.get_count())]
+
+def get_instance_base_indices(scatterer):
+    """Returns the base object id of each instance of a scatterer
+    
+    Args:
+        scatterer (SceneObjectScatterer): Scatterer to read
+        
+    Returns:
+        np.ndarray: (N,) Base object ids
+        
+    """
+    module = scatterer.get_module()
+    instance_count = module.get_instance_count()
+    instances_id = module.get_instances()
+    return np.fromiter((instances_id.get_item(i) for i in range(instance_count)), dtype=np.int64, count=instance_count)
+
+def get_scatterer_inventory(scatterer):
+    """Returns the geometries of a scatterer, and their instance count.
+    Results are cached per scatterer, and read again once its instance count or base objects change. Other edits of the 
+    instances are only read again once the 'inventory' entries are invalidated, ie: on reload and at each export.
+    
+    Args:
+        scatterer (SceneObjectScatterer): Scatterer to read
+        
+    Returns:
+        list, np.ndarray: List of geometries, and (G,) instance count of each geometry
+        
+    """
+    module = scatterer.get_module()
+    def _get_inventory():
+        # Count the instances of each base object, then merge the base objects sharing a geometry
+        base_geometries = get_base_object_geometries(scatterer)
+        base_counts = np.bincount(get_instance_base_indices(scatterer), minlength=len(base_geometries))
+        geometries = []
+        counts = []
+        for geometry, count in zip(base_geometries, base_counts):
+            if not count:
+                continue
+            if geometry in geometries:
+                counts[geometries.index(geometry)] += int(count)
+            else:
+                geometries.append(geometry)
+                counts.append(int(count))
+
+        return geometries, np.array(counts, dtype=np.int64)
+
+    return SCENE_CACHE.get(('inventory', scatterer.get_full_name()), query=_get_inventory, stamp=get_inventory_stamp(scatterer))
+
+def get_inventory_stamp(scatterer):
+    """Returns the stamp of a scatterer's cached inventory: its instance count and the object name of each base object.
+    It is cheap, so instances moved between base objects with the same count are not detected
+    
+    Args:
+        scatterer (SceneObjectScatterer): Scatterer to read
+        
+    Returns:
+        tuple: Stamp
+        
+    """
+    module = scatterer.get_module()
+    base_objects = module.get_base_objects()
+    base_names = tuple(base_objects.get_item(i).get_object_name() for i in range(base_objects.get_count()))
+    return (module.get_instance_count(), base_names)
+
+def get_scatterer_fingerprint(scatterer, full=False):
+    """Returns a fingerprint of a scatterer's instances. 
+    By default it is cheap: it hashes the instance count, the base objects, and a fixed sample of instance matrices and 
+    base object ids, so it changes with most edits of the scatterer without reading every instance.
+    
+    Args:
+        scatterer (SceneObjectScatterer): Scatterer to read
+        full (bool): If set, every instance matrix and base object id is hashed, so it changes with any edit
+        
+    Returns:
+        str: md5 hex digest
+        
+    """
+    module = scatterer.get_module()
+    instance_count = module.get_instance_count()
+    base_objects = module.get_base_objects()
+    instances_id = module.get_instances()
+
+    fingerprint = hashlib.md5(scatterer.get_full_name().encode('utf-8'))
+    fingerprint.update(str(instance_count).encode('utf-8'))
+    for i in range(base_objects.get_count()):
+        fingerprint.update(base_objects.get_item(i).get_object_name().encode('utf-8'))
+
+    if full:
+        indices = range(instance_count)
+    else:
+        samples = min(instance_count, config.FINGERPRINT_MATRIX_SAMPLES)
+        indices = np.unique(np.linspace(0, instance_count - 1, samples).astype(np.int64))
+    for i in indices:
+        fingerprint.update(str(instances_id.get_item(int(i))).encode('utf-8'))
+        fingerprint.update(str(module.get_instance_matrix(int(i))).encode('utf-8'))
+
+    return fingerprint.hexdigest()
+
 # ______________________________________________________________________________________________________________________
 # GEOMETRY
 
 def get_geometries_from_scatterers(scatterers, return_count=False):
-    """Returns a list of geometry objects from the given scatterers
+    """Returns a list of geometry objects from the given scatterers.
+    Each scatterer's inventory is memoized, so only the scatterers not read yet are parsed.
     
     Args:
         scatterers (list): List of SceneObjectScatterers
@@ -109,20 +359,10 @@ def get_geometries_from_scatterers(scatterers, return_count=False):
 
     """
     geometries = {}
-    for _scatterer in scatterers:
-        scatterer = _scatterer.get_module()
-        instances_id = scatterer.get_instances()
-        for i in range(scatterer.get_instance_count()):
-            # Loop each scatter
-            instance_id = instances_id.get_item(i)
-            instance = scatterer.get_base_objects().get_item(instance_id)
-            geometry = ix.get_item(instance.get_object_name())
-            
-            # Add the geo to the cache, keep count
-            if geometry in geometries:
-                geometries[geometry] = geometries[geometry] + 1
-            else:
-                geometries[geometry] = 1
+    for scatterer in scatterers:
+        # Add the scatterer's cached counts
+        for geometry, count in zip(*get_scatterer_inventory(scatterer)):
+            geometries[geometry] = geometries.get(geometry, 0) + int(count)
 
     geometry_list = list(geometries.keys())
     instance_count = list(geometries.values())
@@ -131,6 +371,68 @@ def get_geometries_from_scatterers(scatterers, return_count=False):
         return geometry_list, instance_count
     else:
         return geometry_list
+
+def get_geometry_lods(geometry):
+    """Returns the level of details set on a geometry, sorted by distance.
+    Each LOD is set with two custom attributes, config.ATTR_ASS_FILE_LOD and config.ATTR_LOD_DISTANCE
+    
+    Args:
+        geometry: Geometry object
+        
+    Returns:
+        list: (distance, .ass file path) tuples
+        
+    """
+    lods = []
+    for level in range(1, config.MAX_LOD_LEVELS + 1):
+        ass_file = get_str_attribute(item=geometry, attr_name=config.ATTR_ASS_FILE_LOD.format(level), use_cache=True)
+        distance = get_double_attribute(item=geometry, attr_name=config.ATTR_LOD_DISTANCE.format(level), use_cache=True)
+        if ass_file and distance is not None:
+            lods.append((distance, ass_file))
+
+    return sorted(lods)
+
+def get_geometry_points(geometry):
+    """Returns the world space vertices of a geometry (polymesh, curve, point cloud...)
+    
+    Args:
+        geometry: Geometry object
+        
+    Returns:
+        np.ndarray: (N, 3) Vertices
+        
+    """
+    module = geometry.get_module()
+    geo = module.get_geometry()
+    vertex_count = geo.get_vertex_count()
+    vertices = np.empty((vertex_count, 4), dtype=np.float64)
+    vertices[:, 3] = 1
+    for i in range(vertex_count):
+        vertex = geo.get_vertex(i)
+        vertices[i, :3] = vertex[0], vertex[1], vertex[2]
+
+    # Bring the vertices to world space. The clarisse matrix transforms column vectors
+    matrix = get_global_matrix_array(geometry)
+    return (vertices @ matrix.T)[:, :3]
+
+def get_geometry_bounding_radius(geometry):
+    """Returns the radius of the sphere enclosing a geometry's local bounding box, cached for the current frame.
+    Exports forget the cached radii when they start, so a geometry edited since the last export is read again
+    
+    Args:
+        geometry: Geometry object
+        
+    Returns:
+        float: Bounding radius
+        
+    """
+    def _get_bounding_radius():
+        bbox = geometry.get_module().get_bbox()
+        bb_min = np.array([bbox[0][0], bbox[0][1], bbox[0][2]])
+        bb_max = np.array([bbox[1][0], bbox[1][1], bbox[1][2]])
+        return float(np.linalg.norm(bb_max - bb_min) / 2)
+
+    return SCENE_CACHE.get(('bbox', geometry.get_full_name()), query=_get_bounding_radius, stamp=get_current_frame())
     
 def get_selection_box_definition(selection_box):
     """Gets a selection box's definition vectors and points
@@ -143,6 +445,35 @@ def get_selection_box_definition(selection_box):
         
     """
     
+# ______________________________________________________________________________________________________________________
+# MATH
+
+def get_matrix_array(matrix):
+    """Returns the values of a clarisse matrix as a NumPy array, in the same row order as its string representation
+
+    Args:
+        matrix (GMathMatrix4x4d|str): Matrix, or its string representation
+
+    Returns:
+        np.ndarray: (4, 4) matrix
+
+    """
+    return np.array(str(matrix).split(), dtype=np.float64).reshape(4, 4)
+
+def get_global_matrix_array(item):
+    """Returns the global matrix of an item as a NumPy array, cached for the current frame.
+    Exports forget the cached matrices when they start, so an item moved since the last export is read again
+
+    Args:
+        item: Scene object
+
+    Returns:
+        np.ndarray: (4, 4) matrix
+
+    """
+    query = lambda: get_matrix_array(item.get_module().get_global_matrix())
+    return SCENE_CACHE.get(('matrix', item.get_full_name()), query=query, stamp=get_current_frame())
+
 # ______________________________________________________________________________________________________________________
 # MISC
 
@@ -159,6 +490,19 @@ def get_default_dir_path():
     default_dir_path = os.path.normpath(default_dir_path)
     return default_dir_path
 
+def get_current_frame():
+    """Returns the current frame of the scene"""
+    return ix.application.get_factory().get_time().get_current_frame()
+
+def set_current_frame(frame):
+    """Sets the current frame of the scene
+    
+    Args:
+        frame (float): Frame to set
+        
+    """
+    ix.application.get_factory().get_time().set_current_frame(frame)
+
 def get_selected_objects():
     """Returns the selected objects"""
     return ix.selection
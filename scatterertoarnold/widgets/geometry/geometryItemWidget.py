@@ -92,7 +92,7 @@ class GeometryItemWidget(QWidget):
 
     def set_default_ass_file(self):
         """Sets the default ass file path based on the geo's attribute"""
-        attr_value = libclarisse.get_str_attribute(item=self.geometry, attr_name=config.ATTR_ASS_FILE)
+        attr_value = libclarisse.get_str_attribute(item=self.geometry, attr_name=config.ATTR_ASS_FILE, use_cache=True)
         if attr_value is not None:
             self.le_ass_file_path.setText(attr_value)
     
@@ -116,7 +116,7 @@ class GeometryItemWidget(QWidget):
 
     def save_ass_file_path(self):
         """Saves the ass file path to the geometry's custom attributes"""
-        attr_exists = bool(libclarisse.get_str_attribute(item=self.geometry, attr_name=config.ATTR_ASS_FILE))
+        attr_exists = bool(libclarisse.get_str_attribute(item=self.geometry, attr_name=config.ATTR_ASS_FILE, use_cache=True))
         filepath = self.le_ass_file_path.text()
         if filepath:
             if not attr_exists:
@@ -59,7 +59,7 @@ class GeometryWidget(QWidget):
         self.cb_show_full_name.addItems(['Show Name', 'Show Path'])
         self.cb_show_full_name.currentIndexChanged.connect(self._on_cb_show_full_name_changed)
         self.btn_reload = QPushButton(parent=self, text='Reload Geometries')
-        self.btn_reload.clicked.connect(self.load_geometries)
+        self.btn_reload.clicked.connect(self._on_btn_reload_clicked)
 
         self.header_layout.addWidget(self.btn_select_all)
         self.header_layout.addWidget(self.btn_unselect_all)
@@ -95,6 +95,14 @@ class GeometryWidget(QWidget):
         for widget in self.geometry_widgets:
             widget.set_checked(False)
 
+    def _on_btn_reload_clicked(self):
+        """Reads the scatterers' geometries, and their attributes and transforms from the scene again, then reloads them"""
+        libclarisse.invalidate_scene_cache('inventory')
+        libclarisse.invalidate_scene_cache('attribute')
+        libclarisse.invalidate_scene_cache('matrix')
+        libclarisse.invalidate_scene_cache('bbox')
+        self.load_geometries()
+
     def _on_cb_show_full_name_changed(self, index):
         """Sets Sets the show_full_name based on the selection"""
         self.show_full_name = bool(index)
@@ -102,6 +102,13 @@ class ScattererToAssExportWindow(QMainWindow):
         self.body_layout.addItem(base.Spacer(h_expand=True), 3, 2)
         self.body_layout.addLayout(self.error_layout, 4, 0, 1, 3)
 
+        self.body_layout.addItem(base.Spacer(h=20), 5, 0)
+
+        # Summary row
+        self.summary_lbl = QLabel(parent=self, text='')
+        self.summary_lbl.setWordWrap(True)
+        self.body_layout.addWidget(self.summary_lbl, 6, 0, 1, 3)
+
         # Input Row
         self.input_layout = QHBoxLayout()
         self.input_label = QLabel(parent=self, text='')
@@ -139,6 +146,7 @@ class ScattererToAssExportWindow(QMainWindow):
         self.exporter.pre_validation_started.connect(lambda: self.progress_bar.setFormat('Running Pre Validation'))
         self.exporter.pre_validation_finished.connect(self._on_pre_validation_finished)
         self.exporter.export_progress.connect(self._set_progress)
+        self.exporter.export_summary.connect(self._on_export_summary)
         self.exporter.export_finished.connect(self._on_export_finished)
 
         # Start export
@@ -232,6 +240,15 @@ class ScattererToAssExportWindow(QMainWindow):
             self.input_label.setText('--> Continue despite warnings?')
             self.btn_continue.setVisible(True)
 
+    def _on_export_summary(self, summary):
+        """Triggered when the export summary is available
+        
+        Args:
+            summary (list): List of summary strings
+            
+        """
+        self.summary_lbl.setText('\n'.join('-> ' + line for line in summary))
+
     def _on_export_finished(self, result):
         """Triggered when export is finished
         
@@ -8,6 +8,7 @@
 import os
 import sys
 import logging
+import threading
 
 # Third-Party Imports
 import PySide2
@@ -22,12 +23,17 @@ from scatterertoarnold.widgets.scatterers import scattererWidget
 from scatterertoarnold.widgets.geometry import geometryWidget
 from scatterertoarnold.widgets.selection import selectionBoxWidget
 from scatterertoarnold.widgets.arnoldsettings import arnoldSettingsWidget
+from scatterertoarnold.core import scan_cache
+from scatterertoarnold.lib import libclarisse
 
 # ______________________________________________________________________________________________________________________
 
 class PanelWidget(QWidget):
     """QStackedWidget with panel functionality"""
 
+    # Signals
+    stale_inventories_rebuilt = Signal(list)
+
     def __init__(self, parent):
         super(PanelWidget, self).__init__(parent)
         self.parent = parent
@@ -51,9 +57,20 @@ class PanelWidget(QWidget):
         self.tab_widget = QTabWidget(self)
         self.tabs_layout.addWidget(self.tab_widget)
 
+        # Read the inventories saved by the last launch, instead of the scene
+        self.scan_cache = scan_cache.ScanCache()
+        self.scan_cache.load_inventories(libclarisse.get_scatterers())
+
         # Init Panels
         self.scatterer_widget = scattererWidget.ScattererWidget(self)
         self.geometry_widget = geometryWidget.GeometryWidget(self, scatterers=self.scatterer_widget.get_selected_scatterers())
+
+        # Save the inventories for the next launch, and check the ones from an older save of the project
+        self.scan_cache.save_inventories(self.scatterer_widget.get_selected_scatterers())
+        if self.scan_cache.stale_scatterers:
+            # Rebuilt in a worker thread, like the export, as it reads every instance
+            self._rebuild_thread = threading.Thread(target=self._rebuild_stale_inventories)
+            self._rebuild_thread.start()
         self.selection_widget = selectionBoxWidget.SelectionBoxWidget(self)
         self.arnold_settings_widget = arnoldSettingsWidget.ArnoldSettingsWidget(self)
         self.tab_widget.addTab(self.scatterer_widget, 'Scatterers')
@@ -63,12 +80,28 @@ class PanelWidget(QWidget):
 
         # Connections
         self.scatterer_widget.scatterers_changed.connect(self.geometry_widget.load_geometries)
+        self.stale_inventories_rebuilt.connect(self._on_stale_inventories_rebuilt)
 
     def _exitHandler(self):
         """Exit Gracefully"""
         self.scatterer_widget._exitHandler()
         self.geometry_widget._exitHandler()
 
+    def _rebuild_stale_inventories(self):
+        """Rebuilds the stale inventories of the scan cache. Runs in a worker thread, the GUI thread gets the 
+        rebuilt scatterers from the stale_inventories_rebuilt signal"""
+        self.stale_inventories_rebuilt.emit(self.scan_cache.rebuild_stale())
+
+    def _on_stale_inventories_rebuilt(self, scatterers):
+        """Reloads the geometries listed from the stale inventories
+        
+        Args:
+            scatterers (list): Rebuilt scatterers
+            
+        """
+        if scatterers:
+            self.geometry_widget.load_geometries()
+
     def _on_about_to_export(self):
         """Triggered when the use is about to export"""
         self.geometry_widget._on_about_to_export()
@@ -124,5 +157,11 @@ class PanelWidget(QWidget):
         """
         selection_boxes = self.selection_widget.get_selection_boxes()
         exporter.selection_boxes = selection_boxes
+        exporter.selection_expression = self.selection_widget.get_selection_expression()
+        exporter.selection_cameras = self.selection_widget.get_selection_cameras()
+        exporter.selection_mask_path = self.selection_widget.get_selection_mask_path()
+        exporter.selection_mask_extent = self.selection_widget.get_selection_mask_extent()
+        exporter.selection_reference_objects = self.selection_widget.get_selection_reference_objects()
+        exporter.selection_distance, exporter.selection_distance_mode = self.selection_widget.get_selection_distance()
 
 # ______________________________________________________________________________________________________________________
@@ -152,11 +152,51 @@ class OptionsWidget(QWidget):
         self.cb_selection_type = QComboBox(self)
         self.cb_selection_type.addItems(sorted(list(config.SELECTION_TYPES.values())))
         self.cb_selection_type.setCurrentText(config.SELECTION_TYPES.get(config.DEFAULT_SELECTION_TYPE))
+        self.cb_culling = QComboBox(self)
+        self.cb_culling.addItems(list(config.CULLING_MODES.values()))
+        self.cb_culling.setCurrentText(config.CULLING_MODES.get(config.DEFAULT_CULLING))
+        self.sb_min_size = QDoubleSpinBox(self)
+        self.sb_min_size.setRange(0, 1e7)
+        self.sb_min_size.setDecimals(3)
+        self.sb_min_size.setValue(config.DEFAULT_MIN_INSTANCE_SIZE)
+        self.sb_min_size.setToolTip('Instances with a bounding radius under this size are culled. 0 to disable')
+        self.sb_thinning_fraction = QDoubleSpinBox(self)
+        self.sb_thinning_fraction.setRange(0, 1)
+        self.sb_thinning_fraction.setSingleStep(0.05)
+        self.sb_thinning_fraction.setValue(config.DEFAULT_THINNING_FRACTION)
+        self.sb_thinning_fraction.setToolTip('Fraction of instances to keep. The same instances are kept on every export')
+        self.sb_motion_samples = QSpinBox(self)
+        self.sb_motion_samples.setRange(1, 16)
+        self.sb_motion_samples.setValue(config.DEFAULT_MOTION_SAMPLES)
+        self.sb_motion_samples.setToolTip('Matrices written per moving instance, for motion blur. Static instances keep one. 1 to disable')
+        self.chk_write_preview = QCheckBox(parent=self, text='Write Preview')
+        self.chk_write_preview.setToolTip('Write the full export, and the thinned instances to "_{}" files'.format(config.PREVIEW_FILE_TOKEN))
+        self.chk_use_scan_cache = QCheckBox(parent=self, text='Use Scan Cache')
+        self.chk_use_scan_cache.setToolTip('Reuse the instances read by the last export if the project and scatterers did not change')
+        self.chk_incremental = QCheckBox(parent=self, text='Incremental')
+        self.chk_incremental.setToolTip('Only write the files whose scatterers, geometries or settings changed since the last export')
+        self.chk_skip_identical = QCheckBox(parent=self, text='Keep Identical Files')
+        self.chk_skip_identical.setToolTip('Leave the exported files untouched when their new content is identical')
+        self.chk_checkpoint = QCheckBox(parent=self, text='Resumable')
+        self.chk_checkpoint.setToolTip('Checkpoint the export, so an interrupted export is resumed by the next one with the same settings')
 
         layout.addWidget(QLabel(parent=self, text='Grouping'), 0, 0)
         layout.addWidget(self.cb_grouping, 0, 1)
         layout.addWidget(QLabel(parent=self, text='Selection'), 1, 0)
         layout.addWidget(self.cb_selection_type, 1, 1)
+        layout.addWidget(QLabel(parent=self, text='Culling'), 2, 0)
+        layout.addWidget(self.cb_culling, 2, 1)
+        layout.addWidget(QLabel(parent=self, text='Min Size'), 3, 0)
+        layout.addWidget(self.sb_min_size, 3, 1)
+        layout.addWidget(QLabel(parent=self, text='Thinning'), 4, 0)
+        layout.addWidget(self.sb_thinning_fraction, 4, 1)
+        layout.addWidget(self.chk_write_preview, 5, 1)
+        layout.addWidget(self.chk_use_scan_cache, 6, 1)
+        layout.addWidget(self.chk_incremental, 7, 1)
+        layout.addWidget(self.chk_skip_identical, 8, 1)
+        layout.addWidget(self.chk_checkpoint, 9, 1)
+        layout.addWidget(QLabel(parent=self, text='Motion Samples'), 10, 0)
+        layout.addWidget(self.sb_motion_samples, 10, 1)
         gb.setLayout(layout)
 
     # __________________________________________________________________________________________________________________
@@ -223,6 +263,20 @@ class OptionsWidget(QWidget):
         _reversed_dict = {v: k for k, v in config.GROUPINGS.items()}
         exp.grouping = _reversed_dict.get(self.cb_grouping.currentText())
 
+        # Set Culling
+        _reversed_dict = {v: k for k, v in config.CULLING_MODES.items()}
+        exp.culling = _reversed_dict.get(self.cb_culling.currentText())
+        exp.min_instance_size = self.sb_min_size.value()
+
+        # Set Thinning
+        exp.thinning_fraction = self.sb_thinning_fraction.value()
+        exp.write_preview = self.chk_write_preview.isChecked()
+        exp.use_scan_cache = self.chk_use_scan_cache.isChecked()
+        exp.incremental = self.chk_incremental.isChecked()
+        exp.skip_identical = self.chk_skip_identical.isChecked()
+        exp.checkpoint = self.chk_checkpoint.isChecked()
+        exp.motion_samples = self.sb_motion_samples.value()
+
         # Set Scatterers
         self.request_scatterers.emit(exp)
 
@@ -18,6 +18,7 @@ import ix
 # Local Imports
 from scatterertoarnold.widgets.main import base
 from scatterertoarnold.widgets.scatterers import scattererItemWidget
+from scatterertoarnold.lib import libclarisse
 
 # ______________________________________________________________________________________________________________________
 
@@ -56,7 +57,7 @@ class ScattererWidget(QWidget):
         self.cb_show_full_name.addItems(['Show Name', 'Show Path'])
         self.cb_show_full_name.currentIndexChanged.connect(self._on_cb_show_full_name_changed)
         self.btn_reload = QPushButton(parent=self, text='Reload Scatterers')
-        self.btn_reload.clicked.connect(self.update_scatterers)
+        self.btn_reload.clicked.connect(self._on_btn_reload_clicked)
 
         self.header_layout.addWidget(self.btn_select_all)
         self.header_layout.addWidget(self.btn_unselect_all)
@@ -94,6 +95,12 @@ class ScattererWidget(QWidget):
             widget.blockSignals(False)
         self.emit_scatters_changed()
 
+    def _on_btn_reload_clicked(self):
+        """Lists the scene's scatterers again and reads their geometries, then updates the scatterers"""
+        libclarisse.invalidate_scene_cache('scatterers')
+        libclarisse.invalidate_scene_cache('inventory')
+        self.update_scatterers()
+
     def _on_cb_show_full_name_changed(self, index):
         """Sets Sets the show_full_name based on the selection"""
         self.show_full_name = bool(index)
@@ -110,23 +117,12 @@ class ScattererWidget(QWidget):
         base.empty_item(self.scroll_layout)
         self.scroll_layout.takeAt(0) # Remove Spacer
 
-        # Get Scatterers
-        scatterers = []
-        source_context = self.parent.source_context
-        scat_array = ix.api.OfObjectArray()
-
-        ix.application.get_factory().get_all_objects('SceneObjectScatterer', scat_array)
-        
-        for scat_index in range(scat_array.get_count()):
-            scatterer = scat_array[scat_index]
-            scatterers.append(scatterer)
+        # Get Scatterers, from our context
+        source_context = self.parent.source_context or ''
+        scatterers = libclarisse.get_scatterers(source_context=source_context)
 
         # Create scatterer widgets
         for scatterer in scatterers:
-            # Validate if the scatterer is part of our context
-            if source_context:
-                if not scatterer.get_full_name().startswith(source_context):
-                    continue
             scatterer_widget = scattererItemWidget.ScattererItemWidget(self, scatterer=scatterer)
             scatterer_widget.state_changed.connect(self.emit_scatters_changed)
             self.scroll_layout.addWidget(scatterer_widget)
@@ -12,16 +12,20 @@ import logging
 # Local Imports
 from scatterertoarnold.widgets.main import base
 from scatterertoarnold.lib import libclarisse
+from scatterertoarnold.configs import config
 
 # Third-Party Imports
 import PySide2
 from PySide2.QtCore import *
 from PySide2.QtGui import *
 from PySide2.QtWidgets import *
+import qtawesome
 import ix
 
 # ______________________________________________________________________________________________________________________
 SUPPORTED_TYPES = ['GeometryPolybox', 'GeometryVolumeBox', 'GeometryBox']
+SUPPORTED_CAMERA_TYPES = ['CameraPerspective']
+SUPPORTED_REFERENCE_TYPES = ['SceneObjectScatterer', 'GeometryPolyfile', 'GeometryPolymesh', 'GeometryCurve', 'GeometryPointCloud']
 
 class SelectionBoxWidget(QWidget):
     """Geometry selection widget"""
@@ -44,7 +48,7 @@ class SelectionBoxWidget(QWidget):
         self.layout.setContentsMargins(5, 5, 5, 5)
         self.setLayout(self.layout)
 
-        self.layout.addWidget(QLabel(parent=self, text='Add Cube geos to "select" scatterer points'))
+        self.layout.addWidget(QLabel(parent=self, text='Add Cube geos to "select" scatterer points, Cameras for a frustum selection, or any geometry for a distance selection'))
 
         # Header Layout
         self.header_layout = QHBoxLayout(self)
@@ -65,6 +69,52 @@ class SelectionBoxWidget(QWidget):
         self.scroll_layout = base.ScrollLayout(self, self.layout)
         self.scroll_layout.addWidget(self.selection_list_widget)
 
+        # Expression Layout
+        self.expression_layout = QHBoxLayout(self)
+        self.layout.addLayout(self.expression_layout)
+
+        self.le_expression = QLineEdit(parent=self)
+        self.le_expression.setPlaceholderText('(box_A | box_B) - box_C')
+        self.le_expression.setToolTip('Used by the Expression Selection. Combine boxes by name with | & - ^ ~')
+
+        self.expression_layout.addWidget(QLabel(parent=self, text='Expression'))
+        self.expression_layout.addWidget(self.le_expression)
+
+        # Image Mask Layout
+        self.mask_layout = QHBoxLayout(self)
+        self.layout.addLayout(self.mask_layout)
+
+        self.le_mask_path = QLineEdit(parent=self, placeholderText='Choose mask file..')
+        self.le_mask_path.setToolTip('Used by the Image Mask Selection. Grayscale image or .npy file')
+        browse_file_icon = qtawesome.icon('fa5s.folder-open', color='#5d7396')
+        self.btn_browse_mask = QPushButton(icon=browse_file_icon, parent=self)
+        self.btn_browse_mask.setFixedSize(24, 24)
+        self.btn_browse_mask.setStyleSheet('background-color: transparent;')
+        self.btn_browse_mask.clicked.connect(self._on_btn_browse_mask_clicked)
+        self.le_mask_extent = QLineEdit(parent=self, placeholderText='min_x min_z max_x max_z')
+        self.le_mask_extent.setToolTip('World space area covered by the mask, on the XZ plane')
+
+        self.mask_layout.addWidget(QLabel(parent=self, text='Mask'))
+        self.mask_layout.addWidget(self.le_mask_path)
+        self.mask_layout.addWidget(self.btn_browse_mask)
+        self.mask_layout.addWidget(self.le_mask_extent)
+
+        # Distance Layout
+        self.distance_layout = QHBoxLayout(self)
+        self.layout.addLayout(self.distance_layout)
+
+        self.sb_distance = QDoubleSpinBox(parent=self)
+        self.sb_distance.setRange(0.001, 1e7)
+        self.sb_distance.setValue(config.DEFAULT_SELECTION_DISTANCE)
+        self.sb_distance.setToolTip('Used by the Distance Selection, around the added geometries')
+        self.cb_distance_mode = QComboBox(parent=self)
+        self.cb_distance_mode.addItems(list(config.DISTANCE_MODES.values()))
+        self.cb_distance_mode.setCurrentText(config.DISTANCE_MODES.get(config.DEFAULT_DISTANCE_MODE))
+
+        self.distance_layout.addWidget(QLabel(parent=self, text='Distance'))
+        self.distance_layout.addWidget(self.sb_distance)
+        self.distance_layout.addWidget(self.cb_distance_mode)
+
     # __________________________________________________________________________________________________________________
     # Handlers
 
@@ -74,7 +124,7 @@ class SelectionBoxWidget(QWidget):
         for item in selected_items:
             item_name = item.get_full_name()
             item_type = item.get_type()
-            if item_type in SUPPORTED_TYPES:
+            if item_type in SUPPORTED_TYPES + SUPPORTED_CAMERA_TYPES + SUPPORTED_REFERENCE_TYPES:
                 if not item in self._items:
                     itemN = QListWidgetItem()
                     itemN.setText(item_name)
@@ -85,6 +135,14 @@ class SelectionBoxWidget(QWidget):
         self.selection_list_widget.sortItems(order=Qt.AscendingOrder)
         self.get_selection_boxes()
 
+    def _on_btn_browse_mask_clicked(self):
+        """Opens a file browser to select the mask file"""
+        init_path = self.le_mask_path.text() or ix.application.get_current_project_filename()
+        filepath, ext = QFileDialog.getOpenFileName(self, 'Select mask file', init_path, 'Masks (*.png *.jpg *.tif *.tiff *.exr *.npy)')
+
+        if filepath:
+            self.le_mask_path.setText(filepath)
+
     def _on_btn_remove_clicked(self):
         """Remove the selected items in the listwidget"""
         for item in reversed(self.selection_list_widget.selectedItems()):
@@ -104,8 +162,83 @@ class SelectionBoxWidget(QWidget):
         for i in range(self.selection_list_widget.count()):
             itemN = self.selection_list_widget.item(i)
             data = itemN.data(Qt.UserRole)
-            geometries.append(data)
+            if data.get_type() in SUPPORTED_TYPES:
+                geometries.append(data)
 
         return geometries
 
+    def get_selection_mask_path(self):
+        """Returns the mask file chosen by the user
+        
+        Returns:
+            str: Mask file path
+            
+        """
+        return self.le_mask_path.text()
+
+    def get_selection_mask_extent(self):
+        """Returns the mask extent entered by the user
+        
+        Returns:
+            None|tuple: (min_u, min_v, max_u, max_v)
+            
+        """
+        try:
+            extent = tuple(float(value) for value in self.le_mask_extent.text().split())
+        except ValueError:
+            return None
+
+        return extent if len(extent) == 4 else None
+
+    def get_selection_reference_objects(self):
+        """Returns the reference objects selected by the user
+        
+        Returns:
+            list: Geometries and scatterers
+            
+        """
+        items = []
+        for i in range(self.selection_list_widget.count()):
+            itemN = self.selection_list_widget.item(i)
+            data = itemN.data(Qt.UserRole)
+            if data.get_type() in SUPPORTED_REFERENCE_TYPES:
+                items.append(data)
+
+        return items
+
+    def get_selection_distance(self):
+        """Returns the selection distance and its mode
+        
+        Returns:
+            float, str: Distance, and mode (see config.DISTANCE_MODES)
+            
+        """
+        _reversed_dict = {v: k for k, v in config.DISTANCE_MODES.items()}
+        return self.sb_distance.value(), _reversed_dict.get(self.cb_distance_mode.currentText())
+
+    def get_selection_cameras(self):
+        """Returns the cameras selected by the user
+        
+        Returns:
+            list: Cameras
+            
+        """
+        cameras = []
+        for i in range(self.selection_list_widget.count()):
+            itemN = self.selection_list_widget.item(i)
+            data = itemN.data(Qt.UserRole)
+            if data.get_type() in SUPPORTED_CAMERA_TYPES:
+                cameras.append(data)
+
+        return cameras
+
+    def get_selection_expression(self):
+        """Returns the selection expression entered by the user
+        
+        Returns:
+            str: Selection expression
+            
+        """
+        return self.le_expression.text()
+
 # ______________________________________________________________________________________________________________________